@@ -1,22 +1,51 @@
 import datetime
-from functools import reduce
+from functools import lru_cache, reduce
+import hashlib
+import json
 
 from dateutil.parser import parse
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+import pysolr
 from pysolaar import Q, PySolaar
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.exceptions import NotFound
 
+from apis_ipif_solr.graph import person_ids_q, related_person_ids
 from apis_ipif_solr.indexes import (
     FactoidIndex,
     PersonIndex,
     SourceIndex,
     StatementIndex,
 )
+from apis_ipif_solr.params import InvalidParam, int_param
+from apis_ipif_solr.query_log import request_key, track_request
+from apis_ipif_solr.rendered import RENDERED_DOCUMENTS, fetch_rendered, splice
+from apis_ipif_solr.solr_client import SolrUnavailable, as_queryset
+from apis_ipif_solr.uris import ids_q, person_q, resolved_ids, without_field_q
 
 
 DEFAULT_PAGE_SIZE = 30
 DEFAULT_PAGE_NUMBER = 1
+# Limits on the cost of a query (larger pages are cut down to MAX_PAGE_SIZE;
+# deeper pages or more child filters are refused)
+MAX_PAGE_SIZE = settings.APIS_IPIF_CONFIG.get("MAX_PAGE_SIZE", 100)
+MAX_OFFSET = settings.APIS_IPIF_CONFIG.get("MAX_OFFSET", 10000)
+MAX_CHILD_FILTERS = settings.APIS_IPIF_CONFIG.get("MAX_CHILD_FILTERS", 8)
+# Seconds for which counts (for size=0 and HEAD requests) are cached
+COUNT_CACHE_TTL = settings.APIS_IPIF_CONFIG.get("COUNT_CACHE_TTL", 60)
+# Components missing from the from and to params are taken from these
+FROM_DEFAULT = datetime.datetime(1000, 1, 1)
+TO_DEFAULT = datetime.datetime(2022, 12, 31)
+# Returned (with a 404) when a person, factoid, statement or source is not found
+NOT_FOUND_DESCRIPTIONS = {
+    "persons": "the person does not exist",
+    "factoids": "the factoid does not exist",
+    "statements": "the statement does not exist",
+    "sources": "the source does not exist",
+}
 STATEMENT_PARAM_KEYS = [
     "statementType",
     "statementText",
@@ -33,14 +62,65 @@ STATEMENT_PARAM_KEYS = [
 def apply_page_number_and_size_params(queryset, params):
     # Always going to paginate, as the default size is 30 and default page is 1;
     # otherwise, if params are set, use these
-    page_number = int(params.get("page", DEFAULT_PAGE_NUMBER))
+    page_number = int_param(params, "page", DEFAULT_PAGE_NUMBER)
+    page_size = min(int_param(params, "size", DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+    if page_number < 1 or page_size < 0:
+        raise InvalidParam("page must be at least 1, and size at least 0")
+    if (page_number - 1) * page_size > MAX_OFFSET:
+        raise InvalidParam(
+            f"cannot page beyond the first {MAX_OFFSET} results;"
+            " to fetch all results, use the export endpoint"
+        )
     queryset = queryset.paginate(
-        page_size=int(params.get("size", DEFAULT_PAGE_SIZE)),
+        page_size=page_size,
         page_number=page_number - 1,  # PySolaar is 0-indexed
     )
     return queryset
 
 
+def check_query_cost(queryset):
+    """Refuses queries with more than MAX_CHILD_FILTERS child filters, each of
+    which is a block join over all the child documents of the index.
+
+    (Params can't add wildcard terms, as values are escaped in the query)"""
+    child_filters = len(getattr(queryset, "child_qs", []))
+    if child_filters > MAX_CHILD_FILTERS:
+        raise InvalidParam(
+            f"too many filters on statements, factoids, sources or persons"
+            f" ({child_filters}, at most {MAX_CHILD_FILTERS} are allowed)"
+        )
+
+
+@lru_cache(maxsize=1024)
+def parse_date_param(value, default):
+    """The date of a from or to param, with components it lacks (e.g. the month
+    and day of "1800") taken from default. Memoized, as the same few dates are
+    requested over and over."""
+    try:
+        return parse(value, default=default)
+    except (ValueError, OverflowError):
+        raise InvalidParam(f"{value!r} is not a date")
+
+
+def date_overlap_q(date_from, date_to):
+    """Statements whose date range (date.start_dt to date.end_dt) overlaps
+    the from and to params, either of which may be None.
+
+    Statements indexed before the range was added (which have neither
+    start_dt nor end_dt, as the two are always set together) are compared
+    by their date.sortdate_dt instead, as they were then."""
+    range_q, sortdate_q = {}, {}
+    if date_from:
+        date_from = parse_date_param(date_from, FROM_DEFAULT)
+        range_q["date__end_dt__gte"] = date_from
+        sortdate_q["date__sortdate_dt__gte"] = date_from
+    if date_to:
+        date_to = parse_date_param(date_to, TO_DEFAULT)
+        range_q["date__start_dt__lte"] = date_to
+        sortdate_q["date__sortdate_dt__lte"] = date_to
+    return Q(**range_q) | without_field_q(Q(**sortdate_q), "date__end_dt")
+
+
 def build_statement_filter_q_list(params):
     """ Unpacks Statement-related parameters into a list of Q objects
     depending on parameter type"""
@@ -49,38 +129,42 @@ def build_statement_filter_q_list(params):
     for statement_param_key in STATEMENT_PARAM_KEYS:
         statement_param_value = params.get(statement_param_key)
         if statement_param_value:
-            if statement_param_key == "to":
+            if statement_param_key in ("from", "to"):
+                # (from and to are compiled together, into one filter)
+                if statement_param_key == "to" and params.get("from"):
+                    continue
                 statement_filter_q_list.append(
-                    Q(
-                        # date__sortdate_dt="[* TO *]",
-                        date__sortdate_dt__lte=parse(
-                            statement_param_value,
-                            default=datetime.datetime(2022, 12, 31),
-                        ),
-                    )
-                )
-            elif statement_param_key == "from":
-                statement_filter_q_list.append(
-                    Q(
-                        # date__sortdate_dt="[* TO *]",
-                        date__sortdate_dt__gte=parse(
-                            statement_param_value, default=datetime.datetime(1000, 1, 1)
-                        ),
-                    )
+                    date_overlap_q(params.get("from"), params.get("to"))
                 )
             elif statement_param_key == "place":
                 # Fields are called "places" but API wants "place"
-                q = Q(places__uris=statement_param_value) | Q(
-                    places__label=statement_param_value
-                )
+                place_ids = resolved_ids(statement_param_value, "place")
+                if place_ids:
+                    # (Statements indexed before places had an id_s are
+                    # matched by the URI, as they were then)
+                    q = ids_q("places__id_s", place_ids) | without_field_q(
+                        Q(places__uris=statement_param_value), "places__id_s"
+                    )
+                else:
+                    q = Q(places__uris=statement_param_value) | Q(
+                        places__label=statement_param_value
+                    )
                 statement_filter_q_list.append(q)
             elif statement_param_key in ("statementText", "name", "relatesToPersons"):
                 q = Q(**{statement_param_key: statement_param_value})
                 statement_filter_q_list.append(q)
             else:
-                q = Q(**{f"{statement_param_key}__uri": statement_param_value}) | Q(
-                    **{f"{statement_param_key}__label": statement_param_value}
+                member_of_ids = statement_param_key == "memberOf" and resolved_ids(
+                    statement_param_value, "memberOf"
                 )
+                if member_of_ids:
+                    q = ids_q("memberOf__id_s", member_of_ids) | without_field_q(
+                        Q(memberOf__uri=statement_param_value), "memberOf__id_s"
+                    )
+                else:
+                    q = Q(**{f"{statement_param_key}__uri": statement_param_value}) | Q(
+                        **{f"{statement_param_key}__label": statement_param_value}
+                    )
                 statement_filter_q_list.append(q)
 
     return statement_filter_q_list
@@ -100,8 +184,8 @@ def apply_statement_params(queryset, params, statements_parent_key="ST"):
     ✅ memberOf          person has statement with memberOf URL or Label
     ✅ role              person has statement with role URL or Label
     ✅ name              person has statement naming the person (string)
-    ✅ from              person has statement not before From date
-    ✅ to                person has statement not after To date
+    ✅ from              person has statement not ending before From date
+    ✅ to                person has statement not starting after To date
     ✅ place             person has statement with place URL or Label
     """
 
@@ -140,297 +224,475 @@ def apply_statement_params(queryset, params, statements_parent_key="ST"):
     return queryset
 
 
-def wrap_result_with_protocol(result, params, ipif_type):
-    return {
-        "protocol": {
-            "size": len(result),
-            "totalHits": result.count(),
-            "page": int(params.get("page", DEFAULT_PAGE_NUMBER)),
-        },
-        ipif_type: result,
-    }
+def filter_persons(params):
+    """ Filters PersonIndex by the /persons/ params (without paginating) """
 
+    person_result = PersonIndex
 
-class PersonsListView(APIView):
-    def get(self, request, format=None):
-        """
-        Get list of persons from index.
+    relatesToPersonsDepth = params.get("relatesToPersonsDepth")
+    relatesToPersons = params.get("relatesToPersons")
+    if relatesToPersonsDepth and not relatesToPersons:
+        raise InvalidParam("relatesToPersonsDepth needs relatesToPersons")
+    if relatesToPersonsDepth:
+        # Persons within this many hops of relatesToPersons (instead of persons
+        # with a statement relating them to relatesToPersons)
+        person_ids = related_person_ids(
+            relatesToPersons, int_param(params, "relatesToPersonsDepth", None)
+        )
+        person_result = person_result.filter(person_ids_q(person_ids))
+        params = {
+            key: value for key, value in params.items() if key != "relatesToPersons"
+        }
 
-        Params:
+    person_result = apply_statement_params(person_result, params)
 
-            ~~~~~~~~~ Generic Params ~~~~~~~~~
-            ✅ size
-            ✅ page
-            - sortBy # NOT IMPLEMENTED IN PYSOLAAR 
-            ✅ p                 person metadata full search
-            ✅ factoidId         has factoid with Id
-            ✅ f                 factoid metadata full search
-            ✅ statementId       has statement with Id
-            ✅ st                statement (meta)data full search
-            ✅ sourceId          has source with Id
-            ✅ s                 source metadata full search
-                
+    p = params.get("p")
+    if p:
+        person_result = person_result.filter(
+            Q(label=p) | Q(createdBy=p) | Q(modifiedBy=p) | Q(uris=p)
+        )
 
-            
+    factoidId = params.get("factoidId")
+    if factoidId:
+        person_result = person_result.filter_by_distinct_child(
+            field_name="F", id=factoidId
+        )
 
+    f = params.get("f")
+    if f:
+        person_result = person_result.filter_by_distinct_child(
+            Q(createdBy=f) | Q(modifiedBy=f), field_name="F",
+        )
 
-        """
+    statementId = params.get("statementId")
+    if statementId:
+        person_result = person_result.filter_by_distinct_child(
+            field_name="ST", id=statementId
+        )
 
-        params = request.query_params
+    # TODO: not working
+    # UPDATE: looking at Solr, seems not to be anything in these fields except ID
+    # (which works: see statementId above)
+    st = params.get("st")
+    if st:
+        person_result = person_result.filter_by_distinct_child(
+            Q(createdBy=st)
+            | Q(modifiedBy=st)
+            | Q(statementType__label=st)
+            | Q(statementType__uri=st),
+            field_name="ST",
+        )
 
-        person_result = PersonIndex
+    sourceId = params.get("sourceId")
+    if sourceId:
+        person_result = person_result.filter_by_distinct_child(
+            field_name="S", id=sourceId
+        )
 
-        person_result = apply_statement_params(person_result, params)
-        person_result = apply_page_number_and_size_params(person_result, params)
+    s = params.get("s")
+    if s:
+        person_result = person_result.filter_by_distinct_child(
+            Q(label=s) | Q(uris=s) | Q(createdBy=s) | Q(modifiedBy=s),
+            field_name="S",
+        )
 
-        p = params.get("p")
-        if p:
-            person_result = person_result.filter(
-                Q(label=p) | Q(createdBy=p) | Q(modifiedBy=p) | Q(uris=p)
-            )
+    check_query_cost(person_result)
+    return person_result
 
-        factoidId = params.get("factoidId")
-        if factoidId:
-            person_result = person_result.filter_by_distinct_child(
-                field_name="F", id=factoidId
-            )
 
-        f = params.get("f")
-        if f:
-            person_result = person_result.filter_by_distinct_child(
-                Q(createdBy=f) | Q(modifiedBy=f), field_name="F",
-            )
+def filter_factoids(params):
+    """ Filters FactoidIndex by the /factoids/ params (without paginating) """
 
-        statementId = params.get("statementId")
-        if statementId:
-            person_result = person_result.filter_by_distinct_child(
-                field_name="ST", id=statementId
-            )
+    factoid_result = FactoidIndex
+    factoid_result = apply_statement_params(
+        factoid_result, params, statements_parent_key="Statements"
+    )
 
-        # TODO: not working
-        # UPDATE: looking at Solr, seems not to be anything in these fields except ID
-        # (which works: see statementId above)
-        st = params.get("st")
-        if st:
-            person_result = person_result.filter_by_distinct_child(
-                Q(createdBy=st)
-                | Q(modifiedBy=st)
-                | Q(statementType__label=st)
-                | Q(statementType__uri=st),
-                field_name="ST",
-            )
+    # (Statements holds the same statements as ST, but with all their fields)
+    statementId = params.get("statementId")
+    if statementId:
+        factoid_result = factoid_result.filter_by_distinct_child(
+            field_name="Statements", id=statementId
+        )
 
-        sourceId = params.get("sourceId")
-        if sourceId:
-            person_result = person_result.filter_by_distinct_child(
-                field_name="S", id=sourceId
-            )
+    st = params.get("st")
+    if st:
+        factoid_result = factoid_result.filter_by_distinct_child(
+            Q(createdBy=st)
+            | Q(modifiedBy=st)
+            | Q(statementType__label=st)
+            | Q(statementType__uri=st),
+            field_name="Statements",
+        )
 
-        s = params.get("s")
-        if s:
-            person_result = person_result.filter_by_distinct_child(
-                Q(label=s) | Q(uris=s) | Q(createdBy=s) | Q(modifiedBy=s),
-                field_name="S",
-            )
+    sourceId = params.get("sourceId")
+    if sourceId:
+        factoid_result = factoid_result.filter_by_distinct_child(
+            field_name="S", id=sourceId
+        )
 
-        import datetime
+    s = params.get("s")
+    if s:
+        factoid_result = factoid_result.filter_by_distinct_child(
+            Q(label=s) | Q(uris=s) | Q(createdBy=s) | Q(modifiedBy=s),
+            field_name="S",
+        )
 
-        result = wrap_result_with_protocol(person_result, params, "persons")
+    personId = params.get("personId")
+    if personId:
+        factoid_result = factoid_result.filter_by_distinct_child(
+            field_name="Person", id=personId
+        )
 
-        return Response(result)
+    p = params.get("p")
+    if p:
+        factoid_result = factoid_result.filter_by_distinct_child(
+            Q(label=p) | Q(uris=p) | Q(createdBy=p) | Q(modifiedBy=p),
+            field_name="Person",
+        )
 
+    f = params.get("f")
+    if f:
+        # Factoid metadata is on the factoid itself (there is no F child)
+        factoid_result = factoid_result.filter(Q(createdBy=f) | Q(modifiedBy=f))
 
-class PersonsView(APIView):
-    def get(self, request, format=None, id=None):
+    check_query_cost(factoid_result)
+    return factoid_result
 
-        person_result = PersonIndex.filter(Q(id=id) | Q(uris=id))
 
-        if person_result.first():
-            return Response(person_result.first())
+def filter_statements(params):
+    """ Filters StatementIndex by the /statements/ params (without paginating) """
 
-        return Response({"description": "the person does not exist"}, status=404)
+    statement_result = StatementIndex
 
+    sourceId = params.get("sourceId")
+    if sourceId:
+        statement_result = statement_result.filter_by_distinct_child(
+            field_name="S", id=sourceId
+        )
 
-class FactoidsListView(APIView):
-    def get(self, request, format=None):
-        params = request.query_params
+    s = params.get("s")
+    if s:
+        statement_result = statement_result.filter_by_distinct_child(
+            Q(label=s) | Q(uris=s) | Q(createdBy=s) | Q(modifiedBy=s),
+            field_name="S",
+        )
 
-        factoid_result = FactoidIndex
-        factoid_result = apply_page_number_and_size_params(factoid_result, params)
-        factoid_result = apply_statement_params(
-            factoid_result, params, statements_parent_key="Statements"
+    personId = params.get("personId")
+    if personId:
+        statement_result = statement_result.filter_by_distinct_child(
+            field_name="P", id=personId
         )
 
-        statementId = params.get("statementId")
-        if statementId:
-            factoid_result = factoid_result.filter_by_distinct_child(
-                field_name="ST", id=statementId
-            )
+    p = params.get("p")
+    if p:
+        statement_result = statement_result.filter_by_distinct_child(
+            Q(label=p) | Q(uris=p) | Q(createdBy=p) | Q(modifiedBy=p),
+            field_name="P",
+        )
 
-        st = params.get("st")
-        if st:
-            factoid_result = factoid_result.filter_by_distinct_child(
-                Q(createdBy=st)
-                | Q(modifiedBy=st)
-                | Q(statementType__label=st)
-                | Q(statementType__uri=st),
-                field_name="ST",
-            )
+    factoidId = params.get("factoidId")
+    if factoidId:
+        statement_result = statement_result.filter_by_distinct_child(
+            field_name="F", id=factoidId
+        )
 
-        sourceId = params.get("sourceId")
-        if sourceId:
-            factoid_result = factoid_result.filter_by_distinct_child(
-                field_name="S", id=sourceId
-            )
+    f = params.get("f")
+    if f:
+        statement_result = statement_result.filter_by_distinct_child(
+            Q(createdBy=f) | Q(modifiedBy=f), field_name="F",
+        )
 
-        s = params.get("s")
-        if s:
-            factoid_result = factoid_result.filter_by_distinct_child(
-                Q(label=s) | Q(uris=s) | Q(createdBy=s) | Q(modifiedBy=s),
-                field_name="S",
-            )
+    statement_filter_q_list = build_statement_filter_q_list(params)
+    if statement_filter_q_list:
+        statement_filter_q_object = statement_filter_q_list[0]
+        for q in statement_filter_q_list[1:]:
+            statement_filter_q_object &= q
 
-        personId = params.get("personId")
-        if personId:
-            factoid_result = factoid_result.filter_by_distinct_child(
-                field_name="Person", id=personId
-            )
+        statement_result = statement_result.filter(statement_filter_q_object)
 
-        p = params.get("p")
-        if p:
-            factoid_result = factoid_result.filter_by_distinct_child(
-                Q(label=p) | Q(uris=p) | Q(createdBy=p) | Q(modifiedBy=p),
-                field_name="Person",
-            )
+    check_query_cost(statement_result)
+    return statement_result
 
-        f = params.get("f")
-        if f:
-            factoid_result = factoid_result.filter_by_distinct_child(
-                Q(createdBy=f) | Q(modifiedBy=f), field_name="F",
-            )
 
-        result = wrap_result_with_protocol(factoid_result, params, "factoids")
-        return Response(result)
+def filter_sources(params):
+    """ Filters SourceIndex by the /sources/ params (without paginating) """
 
+    source_result = SourceIndex
 
-class FactoidsView(APIView):
-    def get(self, request, format=None, id=None):
-        factoid = FactoidIndex.filter(id=id)
-        if factoid.first():
-            return Response(factoid.first())
-        return Response({"description": "the factoid does not exist"}, status=404)
+    s = params.get("s")
+    if s:
+        source_result = source_result.filter(
+            Q(label=s) | Q(uris=s) | Q(createdBy=s) | Q(modifiedBy=s),
+        )
+
+    personId = params.get("personId")
+    if personId:
+        source_result = source_result.filter_by_distinct_child(
+            field_name="P", id=personId
+        )
 
+    p = params.get("p")
+    if p:
+        source_result = source_result.filter_by_distinct_child(
+            Q(label=p) | Q(uris=p) | Q(createdBy=p) | Q(modifiedBy=p),
+            field_name="P",
+        )
 
-class StatementsListView(APIView):
-    def get(self, request, format=None):
-        params = request.query_params
+    factoidId = params.get("factoidId")
+    if factoidId:
+        source_result = source_result.filter_by_distinct_child(
+            field_name="Factoids", id=factoidId
+        )
 
-        statement_result = StatementIndex
+    f = params.get("f")
+    if f:
+        source_result = source_result.filter_by_distinct_child(
+            Q(createdBy=f) | Q(modifiedBy=f), field_name="Factoids",
+        )
 
-        sourceId = params.get("sourceId")
-        if sourceId:
-            statement_result = statement_result.filter_by_distinct_child(
-                field_name="S", id=sourceId
-            )
+    source_result = apply_statement_params(source_result, params)
 
-        s = params.get("s")
-        if s:
-            statement_result = statement_result.filter_by_distinct_child(
-                Q(label=s) | Q(uris=s) | Q(createdBy=s) | Q(modifiedBy=s),
-                field_name="S",
-            )
+    check_query_cost(source_result)
+    return source_result
 
-        personId = params.get("personId")
-        if personId:
-            statement_result = statement_result.filter_by_distinct_child(
-                field_name="P", id=personId
-            )
 
-        p = params.get("p")
-        if p:
-            statement_result = statement_result.filter_by_distinct_child(
-                Q(label=p) | Q(uris=p) | Q(createdBy=p) | Q(modifiedBy=p),
-                field_name="P",
-            )
+LIST_FILTERS = {
+    "persons": filter_persons,
+    "factoids": filter_factoids,
+    "statements": filter_statements,
+    "sources": filter_sources,
+}
+
+
+def protocol(size, total_hits, params, partial_results=False):
+    return {
+        "size": size,
+        "totalHits": total_hits,
+        "page": int_param(params, "page", DEFAULT_PAGE_NUMBER),
+        # Whether Solr stopped the query at timeAllowed
+        "partialResults": partial_results,
+    }
+
+
+def wrap_result_with_protocol(result, params, ipif_type):
+    size = len(result)
+    # (Querysets keep their results object, once fetched, in _results)
+    results = getattr(result, "_results", result)
+    return {
+        "protocol": protocol(
+            size,
+            result.count(),
+            params,
+            getattr(results, "partial_results", False),
+        ),
+        ipif_type: result,
+    }
+
 
-        factoidId = params.get("factoidId")
-        if factoidId:
-            statement_result = statement_result.filter_by_distinct_child(
-                field_name="F", id=factoidId
+def splice_rendered_page(rendered, total_hits, partial_results, params, ipif_type):
+    """JSON bytes of a page of rendered documents, with the protocol block"""
+    return splice(
+        {"protocol": protocol(len(rendered), total_hits, params, partial_results)},
+        ipif_type,
+        rendered,
+    )
+
+
+def is_count_only(method, params):
+    """HEAD requests, and requests with size=0, only need totalHits"""
+    return method == "HEAD" or params.get("size") == "0"
+
+
+def count_cache_key(ipif_type, params):
+    """Cache key for the count of a list query, from the params other than
+    page and size (in a fixed order, so that it doesn't matter how they are given)"""
+    filters = sorted(
+        (key, value) for key, value in params.items() if key not in {"page", "size"}
+    )
+    digest = hashlib.sha1(json.dumps([ipif_type, filters]).encode()).hexdigest()
+    return f"apis_ipif_solr:count:{digest}"
+
+
+def count_protocol(total_hits, params, partial_results=False):
+    return {"protocol": protocol(0, total_hits, params, partial_results)}
+
+
+def count_only(filter_function, params, ipif_type):
+    """Counts the results of a list query with a rows=0 query (so no documents
+    are fetched or transformed), caching the count for COUNT_CACHE_TTL seconds"""
+    key = count_cache_key(ipif_type, params)
+    total_hits = cache.get(key)
+    if total_hits is not None:
+        return count_protocol(total_hits, params)
+    queryset = as_queryset(filter_function(params))
+    results = queryset._get_results(rows=0)
+    if not results.partial_results:  # (Don't cache counts that may be short)
+        cache.set(key, results.count(), COUNT_CACHE_TTL)
+    return count_protocol(results.count(), params, results.partial_results)
+
+
+class IPIFView(APIView):
+    """Base view for IPIF endpoints: if Solr cannot be reached (or the circuit
+    breaker is open), fail fast with a 503 instead of an error page; and
+    return a 400 for params that can't be parsed (see params.py). Requests are timed and
+    fingerprinted for the query stats and slow-query log (see query_log.py)"""
+
+    def dispatch(self, request, *args, **kwargs):
+        with track_request(
+            type(self).__name__, request.GET, request_key(request)
+        ):
+            return super().dispatch(request, *args, **kwargs)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, SolrUnavailable):
+            return Response(
+                {"description": "the IPIF index is temporarily unavailable"},
+                status=503,
+                headers={"Retry-After": str(exc.retry_after)},
             )
+        if isinstance(exc, pysolr.SolrError):
+            return Response(
+                {"description": "the IPIF index could not be queried"}, status=503
+            )
+        if isinstance(exc, InvalidParam):  # e.g. unparseable dates or numbers
+            return Response({"description": str(exc)}, status=400)
+        return super().handle_exception(exc)
+
+    def use_rendered(self, request):
+        """Whether to return pre-rendered documents (see rendered.py), which
+        is only possible when rendering JSON (not DRF's browsable API)"""
+        return RENDERED_DOCUMENTS and request.accepted_renderer.format == "json"
 
-        f = params.get("f")
-        if f:
-            statement_result = statement_result.filter_by_distinct_child(
-                Q(createdBy=f) | Q(modifiedBy=f), field_name="F",
+    def page_response(self, request, queryset, ipif_type):
+        """A page of (paginated) queryset with the protocol block"""
+        params = request.query_params
+        if self.use_rendered(request):
+            rendered, total_hits, partial_results = fetch_rendered(queryset)
+            return HttpResponse(
+                splice_rendered_page(
+                    rendered, total_hits, partial_results, params, ipif_type
+                ),
+                content_type="application/json",
             )
+        # (Fetched once here: a queryset only keeps its results object if it is
+        # truthy, so with no hits, len, count and iterating each query again)
+        results = queryset._get_results()
+        return Response(wrap_result_with_protocol(results, params, ipif_type))
+
+    def document_response(self, request, queryset, ipif_type):
+        """The first document of queryset, or a 404 saying it does not exist"""
+        not_found = {"description": NOT_FOUND_DESCRIPTIONS[ipif_type]}
+        if self.use_rendered(request):
+            rendered, _, _ = fetch_rendered(queryset, rows=1)
+            if rendered:
+                return HttpResponse(rendered[0], content_type="application/json")
+            return Response(not_found, status=404)
+        document = queryset.first()
+        if document:
+            return Response(document)
+        return Response(not_found, status=404)
+
+    def count_only_response(self, filter_function, params, ipif_type):
+        """Just the protocol block (with totalHits also as a header, for HEAD)"""
+        result = count_only(filter_function, params, ipif_type)
+        return Response(
+            result, headers={"X-Total-Hits": str(result["protocol"]["totalHits"])}
+        )
 
-        statement_filter_q_list = build_statement_filter_q_list(params)
-        if statement_filter_q_list:
-            statement_filter_q_object = statement_filter_q_list[0]
-            for q in statement_filter_q_list[1:]:
-                statement_filter_q_object &= q
 
-            statement_result = statement_result.filter(statement_filter_q_object)
-        statement_result = apply_page_number_and_size_params(statement_result, params)
-        result = wrap_result_with_protocol(statement_result, params, "statements")
-        return Response(result)
+class PersonsListView(IPIFView):
+    def get(self, request, format=None):
+        """
+        Get list of persons from index.
 
+        Params:
 
-class StatementsView(APIView):
+            ~~~~~~~~~ Generic Params ~~~~~~~~~
+            ✅ size
+            ✅ page
+            - sortBy # NOT IMPLEMENTED IN PYSOLAAR 
+            ✅ p                 person metadata full search
+            ✅ factoidId         has factoid with Id
+            ✅ f                 factoid metadata full search
+            ✅ statementId       has statement with Id
+            ✅ st                statement (meta)data full search
+            ✅ sourceId          has source with Id
+            ✅ s                 source metadata full search
+            ✅ relatesToPersonsDepth   with relatesToPersons: persons within
+                                this many hops of relatesToPersons
+                
+
+            
+
+
+        """
+
+        params = request.query_params
+        if is_count_only(request.method, params):
+            return self.count_only_response(filter_persons, params, "persons")
+
+        person_result = filter_persons(params)
+
+        # (Paginate last, as PySolaar's filter does not keep pagination)
+        person_result = apply_page_number_and_size_params(person_result, params)
+        return self.page_response(request, person_result, "persons")
+
+
+class PersonsView(IPIFView):
     def get(self, request, format=None, id=None):
-        statement = StatementIndex.filter(id=id)
-        if statement.first():
-            return Response(statement.first())
-        return Response({"description": "the statement does not exist"})
+        return self.document_response(
+            request, PersonIndex.filter(person_q(id)), "persons"
+        )
 
 
-class SourcesListView(APIView):
+class FactoidsListView(IPIFView):
     def get(self, request, format=None):
         params = request.query_params
+        if is_count_only(request.method, params):
+            return self.count_only_response(filter_factoids, params, "factoids")
 
-        source_result = SourceIndex
+        factoid_result = filter_factoids(params)
 
-        s = params.get("s")
-        if s:
-            source_result = source_result.filter(
-                Q(label=s) | Q(uris=s) | Q(createdBy=s) | Q(modifiedBy=s),
-            )
+        # (Paginate last, as PySolaar's filter does not keep pagination)
+        factoid_result = apply_page_number_and_size_params(factoid_result, params)
+        return self.page_response(request, factoid_result, "factoids")
 
-        personId = params.get("personId")
-        if personId:
-            source_result = source_result.filter_by_distinct_child(
-                field_name="P", id=personId
-            )
 
-        p = params.get("p")
-        if p:
-            source_result = source_result.filter_by_distinct_child(
-                Q(label=p) | Q(uris=p) | Q(createdBy=p) | Q(modifiedBy=p),
-                field_name="P",
-            )
+class FactoidsView(IPIFView):
+    def get(self, request, format=None, id=None):
+        return self.document_response(request, FactoidIndex.filter(id=id), "factoids")
 
-        factoidId = params.get("factoidId")
-        if factoidId:
-            source_result = source_result.filter_by_distinct_child(
-                field_name="Factoids", id=factoidId
-            )
 
-        f = params.get("f")
-        if f:
-            source_result = source_result.filter_by_distinct_child(
-                Q(createdBy=f) | Q(modifiedBy=f), field_name="Factoids",
-            )
+class StatementsListView(IPIFView):
+    def get(self, request, format=None):
+        params = request.query_params
+        if is_count_only(request.method, params):
+            return self.count_only_response(filter_statements, params, "statements")
+
+        statement_result = filter_statements(params)
+        statement_result = apply_page_number_and_size_params(statement_result, params)
+        return self.page_response(request, statement_result, "statements")
+
+
+class StatementsView(IPIFView):
+    def get(self, request, format=None, id=None):
+        return self.document_response(
+            request, StatementIndex.filter(id=id), "statements"
+        )
+
+
+class SourcesListView(IPIFView):
+    def get(self, request, format=None):
+        params = request.query_params
+        if is_count_only(request.method, params):
+            return self.count_only_response(filter_sources, params, "sources")
 
-        source_result = apply_statement_params(source_result, params)
+        source_result = filter_sources(params)
         source_result = apply_page_number_and_size_params(source_result, params)
-        result = wrap_result_with_protocol(source_result, params, "sources")
-        return Response(result)
+        return self.page_response(request, source_result, "sources")
 
 
-class SourcesView(APIView):
+class SourcesView(IPIFView):
     def get(self, request, id, format=None):
-        source = SourceIndex.filter(id=id)
-        if source.first():
-            return Response(source.first())
-        return Response({"description": "the statement does not exist"})
+        return self.document_response(request, SourceIndex.filter(id=id), "sources")
@@ -0,0 +1,302 @@
+"""Async versions of the views in api_views, for running under ASGI
+(enabled with APIS_IPIF_CONFIG["ASYNC_VIEWS"]; see urls.py).
+
+These are plain Django async views, as DRF's APIView is sync only: they take
+the same params and return the same JSON, but without DRF's browsable API.
+Solr is queried with httpx, so a request waiting on Solr does not hold a worker
+thread. Each request needs one round-trip to Solr: totalHits is read from the
+same response as the page of results."""
+
+import asyncio
+from functools import wraps
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+import pysolr
+from rest_framework.utils.encoders import JSONEncoder
+
+from apis_ipif_solr.api_views import (
+    COUNT_CACHE_TTL,
+    LIST_FILTERS,
+    NOT_FOUND_DESCRIPTIONS,
+    apply_page_number_and_size_params,
+    count_cache_key,
+    count_protocol,
+    filter_factoids,
+    filter_persons,
+    filter_sources,
+    filter_statements,
+    is_count_only,
+    splice_rendered_page,
+    wrap_result_with_protocol,
+)
+from apis_ipif_solr.batch import BATCH_WORKERS, BatchError, parse_batch
+from apis_ipif_solr.export import export_params, ndjson_line
+from apis_ipif_solr.facets import facet_params, unpack_facets
+from apis_ipif_solr.indexes import (
+    FactoidIndex,
+    PersonIndex,
+    SourceIndex,
+    StatementIndex,
+)
+from apis_ipif_solr.params import InvalidParam
+from apis_ipif_solr.query_log import request_key, stats, track_request
+from apis_ipif_solr.rendered import (
+    RENDERED_DOCUMENTS,
+    rendered_params,
+    unpack_rendered,
+)
+from apis_ipif_solr.solr_client import (
+    SolrUnavailable,
+    as_queryset,
+    get_async_client,
+    load_results,
+)
+from apis_ipif_solr.suggest import suggest_params, unpack_suggestions
+from apis_ipif_solr.uris import needs_uri_lookup, person_q
+
+
+def ipif_response(data, status=200):
+    # (DRF's encoder serializes PySolaar results, which are iterables)
+    return JsonResponse(data, status=status, encoder=JSONEncoder)
+
+
+def ipif_async_view(view):
+    """Returns 503 if Solr cannot be queried, as IPIFView does
+    (and likewise records query stats, see query_log.py)"""
+
+    @wraps(view)
+    async def inner(request, *args, **kwargs):
+        try:
+            with track_request(
+                view.__name__, request.GET, request_key(request), flush=False
+            ):
+                return await handle_errors(view, request, *args, **kwargs)
+        finally:
+            await stats.aflush_if_due()
+
+    return inner
+
+
+async def handle_errors(view, request, *args, **kwargs):
+    """Runs the view, returning errors as IPIFView.handle_exception does"""
+    try:
+        return await view(request, *args, **kwargs)
+    except SolrUnavailable as e:
+        response = ipif_response(
+            {"description": "the IPIF index is temporarily unavailable"},
+            status=503,
+        )
+        response["Retry-After"] = str(e.retry_after)
+        return response
+    except pysolr.SolrError:
+        return ipif_response(
+            {"description": "the IPIF index could not be queried"},
+            status=503,
+        )
+    except InvalidParam as e:
+        return ipif_response({"description": str(e)}, status=400)
+
+
+async def execute(queryset):
+    return await get_async_client(queryset).search(queryset)
+
+
+async def first(queryset):
+    results = await get_async_client(queryset).search(queryset, rows=1)
+    return next(iter(results), None)
+
+
+async def fetch_rendered_async(queryset, **kwargs):
+    """Async version of rendered.fetch_rendered"""
+    queryset = as_queryset(queryset)
+    decoded = await get_async_client(queryset).select(
+        rendered_params(queryset, **kwargs)
+    )
+    return unpack_rendered(decoded)
+
+
+async def document_response(queryset, ipif_type):
+    """The first document of queryset (pre-rendered, with RENDERED_DOCUMENTS),
+    or a 404 saying it does not exist"""
+    if RENDERED_DOCUMENTS:
+        rendered, _, _ = await fetch_rendered_async(queryset, rows=1)
+        if rendered:
+            return HttpResponse(rendered[0], content_type="application/json")
+    else:
+        document = await first(queryset)
+        if document:
+            return ipif_response(document)
+    return ipif_response({"description": NOT_FOUND_DESCRIPTIONS[ipif_type]}, status=404)
+
+
+async def run_filters(filter_function, params, id=None):
+    """Filtering persons by relatesToPersonsDepth queries Solr for the related
+    persons first (synchronously, see graph.py), as does resolving URI params
+    (or a URI id) to ids (see uris.py), so do those in a thread"""
+    if params.get("relatesToPersonsDepth") or needs_uri_lookup(params, id):
+        return await sync_to_async(filter_function, thread_sensitive=False)(params)
+    return filter_function(params)
+
+
+async def count_only_async(filter_function, params, ipif_type):
+    """Async version of api_views.count_only"""
+    key = count_cache_key(ipif_type, params)
+    total_hits = await cache.aget(key)
+    if total_hits is not None:
+        return count_protocol(total_hits, params)
+    queryset = await run_filters(filter_function, params)
+    results = await get_async_client(queryset).search(queryset, rows=0)
+    if not results.partial_results:
+        await cache.aset(key, results.count(), COUNT_CACHE_TTL)
+    return count_protocol(results.count(), params, results.partial_results)
+
+
+async def list_response(request, filter_function, ipif_type):
+    params = request.GET
+    if is_count_only(request.method, params):
+        result = await count_only_async(filter_function, params, ipif_type)
+        response = ipif_response(result)
+        response["X-Total-Hits"] = str(result["protocol"]["totalHits"])
+        return response
+    queryset = await run_filters(filter_function, params)
+    queryset = apply_page_number_and_size_params(queryset, params)
+    if RENDERED_DOCUMENTS:
+        rendered, total_hits, partial_results = await fetch_rendered_async(queryset)
+        return HttpResponse(
+            splice_rendered_page(
+                rendered, total_hits, partial_results, params, ipif_type
+            ),
+            content_type="application/json",
+        )
+    results = await execute(queryset)
+    return ipif_response(wrap_result_with_protocol(results, params, ipif_type))
+
+
+@ipif_async_view
+async def persons_list(request):
+    return await list_response(request, filter_persons, "persons")
+
+
+@ipif_async_view
+async def person_detail(request, id=None):
+    queryset = await run_filters(lambda _: PersonIndex.filter(person_q(id)), {}, id=id)
+    return await document_response(queryset, "persons")
+
+
+@ipif_async_view
+async def factoids_list(request):
+    return await list_response(request, filter_factoids, "factoids")
+
+
+@ipif_async_view
+async def factoid_detail(request, id=None):
+    return await document_response(FactoidIndex.filter(id=id), "factoids")
+
+
+@ipif_async_view
+async def statements_list(request):
+    return await list_response(request, filter_statements, "statements")
+
+
+@ipif_async_view
+async def statement_detail(request, id=None):
+    return await document_response(StatementIndex.filter(id=id), "statements")
+
+
+@ipif_async_view
+async def sources_list(request):
+    return await list_response(request, filter_sources, "sources")
+
+
+@ipif_async_view
+async def source_detail(request, id=None):
+    return await document_response(SourceIndex.filter(id=id), "sources")
+
+
+async def run_batch_query_async(query, semaphore):
+    async with semaphore:
+        try:
+            queryset = await run_filters(
+                lambda _: query.queryset(), query.params, id=query.id
+            )
+            if query.id:
+                return query.detail_result(await first(queryset))
+            return query.list_result(await execute(queryset))
+        except InvalidParam as e:
+            return query.error_result(400, str(e))
+        except pysolr.SolrError:
+            return query.error_result(503, "the IPIF index could not be queried")
+
+
+async def batch(request):
+    """Async version of batch.BatchView"""
+    if request.method != "POST":
+        return ipif_response({"description": "use POST"}, status=405)
+    try:
+        queries = parse_batch(json.loads(request.body))
+    except json.JSONDecodeError:
+        return ipif_response({"description": "the body must be JSON"}, status=400)
+    except BatchError as e:
+        return ipif_response({"description": str(e)}, status=400)
+    semaphore = asyncio.Semaphore(BATCH_WORKERS)
+    results = await asyncio.gather(
+        *(run_batch_query_async(query, semaphore) for query in queries)
+    )
+    return ipif_response({"results": results})
+
+
+# (Not using the csrf_exempt decorator, which isn't async-aware in older Djangos)
+batch.csrf_exempt = True
+
+
+async def iterate_export_batches_async(queryset):
+    """Async version of export.iterate_export_batches"""
+    queryset = as_queryset(queryset)
+    cursor_mark = "*"
+    while True:
+        decoded = await get_async_client(queryset).select(
+            export_params(queryset, cursor_mark)
+        )
+        yield load_results(queryset, decoded)
+        if decoded["nextCursorMark"] == cursor_mark:
+            return
+        cursor_mark = decoded["nextCursorMark"]
+
+
+@ipif_async_view
+async def export(request, ipif_type):
+    """Async version of export.ExportView (streaming needs Django 4.2+)"""
+    queryset = await run_filters(LIST_FILTERS[ipif_type], request.GET)
+    batches = iterate_export_batches_async(queryset)
+    # (As in ExportView, fetch the first batch before starting the stream)
+    first_batch = await batches.__anext__()
+
+    async def lines():
+        for document in first_batch:
+            yield ndjson_line(document)
+        async for batch in batches:
+            for document in batch:
+                yield ndjson_line(document)
+
+    return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+
+
+@ipif_async_view
+async def facets(request, ipif_type):
+    """Async version of facets.FacetsView"""
+    queryset, solr_params = await run_filters(
+        lambda params: facet_params(ipif_type, params), request.GET
+    )
+    decoded = await get_async_client(queryset).select(solr_params)
+    return ipif_response(unpack_facets(decoded, ipif_type))
+
+
+@ipif_async_view
+async def suggest(request):
+    """Async version of suggest.SuggestView"""
+    queryset, solr_params = suggest_params(request.GET)
+    decoded = await get_async_client(queryset).select(solr_params)
+    return ipif_response(unpack_suggestions(queryset, decoded))
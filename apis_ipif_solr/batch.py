@@ -0,0 +1,157 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import re
+
+from django.conf import settings
+import pysolr
+from rest_framework.response import Response
+
+from apis_ipif_solr.api_views import (
+    LIST_FILTERS,
+    NOT_FOUND_DESCRIPTIONS,
+    IPIFView,
+    apply_page_number_and_size_params,
+    wrap_result_with_protocol,
+)
+from apis_ipif_solr.indexes import (
+    FactoidIndex,
+    PersonIndex,
+    SourceIndex,
+    StatementIndex,
+)
+from apis_ipif_solr.params import InvalidParam
+from apis_ipif_solr.urls import EXPORT_PATH, FACETS_PATH
+from apis_ipif_solr.uris import person_q
+
+BATCH_MAX_QUERIES = settings.APIS_IPIF_CONFIG.get("BATCH_MAX_QUERIES", 50)
+BATCH_WORKERS = settings.APIS_IPIF_CONFIG.get("BATCH_WORKERS", 8)
+
+DETAIL_FILTERS = {
+    "persons": lambda id: PersonIndex.filter(person_q(id)),
+    "factoids": lambda id: FactoidIndex.filter(id=id),
+    "statements": lambda id: StatementIndex.filter(id=id),
+    "sources": lambda id: SourceIndex.filter(id=id),
+}
+
+# Shared by all batch requests, so that the number of concurrent queries
+# to Solr is bounded however many batches come in at once
+executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS)
+
+
+class BatchError(Exception):
+    pass
+
+
+class BatchQuery:
+    """One query of a batch: a list query (with its params) if id is None,
+    otherwise a lookup by id"""
+
+    def __init__(self, endpoint, params):
+        path = endpoint.lstrip("/")
+        if path.startswith("ipif/"):
+            path = path[len("ipif/") :]
+        # (Matched as by urls.py, before the detail paths, which would take
+        # "export" or "facets" for an id)
+        if re.match(EXPORT_PATH, path) or re.match(FACETS_PATH, path):
+            raise BatchError(f"{endpoint} can't be batched")
+        ipif_type, _, id = path.partition("/")
+        if ipif_type not in LIST_FILTERS:
+            raise BatchError(f"unknown endpoint: {endpoint}")
+        self.endpoint = endpoint
+        self.ipif_type = ipif_type
+        self.id = id or None
+        self.params = {key: str(value) for key, value in params.items()}
+
+    def queryset(self):
+        if self.id:
+            return DETAIL_FILTERS[self.ipif_type](self.id)
+        return apply_page_number_and_size_params(
+            LIST_FILTERS[self.ipif_type](self.params), self.params
+        )
+
+    def list_result(self, results):
+        return {
+            "endpoint": self.endpoint,
+            "status": 200,
+            "result": wrap_result_with_protocol(results, self.params, self.ipif_type),
+        }
+
+    def detail_result(self, document):
+        if document:
+            return {"endpoint": self.endpoint, "status": 200, "result": document}
+        return self.error_result(404, NOT_FOUND_DESCRIPTIONS[self.ipif_type])
+
+    def error_result(self, status, description):
+        return {
+            "endpoint": self.endpoint,
+            "status": status,
+            "result": {"description": description},
+        }
+
+
+def parse_batch(data):
+    """Parses the body of a batch request: a list of
+    {"endpoint": "persons/", "params": {...}} objects"""
+    if not isinstance(data, list):
+        raise BatchError("expected a list of queries")
+    if len(data) > BATCH_MAX_QUERIES:
+        raise BatchError(f"a batch may have at most {BATCH_MAX_QUERIES} queries")
+    batch = []
+    for entry in data:
+        if not isinstance(entry, dict) or not isinstance(entry.get("endpoint"), str):
+            raise BatchError("each query needs an endpoint")
+        params = entry.get("params", {})
+        if not isinstance(params, dict):
+            raise BatchError("params must be an object")
+        batch.append(BatchQuery(entry["endpoint"], params))
+    return batch
+
+
+def run_batch_query(query):
+    """Runs a batch query, returning its result (or error) rather than raising,
+    so one failing query doesn't fail the whole batch"""
+    try:
+        queryset = query.queryset()
+        if query.id:
+            return query.detail_result(queryset.first())
+        # (Get the results object directly, so that the page and totalHits
+        # are fetched here in the worker, rather than when rendering)
+        return query.list_result(queryset._get_results())
+    except InvalidParam as e:  # e.g. unparseable dates or page numbers
+        return query.error_result(400, str(e))
+    except pysolr.SolrError:
+        return query.error_result(503, "the IPIF index could not be queried")
+
+
+def run_batch(batch):
+    # (Each query runs in a copy of the request's context, as worker threads
+    # don't inherit contextvars, so that its Solr queries are still noted on
+    # the request, see query_log.py)
+    futures = [
+        executor.submit(contextvars.copy_context().run, run_batch_query, query)
+        for query in batch
+    ]
+    return [future.result() for future in futures]
+
+
+class BatchView(IPIFView):
+    def post(self, request, format=None):
+        """
+        Run several IPIF queries in one request.
+
+        POST a list of queries, e.g.
+
+            [
+                {"endpoint": "persons/", "params": {"role": "birth"}},
+                {"endpoint": "statements/", "params": {"personId": "1234"}},
+                {"endpoint": "persons/1234"}
+            ]
+
+        The queries are run concurrently, and a list of their results is
+        returned in the same order, each with its own status.
+        """
+        try:
+            batch = parse_batch(request.data)
+        except BatchError as e:
+            return Response({"description": str(e)}, status=400)
+        return Response({"results": run_batch(batch)})
@@ -0,0 +1,217 @@
+"""Performance budgets, checked by `runscript check_budgets` (e.g. in CI, against
+a fixture database and index), so that a change to the indexes or views can't
+quietly add per-person database queries or Solr round trips:
+
+- building the documents of each index may make at most
+  BUILD_QUERY_BUDGETS[<index class name>] database queries per chunk of
+  PERSON_CHUNK_SIZE persons (the persons of a chunk are fetched together, and
+  so is what they are built from, so this doesn't grow with the size of the
+  chunk, and a query made per person breaches it); an index without a budget
+  is a breach too, so that a new index can't go unchecked;
+- each IPIF list or detail request may make at most SOLR_REQUESTS_BUDGET Solr
+  requests, for every combination of params in budget_requests.
+
+Budgets can also be taken from a report saved by an earlier check (of the
+main branch, say), which also lets a breach be shown as a diff of the queries
+made against those made before."""
+
+from collections import Counter
+import difflib
+import json
+import re
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from apis_ipif_solr.api_views import STATEMENT_PARAM_KEYS
+from apis_ipif_solr.build import INDEX_CLASSES, _yield_solr_records
+from apis_ipif_solr.indexes import PERSON_CHUNK_SIZE, get_statement_extraction_plan
+from apis_ipif_solr.query_log import record_solr_queries
+from apis_ipif_solr.snapshot import BUILD_DATABASE, build_snapshot
+from apis_ipif_solr.warmup import request_in_process
+
+SOLR_REQUESTS_BUDGET = settings.APIS_IPIF_CONFIG.get("SOLR_REQUESTS_BUDGET", 2)
+BUILD_QUERY_BUDGETS = settings.APIS_IPIF_CONFIG.get("BUILD_QUERY_BUDGETS", {})
+
+LIST_ENDPOINTS = ("persons", "factoids", "statements", "sources")
+
+# A value for each statement param (labels, rather than URIs, which each
+# cost a lookup; see URI_PARAM_VALUES)
+STATEMENT_PARAM_VALUES = {
+    "statementType": "hasName",
+    "statementText": "Wien",
+    "relatesToPersons": "Mozart",
+    "memberOf": "Universität Wien",
+    "role": "birth",
+    "name": "Mozart",
+    "from": "1800",
+    "to": "1900",
+    "place": "Wien",
+}
+URI_PARAM_VALUES = {
+    "place": "https://www.geonames.org/2761369",
+    "memberOf": "https://d-nb.info/gnd/2024353-2",
+}
+
+SQL_LITERAL_REGEX = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+SQL_IN_LIST_REGEX = re.compile(r"IN \(\?(?:, \?)*\)")
+
+
+def normalize_sql(sql):
+    """The query without its values, so that the same query made for
+    different persons is counted together"""
+    return SQL_IN_LIST_REGEX.sub("IN (...)", SQL_LITERAL_REGEX.sub("?", sql))
+
+
+def list_params():
+    """Combinations of params to check each list view with"""
+    yield {}
+    for key in STATEMENT_PARAM_KEYS:
+        yield {key: STATEMENT_PARAM_VALUES[key]}
+    for key, value in URI_PARAM_VALUES.items():
+        yield {key: value}
+    for mode in (None, "and", "or", "independent"):
+        params = dict(STATEMENT_PARAM_VALUES)
+        if mode:
+            params["combineStatementFilters"] = mode
+        yield params
+    yield {"size": "0"}
+    yield {"page": "2", "size": "10"}
+
+
+def budget_requests(prefix):
+    """Paths of the list requests to check, by endpoint (as the detail
+    requests need ids from the list responses)"""
+    for endpoint in LIST_ENDPOINTS:
+        for params in list_params():
+            path = f"{prefix}{endpoint}/"
+            yield endpoint, f"{path}?{urlencode(params)}" if params else path
+    yield "persons", f"{prefix}persons/?" + urlencode(
+        {"relatesToPersons": "1", "relatesToPersonsDepth": "2"}
+    )
+
+
+def measure_solr_requests(prefix):
+    """The Solr queries made by each list request, and by a detail request
+    for the first result of each list (and for persons, by its uri too)"""
+    measured = {}
+    detail_paths = []
+    for endpoint, request_path in budget_requests(prefix):
+        with record_solr_queries() as queries:
+            response = request_in_process(request_path)
+        measured[request_path] = {"status": response.status_code, "queries": queries}
+        if request_path == f"{prefix}{endpoint}/" and response.status_code == 200:
+            results = json.loads(response.content).get(endpoint) or [{}]
+            if "@id" in results[0]:
+                detail_paths.append(f"{prefix}{endpoint}/{results[0]['@id']}")
+            if results[0].get("uris"):
+                detail_paths.append(f"{prefix}{endpoint}/{results[0]['uris'][0]}")
+    for request_path in detail_paths:
+        with record_solr_queries() as queries:
+            response = request_in_process(request_path)
+        measured[request_path] = {"status": response.status_code, "queries": queries}
+    return measured
+
+
+def measure_build_queries(persons, index_classes=None, chunk_size=PERSON_CHUNK_SIZE):
+    """The database queries made building the documents of each index for
+    the chunk of (up to chunk_size of) persons that takes the most, each chunk
+    starting from empty document caches, as in a build"""
+    measured = {}
+    with build_snapshot():
+        connection = connections[BUILD_DATABASE]
+        person_ids = list(persons.order_by("pk").values_list("pk", flat=True))
+        for index_class in index_classes or INDEX_CLASSES.values():
+            get_statement_extraction_plan.cache_clear()
+            measured[index_class.__name__] = []
+            for start in range(0, len(person_ids), chunk_size):
+                for cached_class in INDEX_CLASSES.values():
+                    cached_class._DOCUMENT_CACHE = {}
+                chunk = persons.filter(pk__in=person_ids[start : start + chunk_size])
+                with CaptureQueriesContext(connection) as context:
+                    for _ in _yield_solr_records(index_class, chunk):
+                        pass
+                if len(context.captured_queries) > len(measured[index_class.__name__]):
+                    measured[index_class.__name__] = [
+                        normalize_sql(query["sql"])
+                        for query in context.captured_queries
+                    ]
+    for cached_class in INDEX_CLASSES.values():
+        cached_class._DOCUMENT_CACHE = {}
+    return measured
+
+
+def query_diff(baseline, queries):
+    """Unified diff of the queries made (with how many times each was made)"""
+
+    def lines(queries):
+        counts = Counter(queries)
+        return [f"{counts[sql]:>6} x {sql}" for sql in sorted(counts)]
+
+    return "\n".join(
+        difflib.unified_diff(
+            lines(baseline), lines(queries), "budget", "now", lineterm=""
+        )
+    )
+
+
+def check_build_budgets(build_queries, budgets, baseline=None):
+    """Breaches of the build query budgets (per chunk of persons, by index class
+    name), as messages"""
+    breaches = []
+    for index_name, queries in build_queries.items():
+        budget = budgets.get(index_name)
+        if baseline:
+            budget = baseline["build_queries_per_chunk"].get(index_name, budget)
+        print(f"{index_name}: {len(queries)} queries per chunk (budget: {budget})")
+        if budget is None:
+            breaches.append(
+                f"{index_name} has no build query budget"
+                f" ({len(queries)} queries per chunk)"
+            )
+            continue
+        if len(queries) <= budget:
+            continue
+        message = (
+            f"{index_name} made {len(queries)} queries for a chunk of persons"
+            f" (budget {budget})"
+        )
+        if baseline and index_name in baseline["build_queries"]:
+            message += "\n" + query_diff(baseline["build_queries"][index_name], queries)
+        else:
+            message += "\n" + "\n".join(
+                f"{count:>6} x {sql}" for sql, count in Counter(queries).most_common(10)
+            )
+        breaches.append(message)
+    return breaches
+
+
+def check_solr_budgets(solr_requests, budget=SOLR_REQUESTS_BUDGET):
+    """Breaches of the Solr request budget, as messages"""
+    breaches = []
+    for request_path, measured in solr_requests.items():
+        queries = measured["queries"]
+        print(f"{len(queries)} Solr requests: {request_path} ({measured['status']})")
+        if len(queries) > budget:
+            breaches.append(
+                f"{request_path} made {len(queries)} Solr requests"
+                f" (budget {budget}):\n"
+                + "\n".join(json.dumps(query) for query in queries)
+            )
+    return breaches
+
+
+def budget_report(build_queries, solr_requests):
+    """What to save, to check later runs against"""
+    return {
+        "build_queries_per_chunk": {
+            index_name: len(queries) for index_name, queries in build_queries.items()
+        },
+        "build_queries": build_queries,
+        "solr_requests": {
+            request_path: len(measured["queries"])
+            for request_path, measured in solr_requests.items()
+        },
+    }
@@ -0,0 +1,166 @@
+import json
+import resource
+import tracemalloc
+
+from django.conf import settings
+from django.db.models.functions import Mod
+
+from apis_core.apis_entities.models import Person
+from apis_ipif_solr.chunking import MAX_CHUNK_BYTES, AdaptiveChunker
+from apis_ipif_solr import indexes
+from apis_ipif_solr.indexes import get_statement_extraction_plan
+from apis_ipif_solr.records import compact
+from apis_ipif_solr.rendered import (
+    RENDERED_DOCUMENTS,
+    RENDERED_FIELD,
+    add_rendered_field,
+    render_document,
+)
+from apis_ipif_solr.snapshot import build_snapshot
+from apis_ipif_solr.solr_client import core_urls, get_backend, index_url
+from apis_ipif_solr.warmup import warm_up, warmup_requests
+
+# By name, in the same order as PySolaar.update would build them
+INDEX_CLASSES = {
+    index_class.__name__: index_class for index_class in indexes.INDEX_CLASSES
+}
+
+
+def select_persons(pk_from=None, pk_to=None, ids=None, shard=None):
+    """Returns the queryset of persons to build documents for.
+
+    - pk_from, pk_to: inclusive range of person pks
+    - ids: explicit iterable of person pks
+    - shard: tuple of (shard_index, shard_count); only persons where
+      pk % shard_count == shard_index are selected, so that a build can be
+      fanned out across machines
+    """
+    persons = Person.objects.all()
+    if pk_from is not None:
+        persons = persons.filter(pk__gte=pk_from)
+    if pk_to is not None:
+        persons = persons.filter(pk__lte=pk_to)
+    if ids is not None:
+        persons = persons.filter(pk__in=list(ids))
+    if shard is not None:
+        shard_index, shard_count = shard
+        persons = persons.annotate(ipif_shard=Mod("pk", shard_count)).filter(
+            ipif_shard=shard_index
+        )
+    return persons.order_by("pk")
+
+
+def peak_rss_mb():
+    """Peak resident set size of the build process so far, in MB
+    (ru_maxrss is given in kB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _yield_solr_records(index_class, persons, field_tuples=None):
+    """Yields each document prepared for Solr as a compact SolrRecord,
+    so that a chunk doesn't hold the dicts of its documents (sharing field
+    name tuples through field_tuples, see records.compact)"""
+    if field_tuples is None:
+        field_tuples = {}
+    for document in index_class.build_document_set(persons):
+        solr_document = document.doc_to_solr()
+        if RENDERED_DOCUMENTS:
+            solr_document[RENDERED_FIELD] = render_document(index_class, solr_document)
+        record = compact(solr_document, field_tuples)
+        # Pre-push nested documents so that Solr accepts that they're real!
+        yield from record.children
+        yield record
+
+
+def build_indexes(
+    index_classes=None,
+    persons=None,
+    max_chunk_size=5000,
+    trace_memory=False,
+    max_chunk_bytes=MAX_CHUNK_BYTES,
+):
+    """Builds documents for the given index classes (default: all of them) and
+    pushes them to Solr. If persons is None, all persons are used.
+
+    Documents are pushed in chunks of at most max_chunk_bytes (approximately)
+    and max_chunk_size documents, sized to how fast Solr takes them (see
+    chunking.py). Returns the throughput and chunk size stats of each index.
+
+    The documents are built from one snapshot of the BUILD_DATABASE (see
+    snapshot.py), however long the build takes.
+
+    Each index is pushed to its own core (see solr_client.index_url), and
+    committed once all its documents are pushed, so that the caches of its
+    core are only invalidated then (and those of other cores not at all).
+
+    With trace_memory, the peak memory allocated by Python while building and
+    pushing each chunk is traced (with tracemalloc, which slows the build) and
+    reported, alongside the peak RSS of the process.
+
+    Replaces PySolaar.update, which can only ever rebuild everything."""
+
+    if index_classes is None:
+        index_classes = INDEX_CLASSES.values()
+
+    # Work out the statement extraction plan afresh for this build
+    get_statement_extraction_plan.cache_clear()
+
+    # (The SQLite backend has no schema to change)
+    if RENDERED_DOCUMENTS and get_backend() == "solr":
+        for url in core_urls(index_class.__name__ for index_class in index_classes):
+            add_rendered_field(url)
+
+    if trace_memory:
+        tracemalloc.start()
+
+    pushed = 0
+    report = {}
+    # (Shared by the records of all the indexes, and dropped with the build)
+    field_tuples = {}
+    # (All the reads of the build are from one snapshot of BUILD_DATABASE)
+    with build_snapshot():
+        for index_class in index_classes:
+            solr = index_class.QuerySet._solr
+            # (Each index gets its own chunker, as its documents and core differ)
+            chunker = AdaptiveChunker(
+                max_bytes=max_chunk_bytes, max_docs=max_chunk_size
+            )
+            for records, size in chunker.chunks(
+                _yield_solr_records(index_class, persons, field_tuples)
+            ):
+                chunker.push(solr, records, size)
+                pushed += len(records)
+                memory = f"peak RSS: {peak_rss_mb():.1f} MB"
+                if trace_memory:
+                    _, chunk_peak = tracemalloc.get_traced_memory()
+                    tracemalloc.reset_peak()
+                    memory += (
+                        f", traced peak of this chunk: {chunk_peak / 2**20:.1f} MB"
+                    )
+                print(
+                    f"Pushed {pushed} documents (chunk of {len(records)}, "
+                    f"{size / 2**10:.0f} KB; "
+                    f"next chunk {chunker.budget / 2**10:.0f} KB; {memory})"
+                )
+            solr.commit()
+            print(
+                f"Committed {index_class.__name__} ({index_url(index_class.__name__)})"
+            )
+            report[index_class.__name__] = chunker.report()
+
+    if trace_memory:
+        tracemalloc.stop()
+
+    # And reset all the document caches (not only the ones built, as
+    # embedded documents are cached by their own class)
+    for index_class in INDEX_CLASSES.values():
+        index_class._DOCUMENT_CACHE = {}
+
+    print(f"Build finished: {pushed} documents, peak RSS {peak_rss_mb():.1f} MB")
+    for index_name, index_report in report.items():
+        print(f"{index_name}: {json.dumps(index_report)}")
+
+    if settings.APIS_IPIF_CONFIG.get("WARMUP_AFTER_BUILD", False):
+        warm_up(warmup_requests())
+
+    return report
@@ -0,0 +1,143 @@
+"""Chunking of the documents a build pushes to Solr by their size in bytes.
+
+Documents differ in size by orders of magnitude (a SourceIndex document of a
+popular reference embeds all its factoids and statements; a statement on an
+attribute is a few fields), so a fixed number of documents per push makes
+either huge requests that time out or many tiny ones. Each index is instead
+pushed in chunks of about a budget of (approximate, serialized) bytes, at most
+MAX_CHUNK_BYTES and at most MAX_CHUNK_SIZE documents. The budget is adjusted
+as the build goes: halved when a push takes longer than CHUNK_TARGET_SECONDS
+or fails (the failed chunk is then pushed again in halves), and grown by half
+again when pushes take less than half of that."""
+
+import datetime
+import statistics
+import time
+
+from django.conf import settings
+import pysolr
+
+from apis_ipif_solr.solr_client import SolrUnavailable
+
+MAX_CHUNK_BYTES = settings.APIS_IPIF_CONFIG.get("MAX_CHUNK_BYTES", 10 * 2**20)
+CHUNK_TARGET_SECONDS = settings.APIS_IPIF_CONFIG.get("CHUNK_TARGET_SECONDS", 5)
+# The budget never goes below this (a single larger document is still pushed)
+MIN_CHUNK_BYTES = 64 * 2**10
+
+
+def value_size(value):
+    """Approximate length of value in JSON"""
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, (tuple, list)):
+        return sum(value_size(v) + 1 for v in value) + 2
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return 22
+    return len(str(value))
+
+
+def record_size(record):
+    """Approximate length in bytes of a SolrRecord (see records.py) in JSON,
+    with its child documents"""
+    size = 2
+    for field, value in zip(record.fields, record.values):
+        size += len(field) + value_size(value) + 4
+    if record.children:
+        size += 10 + sum(record_size(child) + 1 for child in record.children)
+    return size
+
+
+class AdaptiveChunker:
+    """Groups records into chunks of about budget bytes (and at most
+    max_docs documents), adjusting the budget from how long each push takes.
+    Also keeps the stats of each push, for the build report."""
+
+    def __init__(
+        self,
+        max_bytes=MAX_CHUNK_BYTES,
+        max_docs=5000,
+        target_seconds=CHUNK_TARGET_SECONDS,
+    ):
+        self.max_bytes = max_bytes
+        self.max_docs = max_docs
+        self.target_seconds = target_seconds
+        # Start small, and grow while Solr keeps up
+        self.budget = max(MIN_CHUNK_BYTES, max_bytes // 4)
+        self.pushes = []  # (documents, bytes, seconds) of each push
+        self.failures = 0
+
+    def chunks(self, records):
+        """Yields (records, size in bytes) chunks of records. The budget is
+        read as each chunk fills, so a push adjusts the chunks after it."""
+        chunk = []
+        chunk_bytes = 0
+        for record in records:
+            size = record_size(record)
+            if chunk and (
+                chunk_bytes + size > self.budget or len(chunk) >= self.max_docs
+            ):
+                yield chunk, chunk_bytes
+                chunk = []
+                chunk_bytes = 0
+            chunk.append(record)
+            chunk_bytes += size
+        if chunk:
+            yield chunk, chunk_bytes
+
+    def record_push(self, documents, size, seconds):
+        self.pushes.append((documents, size, seconds))
+        if seconds > self.target_seconds:
+            self.budget = max(MIN_CHUNK_BYTES, self.budget // 2)
+        elif seconds < self.target_seconds / 2:
+            self.budget = min(self.max_bytes, self.budget * 3 // 2)
+
+    def record_failure(self):
+        self.failures += 1
+        self.budget = max(MIN_CHUNK_BYTES, self.budget // 2)
+
+    def push(self, solr, records, size):
+        """Pushes a chunk of records (without committing). If Solr fails
+        (after the session's own retries), shrinks the budget and pushes the
+        chunk again in halves, until a single document fails."""
+        start = time.perf_counter()
+        try:
+            solr.add_records(records, commit=False)
+        except SolrUnavailable:
+            raise
+        except pysolr.SolrError as e:
+            self.record_failure()
+            if len(records) == 1:
+                raise
+            print(f"Push of {len(records)} documents failed ({e}); splitting it")
+            half = len(records) // 2
+            for part in (records[:half], records[half:]):
+                self.push(solr, part, sum(record_size(record) for record in part))
+            return
+        self.record_push(len(records), size, time.perf_counter() - start)
+
+    def report(self):
+        """Throughput and chunk size stats of the pushes so far"""
+        if not self.pushes:
+            return {"chunks": 0, "failures": self.failures}
+        documents, sizes, seconds = zip(*self.pushes)
+        total_seconds = max(sum(seconds), 1e-6)
+        return {
+            "chunks": len(self.pushes),
+            "documents": sum(documents),
+            "bytes": sum(sizes),
+            "push_seconds": round(total_seconds, 2),
+            "documents_per_second": round(sum(documents) / total_seconds, 1),
+            "mb_per_second": round(sum(sizes) / 2**20 / total_seconds, 2),
+            "chunk_documents": {
+                "min": min(documents),
+                "median": statistics.median(documents),
+                "max": max(documents),
+            },
+            "chunk_bytes": {
+                "min": min(sizes),
+                "median": statistics.median(sizes),
+                "max": max(sizes),
+            },
+            "final_budget_bytes": self.budget,
+            "failures": self.failures,
+        }
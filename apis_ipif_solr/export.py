@@ -0,0 +1,66 @@
+import itertools
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+from apis_ipif_solr.api_views import LIST_FILTERS, IPIFView
+from apis_ipif_solr.solr_client import (
+    as_queryset,
+    load_results,
+    search_params,
+    select,
+)
+
+EXPORT_BATCH_SIZE = settings.APIS_IPIF_CONFIG.get("EXPORT_BATCH_SIZE", 500)
+
+
+def export_params(queryset, cursor_mark, batch_size=EXPORT_BATCH_SIZE):
+    """Params for fetching the batch of documents after cursor_mark
+    (cursors need a sort on the unique key, i.e. id)"""
+    return {
+        **search_params(queryset, rows=batch_size),
+        "sort": "id asc",
+        "cursorMark": cursor_mark,
+    }
+
+
+def iterate_export_batches(queryset, batch_size=EXPORT_BATCH_SIZE):
+    """Yields all documents matching the queryset, a batch at a time,
+    following Solr's cursorMark (so deep pages cost no more than the first)"""
+    queryset = as_queryset(queryset)
+    cursor_mark = "*"
+    while True:
+        # (Not using pysolr's search, which passes a second argument to
+        # the results class for cursor queries, which PySolaar's can't take)
+        decoded = select(queryset, export_params(queryset, cursor_mark, batch_size))
+        yield load_results(queryset, decoded)
+        if decoded["nextCursorMark"] == cursor_mark:
+            return
+        cursor_mark = decoded["nextCursorMark"]
+
+
+def ndjson_line(document):
+    return json.dumps(document, cls=JSONEncoder, ensure_ascii=False) + "\n"
+
+
+class ExportView(IPIFView):
+    def get(self, request, ipif_type, format=None):
+        """
+        Stream all persons/factoids/statements/sources matching the
+        params of the list view (without page and size) as NDJSON
+        """
+        queryset = LIST_FILTERS[ipif_type](request.query_params)
+        batches = iterate_export_batches(queryset)
+        # Fetch the first batch now, so that if Solr can't be queried we can
+        # still return a 503, rather than failing in the middle of the stream
+        first_batch = next(batches)
+        return StreamingHttpResponse(
+            (
+                ndjson_line(document)
+                for batch in itertools.chain([first_batch], batches)
+                for document in batch
+            ),
+            content_type="application/x-ndjson",
+        )
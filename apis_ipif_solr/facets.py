@@ -0,0 +1,126 @@
+import json
+import re
+
+from django.conf import settings
+from pysolaar.utils.encoders_and_decoders import encode_field_name
+from rest_framework.response import Response
+
+from apis_ipif_solr.api_views import (
+    FROM_DEFAULT,
+    LIST_FILTERS,
+    TO_DEFAULT,
+    IPIFView,
+    parse_date_param,
+)
+from apis_ipif_solr.indexes import PersonIndex, StatementIndex
+from apis_ipif_solr.params import InvalidParam
+from apis_ipif_solr.solr_client import as_queryset, search_params, select
+
+# Suffix of the (string, docValues) copies of text fields that Solr facets on;
+# "_str" is what Solr's default schemaless config creates
+FACET_FIELD_SUFFIX = settings.APIS_IPIF_CONFIG.get("FACET_FIELD_SUFFIX", "_str")
+FACET_LIMIT = settings.APIS_IPIF_CONFIG.get("FACET_LIMIT", 100)
+
+# Facet name: statement field faceted on
+STATEMENT_FACET_FIELDS = {
+    "statementType": "statementType__label",
+    "role": "role__label",
+    "memberOf": "memberOf__label",
+    "place": "places__label",
+}
+STATEMENT_DATE_FIELD = "date__sortdate_dt"
+DEFAULT_DATE_GAP = "+10YEARS"
+DATE_GAP_REGEX = re.compile(r"^\+[1-9][0-9]*(YEARS|MONTHS|DAYS)$")
+
+# Facets on persons count persons (i.e. blocks) with matching ST children
+PERSON_STATEMENT_DOMAIN = {
+    "blockChildren": "*:* -_nest_path_:*",
+    "filter": "+_nest_path_:\\/_doc +pysolaar_type_nested:*ST +pysolaar_type_nested:PersonIndex*",
+}
+
+
+def solr_date(value, default):
+    return parse_date_param(value, default).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def statement_facets(field_prefix, params):
+    """JSON Facet API facets over the statement fields (named with field_prefix),
+    with a range facet over dates between the from and to params (or the same
+    defaults as build_statement_filter_q_list) in buckets of dateGap"""
+    gap = params.get("dateGap", DEFAULT_DATE_GAP)
+    if not DATE_GAP_REGEX.match(gap):
+        raise InvalidParam(f"dateGap should be e.g. {DEFAULT_DATE_GAP}, not {gap}")
+
+    facets = {
+        facet_name: {
+            "type": "terms",
+            "field": encode_field_name(field_prefix, field) + FACET_FIELD_SUFFIX,
+            "limit": FACET_LIMIT,
+            "mincount": 1,
+        }
+        for facet_name, field in STATEMENT_FACET_FIELDS.items()
+    }
+    facets["date"] = {
+        "type": "range",
+        "field": encode_field_name(field_prefix, STATEMENT_DATE_FIELD),
+        "start": solr_date(params.get("from", "1000"), FROM_DEFAULT),
+        "end": solr_date(params.get("to", "2022"), TO_DEFAULT),
+        "gap": gap,
+    }
+    return facets
+
+
+def facet_params(ipif_type, params):
+    """The queryset and Solr params for facets on the statements (counting
+    statements) or persons (counting persons, by their statements) that
+    match the list view params"""
+    queryset = as_queryset(LIST_FILTERS[ipif_type](params))
+    if ipif_type == "statements":
+        facets = statement_facets(StatementIndex.QuerySet.pysolaar_type, params)
+    else:
+        facets = statement_facets(
+            encode_field_name(PersonIndex.QuerySet.pysolaar_type, "ST"), params
+        )
+        for facet in facets.values():
+            facet["domain"] = PERSON_STATEMENT_DOMAIN
+            facet["facet"] = {"persons": "uniqueBlock(_root_)"}
+    return (
+        queryset,
+        {**search_params(queryset, rows=0), "json.facet": json.dumps(facets)},
+    )
+
+
+def unpack_facets(decoded, ipif_type):
+    """Converts Solr's facet response to lists of {value, count},
+    where count is the number of persons for person facets"""
+    solr_facets = decoded.get("facets", {})
+    facets = {}
+    for facet_name in [*STATEMENT_FACET_FIELDS, "date"]:
+        facets[facet_name] = [
+            {
+                "value": bucket["val"],
+                "count": (
+                    bucket["persons"] if ipif_type == "persons" else bucket["count"]
+                ),
+            }
+            for bucket in solr_facets.get(facet_name, {}).get("buckets", [])
+        ]
+    return {
+        "protocol": {"totalHits": decoded["response"]["numFound"]},
+        "facets": facets,
+    }
+
+
+class FacetsView(IPIFView):
+    def get(self, request, ipif_type, format=None):
+        """
+        Get counts of statements (or persons, by their statements) for each
+        statementType, role, memberOf and place label, and for each date range.
+
+        Takes the same params as the statements (or persons) list view, plus:
+
+            dateGap     size of date ranges, e.g. +10YEARS (the default),
+                        +1YEARS, +6MONTHS; ranges run from `from` to `to`
+        """
+        queryset, solr_params = facet_params(ipif_type, request.query_params)
+        return Response(unpack_facets(select(queryset, solr_params), ipif_type))
@@ -0,0 +1,66 @@
+from django.conf import settings
+from pysolaar import Q
+from pysolaar.utils.encoders_and_decoders import decode_id, encode_field_name
+
+from apis_ipif_solr.indexes import PersonIndex
+from apis_ipif_solr.params import InvalidParam
+from apis_ipif_solr.solr_client import as_queryset, select
+from apis_ipif_solr.uris import person_q
+
+GRAPH_MAX_DEPTH = settings.APIS_IPIF_CONFIG.get("GRAPH_MAX_DEPTH", 3)
+GRAPH_MAX_PERSONS = settings.APIS_IPIF_CONFIG.get("GRAPH_MAX_PERSONS", 1000)
+
+RELATED_PERSONS_FIELD = encode_field_name(
+    PersonIndex.QuerySet.pysolaar_type, "relatedPersons_ss"
+)
+
+
+def graph_params(person, depth):
+    """Solr params for a graph query finding the persons within depth hops of
+    the person with the given id or uri (not including the person themselves).
+
+    Each person document lists the ids of the persons it is related to in
+    relatedPersons_ss, so the traversal follows those to the ids of other
+    person documents. (As relations are listed on both persons, the graph is
+    undirected, and which field is from and which is to makes no difference.)"""
+    if not 1 <= depth <= GRAPH_MAX_DEPTH:
+        raise InvalidParam(
+            f"relatesToPersonsDepth must be between 1 and {GRAPH_MAX_DEPTH}"
+        )
+    root = as_queryset(PersonIndex.filter(person_q(person)))
+    return {
+        "q": (
+            f"{{!graph from=id to={RELATED_PERSONS_FIELD} maxDepth={depth}"
+            f" returnRoot=false}}{root._prepare_qs()}"
+        ),
+        "fl": "id",
+        "rows": GRAPH_MAX_PERSONS,
+    }
+
+
+def unpack_graph_response(decoded):
+    if decoded["response"]["numFound"] > GRAPH_MAX_PERSONS:
+        raise InvalidParam(
+            f"more than {GRAPH_MAX_PERSONS} persons are related at this depth;"
+            " try a smaller relatesToPersonsDepth"
+        )
+    return [decode_id(doc["id"]) for doc in decoded["response"]["docs"]]
+
+
+def related_person_ids(person, depth):
+    """Ids of the persons within depth hops of the person with the given id or uri"""
+    return unpack_graph_response(select(PersonIndex, graph_params(person, depth)))
+
+
+def person_ids_q(person_ids):
+    """Matches the persons with person_ids, in a single terms query (an OR of a
+    clause per person, of up to GRAPH_MAX_PERSONS clauses, would come close to
+    Solr's maxBooleanClauses, 1024 by default)"""
+    return Q(
+        # (No person has the id -1, so if there are no person_ids, this
+        # matches nothing)
+        children=[Q(id=person_id) for person_id in person_ids or ["-1"]],
+        # (Each child compiles to "id:<encoded id>")
+        op=lambda compiled: '_query_:"{!terms f=id}%s"'
+        % ",".join(term.partition(":")[2] for term in compiled),
+    )
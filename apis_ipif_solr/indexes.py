@@ -13,22 +13,50 @@ from pysolaar.document import (
     JsonChildDocument,
     SplattedChildDocument,
 )
+from pysolaar.utils.encoders_and_decoders import encode_id
+from collections import namedtuple
 import copy
 import datetime
+from functools import lru_cache
 import hashlib
-import re
 import json
+import re
 
 from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
+from django.db.models import prefetch_related_objects
 from django.urls import reverse
 from apis_core.apis_entities.models import Person
 from reversion.models import Version
 from apis_bibsonomy.models import Reference
 import zlib
 
+from apis_ipif_solr.solr_client import lazy_solr_client
+
+
+PySolaar.configure_pysolr(pysolr_object=lazy_solr_client())
 
-PySolaar.configure_pysolr(settings.APIS_IPIF_CONFIG.get("URL"), always_commit=True)
+# Number of persons fetched from the database at a time when building
+PERSON_CHUNK_SIZE = settings.APIS_IPIF_CONFIG.get("PERSON_CHUNK_SIZE", 500)
+
+# Person fields of these types are turned into statements by StatementIndex
+STATEMENT_ATTRIBUTE_FIELD_TYPES = {
+    "CharField",
+    "DateField",
+    "DateTimeField",
+    "IntegerField",
+    "FloatField",
+    "ForeignKey",
+}
+
+# Which attribute fields make a statement, and the kind of statement they make
+ATTRIBUTE_STATEMENT_ROLES = {
+    "name": "hasName",
+    "first_name": "hasName",
+    "gender": "gender",
+    "start_date": "birth",
+    "end_date": "death",
+}
 
 
 STATEMENT_REF_DESCRIPTION = (
@@ -38,6 +66,391 @@ STATEMENT_REF_DESCRIPTION = (
 )
 
 
+def person_build_fields():
+    """Names of the Person columns actually read by the builders (other columns,
+    e.g. long text fields, are deferred)"""
+    return ["source"] + [
+        f.name
+        for f in Person._meta.fields
+        if type(f).__name__ in STATEMENT_ATTRIBUTE_FIELD_TYPES
+    ]
+
+
+StatementExtractionPlan = namedtuple(
+    "StatementExtractionPlan",
+    [
+        "relation_models",  # (model, model name, fields to select_related)
+        "attribute_fields",  # (Person field, statement role)
+        "vocabulary_fields",  # names of Person m2m fields to apis_vocabularies
+    ],
+)
+
+
+@lru_cache(maxsize=None)
+def get_statement_extraction_plan():
+    """Works out from the models what StatementIndex extracts from each person.
+
+    None of this changes between persons, so it is done once per build
+    (the build clears this cache before starting) instead of once per
+    (person, source)."""
+
+    relation_models = []
+    # Get relation types for a person, exclude PersonPerson as more complex (tackled separately)
+    for relation_type in ContentType.objects.filter(
+        app_label="apis_relations", model__icontains="person"
+    ).exclude(model="personperson"):
+        model = relation_type.model_class()
+        related_fields = [
+            f.name
+            for f in model._meta.fields
+            if f.is_relation
+            and (f.name == "relation_type" or f.name.startswith("related_"))
+        ]
+        relation_models.append((model, model.__name__, related_fields))
+
+    attribute_fields = [
+        (f, ATTRIBUTE_STATEMENT_ROLES[f.name])
+        for f in Person._meta.fields
+        if type(f).__name__ in STATEMENT_ATTRIBUTE_FIELD_TYPES
+        and f.name.lower() not in {"source", "status"}
+        and f.name in ATTRIBUTE_STATEMENT_ROLES
+    ]
+
+    vocabulary_fields = [
+        field_set.name
+        for field_set in Person._meta.many_to_many
+        if str(field_set.related_model.__module__).endswith("apis_vocabularies.models")
+        and not field_set.name.endswith("set")
+    ]
+
+    return StatementExtractionPlan(relation_models, attribute_fields, vocabulary_fields)
+
+
+def get_revisions_by_object_id(model, object_ids):
+    """Maps the (string) object ids of instances of model to a tuple of their first
+    and last revisions, fetching the versions of all of them in one query"""
+    revisions = {}
+    for version in (
+        Version.objects.get_for_model(model)
+        .filter(object_id__in=[str(object_id) for object_id in object_ids])
+        .select_related("revision__user")
+        .order_by("revision__date_created")
+    ):
+        first, _ = revisions.get(version.object_id, (version.revision, None))
+        revisions[version.object_id] = (first, version.revision)
+    return revisions
+
+
+def set_revision_fields(item, revisions):
+    """Sets created/modified fields from a (first, last) revisions tuple"""
+    if revisions:
+        first, last = revisions
+        item["createdBy"] = str(first.user)
+        item["createdWhen"] = first.date_created
+        item["modifiedBy"] = str(last.user)
+        item["modifiedWhen"] = last.date_created
+
+
+def set_date_range(item, start, end):
+    """Sets the start and end dates of a statement item, which the from and to
+    params are compared with (a statement with only one of the dates is taken
+    to be on that date)"""
+    item["date"]["start_dt"] = start or end
+    item["date"]["end_dt"] = end or start
+
+
+def flatten_dict_fields(item):
+    """The item with each dict field flattened into a field per key (e.g. date into
+    date__sortdate_dt, date__label...), named as PySolaar would store them.
+
+    Flattened here, the keys can be picked one by one in store_document_fields.
+    (PySolaar flattens dicts with a 'copy' of the Meta class, which is the class
+    itself, so after the first dict it stops selecting fields altogether)"""
+    flat = {}
+    for key, value in item.items():
+        if isinstance(value, dict):
+            flat.update({f"{key}__{sub_key}": v for sub_key, v in value.items()})
+        else:
+            flat[key] = value
+    return flat
+
+
+# Statement fields filtered on by the statement params (see
+# api_views.build_statement_filter_q_list). Statements nested in persons,
+# factoids and sources store only these and relatesToPersons besides their id
+# (and createdBy and modifiedBy, where the st param filters on them)
+FILTERED_STATEMENT_FIELDS = DocumentFields(
+    statementType__uri=True,
+    statementType__label=True,
+    name=True,
+    role__uri=True,
+    role__label=True,
+    date__sortdate_dt=True,
+    date__start_dt=True,
+    date__end_dt=True,
+    places__uris=True,
+    places__label=True,
+    places__id_s=True,
+    memberOf__uri=True,
+    memberOf__label=True,
+    memberOf__id_s=True,
+    statementText=True,
+)
+
+
+def get_person_person_model():
+    return ContentType.objects.get_by_natural_key(
+        "apis_relations", "personperson"
+    ).model_class()
+
+
+StatementRelation = namedtuple(
+    "StatementRelation",
+    [
+        "relation_type_name",  # e.g. "PersonPlace", or "PersonPerson"
+        "A_or_B",  # whether the person is A or B in a PersonPerson relation
+        "relation",
+        "revisions",  # (first, last) revisions, see get_revisions_by_object_id
+    ],
+)
+
+
+def prefetch_statement_relations(persons, related_persons=True):
+    """Fetches the relations that StatementIndex makes statements of, and their
+    revisions, for all of persons at once (a query or two per relation model),
+    and sets each person's statement_relations to a list of its own, as
+    StatementRelations.
+
+    Otherwise each (person, source) would query each relation model, and the
+    versions of each, and the PersonPerson relations of each relation type.
+
+    The persons related by PersonPerson relations are embedded in their
+    statements, so with related_persons, what they are built from is fetched
+    for those not in persons too, all at once (see prefetch_related_persons)."""
+    person_relations = {person.pk: [] for person in persons}
+
+    plan = get_statement_extraction_plan()
+    for relation_model, relation_type_name, related_fields in plan.relation_models:
+        relation_queryset = relation_model.objects.filter(
+            related_person__in=list(person_relations)
+        ).select_related(*related_fields)
+        if relation_type_name == "PersonInstitution":
+            relation_queryset = relation_queryset.prefetch_related(
+                "related_institution__uri_set"
+            )
+        if relation_type_name == "PersonPlace":
+            relation_queryset = relation_queryset.prefetch_related(
+                "related_place__uri_set"
+            )
+        relations = list(relation_queryset)
+        revisions = get_revisions_by_object_id(
+            relation_model, [relation.pk for relation in relations]
+        )
+        for relation in relations:
+            person_relations[relation.related_person_id].append(
+                StatementRelation(
+                    relation_type_name, None, relation, revisions.get(str(relation.pk))
+                )
+            )
+
+    # PersonPerson relations, in which the person may be A or B (or both)
+    PersonPerson = get_person_person_model()
+    relations = list(
+        (
+            PersonPerson.objects.filter(related_personA__in=list(person_relations))
+            | PersonPerson.objects.filter(related_personB__in=list(person_relations))
+        )
+        .filter(relation_type__isnull=False)
+        .select_related("relation_type", "related_personA", "related_personB")
+    )
+    revisions = get_revisions_by_object_id(
+        PersonPerson, [relation.pk for relation in relations]
+    )
+    # (The related persons in persons are given what was fetched for them,
+    # and the others one object each, to fetch it for all at once)
+    persons_by_pk = {person.pk: person for person in persons}
+    other_persons = {}
+    for relation in relations:
+        for A_or_B in ("A", "B"):
+            related_person = getattr(relation, f"related_person{A_or_B}")
+            related_person = persons_by_pk.get(
+                related_person.pk
+            ) or other_persons.setdefault(related_person.pk, related_person)
+            setattr(relation, f"related_person{A_or_B}", related_person)
+    if related_persons and other_persons:
+        prefetch_related_persons(list(other_persons.values()))
+    for A_or_B in ("A", "B"):
+        for relation in relations:
+            person_pk = getattr(relation, f"related_person{A_or_B}_id")
+            if person_pk in person_relations:
+                person_relations[person_pk].append(
+                    StatementRelation(
+                        "PersonPerson",
+                        A_or_B,
+                        relation,
+                        revisions.get(str(relation.pk)),
+                    )
+                )
+
+    for person in persons:
+        person.statement_relations = person_relations[person.pk]
+
+
+def prefetch_person_revisions(persons):
+    """Sets each person's person_revisions to its (first, last) revisions (see
+    get_revisions_by_object_id), fetching those of all of persons at once"""
+    revisions = get_revisions_by_object_id(Person, [person.pk for person in persons])
+    for person in persons:
+        person.person_revisions = revisions.get(str(person.pk))
+
+
+def prefetch_related_persons(persons):
+    """Fetches what the PersonIndex documents of persons embedded in statements
+    (as related persons) are built from, for all of them at once, as
+    iterate_persons does for a chunk (but not the persons related to them in
+    turn, which aren't embedded as deeply)"""
+    prefetch_related_objects(
+        persons, "uri_set", *get_statement_extraction_plan().vocabulary_fields
+    )
+    prefetch_references(persons)
+    prefetch_person_revisions(persons)
+    prefetch_statement_relations(persons, related_persons=False)
+
+
+def get_person_revisions(person):
+    """The (first, last) revisions of person, as fetched with its chunk of
+    persons by iterate_persons (a person built on its own fetches its own)"""
+    if not hasattr(person, "person_revisions"):
+        prefetch_person_revisions([person])
+    return person.person_revisions
+
+
+def prefetch_source_objects(references):
+    """Sets on each reference the object ids and attributes of all the References
+    to its source (its bibs_url), which StatementIndex limits the statements of a
+    (person, source) to, fetching those of all of references at once"""
+    objects = {reference.bibs_url: (set(), set()) for reference in references}
+    for bibs_url, object_id, attribute in Reference.objects.filter(
+        bibs_url__in=list(objects)
+    ).values_list("bibs_url", "object_id", "attribute"):
+        objects[bibs_url][0].add(object_id)
+        objects[bibs_url][1].add(attribute)
+    for reference in references:
+        reference.source_object_ids, reference.source_attributes = objects[
+            reference.bibs_url
+        ]
+
+
+def prefetch_references(persons):
+    """Sets each person's references to the References (sources) of it, with
+    their source objects (see prefetch_source_objects), fetching those of all of
+    persons at once"""
+    person_references = {person.pk: [] for person in persons}
+    references = list(Reference.objects.filter(object_id__in=list(person_references)))
+    prefetch_source_objects(references)
+    for reference in references:
+        person_references[reference.object_id].append(reference)
+    for person in persons:
+        person.references = person_references[person.pk]
+
+
+def get_references(person):
+    """The References of person, as fetched with its chunk of persons by
+    iterate_persons (a person built on its own fetches its own)"""
+    if getattr(person, "references", None) is None:
+        prefetch_references([person])
+    return person.references
+
+
+def get_related_person_pks(person):
+    """pks of the persons related to person by PersonPerson relations,
+    whether person is A or B in the relation (read from its statement
+    relations, see prefetch_statement_relations)"""
+    if getattr(person, "statement_relations", None) is None:
+        prefetch_statement_relations([person])
+    return sorted(
+        {
+            getattr(relation, f"related_person{'B' if A_or_B == 'A' else 'A'}_id")
+            for relation_type_name, A_or_B, relation, _ in person.statement_relations
+            if relation_type_name == "PersonPerson"
+        }
+        - {person.pk}
+    )
+
+
+def source_identity(person, source):
+    """The id, label and uris of a (person, source) source document"""
+    doc = {}
+
+    # All APIS Persons have a None source, in addition to actual sources
+    # 'None' is for non-directly-attributed data created in APIS
+    if source is None:
+        if person.source_id:
+            doc["id"] = f"original_source_{person.source_id}"
+            doc["label"] = f"Original source  {person.source_id}"
+        else:
+            doc["id"] = f"original_source_for_{person.pk}"
+            doc["label"] = f"Original source for {str(person.source)}"
+
+        # TODO: this is a rubbish label!
+        doc["uris"] = [
+            reverse("apis:apis_api:source-detail", kwargs={"pk": person.source_id})
+        ]
+    else:
+        doc = {
+            "id": f"reference_{person.pk}_{hashlib.md5(str(source.bibs_url).encode('utf-8')).hexdigest()}"
+        }
+        bib = json.loads(source.bibtex)
+        doc["label"] = f"{bib['title']} ({getattr(bib, 'author', '-')})"
+        doc["uris"] = [source.bibs_url]
+    return doc
+
+
+def iterate_person_chunks(
+    persons=None, chunk_size=PERSON_CHUNK_SIZE, relations=False, related_entities=False
+):
+    """Yields lists of persons (all of them, or those in the given queryset)
+    ordered by pk, fetching chunk_size at a time by keyset pagination on pk, so
+    that memory stays bounded however large the table is. The references of
+    each chunk are fetched along with it (see prefetch_references); with
+    relations (for indexes that embed statements), so are its revisions and
+    relations (see prefetch_statement_relations), and with related_entities, the
+    places and institutions related to it (see prefetch_related_entities), so
+    that the queries made per chunk don't grow with its size.
+
+    The document caches of all indexes are emptied after each chunk, as these
+    would otherwise keep every document built so far."""
+    persons = (
+        (Person.objects.all() if persons is None else persons)
+        .only(*person_build_fields())
+        .prefetch_related("uri_set", *get_statement_extraction_plan().vocabulary_fields)
+    )
+    last_pk = None
+    while True:
+        chunk = persons.order_by("pk")
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        prefetch_references(chunk)
+        if relations:
+            prefetch_person_revisions(chunk)
+            prefetch_statement_relations(chunk)
+        if related_entities:
+            prefetch_related_entities(chunk)
+        yield chunk
+        last_pk = chunk[-1].pk
+        for index_class in INDEX_CLASSES:
+            index_class._DOCUMENT_CACHE = {}
+
+
+def iterate_persons(persons=None, **options):
+    """Yields persons one by one, as fetched by iterate_person_chunks"""
+    for chunk in iterate_person_chunks(persons, **options):
+        yield from chunk
+
+
 class FactoidIndex(PySolaar):
     class Meta:
         store_document_fields = DocumentFields(
@@ -45,8 +458,6 @@ class FactoidIndex(PySolaar):
             createdWhen=True,
             modifiedBy=True,
             modifiedWhen=True,
-            personId=True,
-            ST=ChildDocument(id=True, createdBy=True, modifiedBy=True,),
             S=ChildDocument(
                 id=True, uris=True, label=True, createdBy=True, modifiedBy=True,
             ),
@@ -57,14 +468,8 @@ class FactoidIndex(PySolaar):
                 id=True,
                 createdBy=True,
                 modifiedBy=True,
-                statementType=True,
-                name=True,
-                role=True,
-                date=True,
-                places=True,
                 relatesToPersons=SplattedChildDocument(id=True, uris=True,),
-                memberOf=True,
-                statementText=True,
+                **FILTERED_STATEMENT_FIELDS,
             ),
         )
 
@@ -89,12 +494,11 @@ class FactoidIndex(PySolaar):
             S=(ChildDocument(id=TransformKey("@id")) & TransformKey("source-ref")),
         )
 
-    def build_document_set(self):
+    def build_document_set(self, persons=None):
         """The Factoid document set identifiers are all combinations of
         Person x [Person->Sources, None]"""
-        for person in Person.objects.all():
-            references = Reference.objects.filter(object_id=person.pk)
-            for source in [*references, None]:
+        for person in iterate_persons(persons, relations=True):
+            for source in [*get_references(person), None]:
                 print(
                     f"Building FactoidIndex for [Person:{person.pk}, Source:{source}]"
                 )
@@ -107,7 +511,7 @@ class FactoidIndex(PySolaar):
 
         Required search fields:
 
-        - personId    ✅       # personId
+        - personId    ✅       # Person (id)
         - p           ✅       # Person --   all identifiers of person to whom factoid relates (inc. ID?)
         - statementId ✅       # Statements --  (just use ID) list of all the statement IDs attached to this factoid
         - st          ✅       # st (splat all the ) full-text search over all statements related to factoid (SplattedChildDocument)
@@ -130,14 +534,7 @@ class FactoidIndex(PySolaar):
         # instance, source = identifier
         person, source = identifier
         res = {}
-        ver = Version.objects.get_for_object(person).order_by("revision__date_created")
-        if ver:
-            res["createdBy"] = str(ver.first().revision.user)
-            res["createdWhen"] = ver.first().revision.date_created
-            res["modifiedBy"] = str(ver.last().revision.user)
-            res["modifiedWhen"] = ver.last().revision.date_created
-
-        res["personId"] = person.pk
+        set_revision_fields(res, get_person_revisions(person))
 
         # if "source-ref" not in skip_fields:
         """
@@ -150,6 +547,8 @@ class FactoidIndex(PySolaar):
         # if "statement-refs" not in skip_fields:
          """
 
+        # (ST is only stored by the factoids nested in other indexes, as the ids
+        # of their statement-refs; factoids themselves store Statements)
         res["ST"] = StatementIndex.items([(person, source)])
         res["S"] = SourceIndex.items([(person, source)])
         res["Statements"] = StatementIndex.items([(person, source)])
@@ -178,21 +577,16 @@ class PersonIndex(PySolaar):
             modifiedBy=True,
             modifiedWhen=True,
             uris=True,
+            relatedPersons_ss=True,  # Encoded ids of related persons, for graph queries
             S=ChildDocument(
                 id=True, uris=True, label=True, createdBy=True, modifiedBy=True,
             ),
-            ST=ChildDocument(  # TODO: NEED ALL THE FIELDS HERE IN ORDER TO SEARCH!!!
+            ST=ChildDocument(
                 id=True,
                 createdBy=True,
                 modifiedBy=True,
-                statementType=True,
-                name=True,
-                role=True,
-                date=True,
-                places=True,
                 relatesToPersons=SplattedChildDocument(id=True, uris=True,),
-                memberOf=True,
-                statementText=True,
+                **FILTERED_STATEMENT_FIELDS,
             ),
             F=ChildDocument(
                 id=True,
@@ -234,8 +628,8 @@ class PersonIndex(PySolaar):
             & TransformKey("factoid-refs"),
         )
 
-    def build_document_set(self):
-        for person in Person.objects.all():
+    def build_document_set(self, persons=None):
+        for person in iterate_persons(persons, relations=True):
             print(f"Building PersonIndex for [Person:{person.pk}]")
 
             yield self.build_document(person)
@@ -245,37 +639,19 @@ class PersonIndex(PySolaar):
     def build_document(self, instance):
         doc = {"id": str(instance.pk)}
         doc["label"] = f"{instance.name}, {instance.first_name} ({instance.pk})"
-        ver = Version.objects.get_for_object(instance).order_by(
-            "revision__date_created"
-        )
-        if ver:
-            doc["createdBy"] = str(ver.first().revision.user)
-            doc["createdWhen"] = ver.first().revision.date_created
-            doc["modifiedBy"] = str(ver.last().revision.user)
-            doc["modifiedWhen"] = ver.last().revision.date_created
-        doc["uris"] = [
-            str(x) for x in instance.uri_set.all().values_list("uri", flat=True)
+        set_revision_fields(doc, get_person_revisions(instance))
+        doc["uris"] = [str(x.uri) for x in instance.uri_set.all()]
+        doc["relatedPersons_ss"] = [
+            encode_id(PersonIndex.QuerySet.pysolaar_type, pk)
+            for pk in get_related_person_pks(instance)
         ]
 
-        doc["ST"] = StatementIndex.items(
-            [
-                (instance, source)
-                for source in [None, *Reference.objects.filter(object_id=instance.pk)]
-            ]
-        )
+        sources = [None, *get_references(instance)]
 
-        doc["S"] = SourceIndex.items(
-            [
-                (instance, source)
-                for source in [None, *Reference.objects.filter(object_id=instance.pk)]
-            ]
-        )
-        doc["F"] = FactoidIndex.items(
-            [
-                (instance, source)
-                for source in [None, *Reference.objects.filter(object_id=instance.pk)]
-            ]
-        )
+        doc["ST"] = StatementIndex.items([(instance, source) for source in sources])
+
+        doc["S"] = SourceIndex.items([(instance, source) for source in sources])
+        doc["F"] = FactoidIndex.items([(instance, source) for source in sources])
 
         return PersonIndex.Document(**doc)
 
@@ -289,20 +665,14 @@ class SourceIndex(PySolaar):
             modifiedWhen=True,
             label=True,
             uris=True,
-            ST=ChildDocument(  # TODO: NEED ALL THE FIELDS HERE IN ORDER TO SEARCH!!!
+            ST=ChildDocument(
                 id=True,
-                createdBy=True,
-                modifiedBy=True,
-                statementType=True,
-                name=True,
-                role=True,
-                date=True,
-                places=True,
                 relatesToPersons=SplattedChildDocument(id=True, uris=True,),
-                memberOf=True,
-                statementText=True,
+                **FILTERED_STATEMENT_FIELDS,
+            ),
+            P=ChildDocument(
+                id=True, uris=True, label=True, createdBy=True, modifiedBy=True
             ),
-            P=ChildDocument(id=True, uris=True, createdBy=True, modifiedBy=True),
             Factoids=ChildDocument(
                 id=True,
                 createdBy=True,
@@ -339,16 +709,15 @@ class SourceIndex(PySolaar):
             & TransformKey("factoid-refs"),
         )
 
-    def build_document_set(self):
+    def build_document_set(self, persons=None):
         """Iterate all persons; for each person, build_document returns iterable of sources
 
         TODO: NO NO NO: all the Sources are all the Reference objects and (Person,None) combinations.
         If we do it as currently (i.e. from person) then we risk duplicating sources ...
 
         """
-        for person in Person.objects.all():
-            references = Reference.objects.filter(object_id=person.pk)
-            for source in [*references, None]:
+        for person in iterate_persons(persons, relations=True):
+            for source in [*get_references(person), None]:
                 print(f"Building SourceIndex for [Person:{person.pk}, Source:{source}]")
                 yield self.build_document((person, source))
 
@@ -357,35 +726,14 @@ class SourceIndex(PySolaar):
     def build_document(self, identifier):
         person, source = identifier
 
-        doc = {}
-
-        # All APIS Persons have a None source, in addition to actual sources
-        # 'None' is for non-directly-attributed data created in APIS
-        if source is None:
-            if person.source_id:
-                doc["id"] = f"original_source_{person.source_id}"
-                doc["label"] = f"Original source  {person.source_id}"
-            else:
-                doc["id"] = f"original_source_for_{person.pk}"
-                doc["label"] = f"Original source for {str(person.source)}"
-
-            # TODO: this is a rubbish label!
-            doc["uris"] = [
-                reverse("apis:apis_api:source-detail", kwargs={"pk": person.source_id})
-            ]
-        else:
-            doc = {
-                "id": f"reference_{person.pk}_{hashlib.md5(str(source.bibs_url).encode('utf-8')).hexdigest()}"
-            }
-            bib = json.loads(source.bibtex)
-            doc["label"] = f"{bib['title']} ({getattr(bib, 'author', '-')})"
-            doc["uris"] = [source.bibs_url]
-        ver = Version.objects.get_for_object(person).order_by("revision__date_created")
-        if ver:
-            doc["createdBy"] = str(ver.first().revision.user)
-            doc["createdWhen"] = str(ver.first().revision.date_created)
-            doc["modifiedBy"] = str(ver.last().revision.user)
-            doc["modifiedWhen"] = str(ver.last().revision.date_created)
+        doc = source_identity(person, source)
+        revisions = get_person_revisions(person)
+        if revisions:
+            first, last = revisions
+            doc["createdBy"] = str(first.user)
+            doc["createdWhen"] = str(first.date_created)
+            doc["modifiedBy"] = str(last.user)
+            doc["modifiedWhen"] = str(last.date_created)
 
         if source is None:
             # If Source is None, get the Person-NoneSource combo -- by definition only one item
@@ -398,11 +746,17 @@ class SourceIndex(PySolaar):
         else:
             # Otherwise, there can be more than one Factoid related to this source (i.e. same source
             # but more than one person, so iterate persons if they are connected to this reference)
-            persons_associated_with_source = [
-                p
-                for p in Person.objects.all()
-                if source in Reference.objects.filter(object_id=p.pk)
-            ]
+            # (A Reference belongs to a single object, so rather than scanning all
+            # persons for it, look up the person it points to)
+            persons_associated_with_source = (
+                [person]
+                if source.object_id == person.pk
+                else list(
+                    Person.objects.filter(pk=source.object_id).only(
+                        *person_build_fields()
+                    )
+                )
+            )
 
             doc["Factoids"] = FactoidIndex.items(
                 [(p, source) for p in persons_associated_with_source]
@@ -429,14 +783,9 @@ class StatementIndex(PySolaar):
         store_document_fields = DocumentFields(
             id=True,
             uris=True,
-            statementType=True,
-            name=True,
-            role=True,
-            date=True,
-            places=True,
             relatesToPersons=JsonChildDocument(id=True, uris=True, label=True),
-            memberOf=True,
-            statementText=True,
+            **FILTERED_STATEMENT_FIELDS,
+            date__label=True,
             createdBy=True,
             createdWhen=True,
             modifiedBy=True,
@@ -446,8 +795,6 @@ class StatementIndex(PySolaar):
             ),
             F=ChildDocument(
                 id=True,
-                uris=True,
-                label=True,
                 createdBy=True,
                 modifiedBy=True,
                 Person=JsonChildDocument(id=True),
@@ -502,12 +849,11 @@ class StatementIndex(PySolaar):
             & TransformKey("factoid-refs"),
         )
 
-    def build_document_set(self):
+    def build_document_set(self, persons=None):
         """The Statement document set identifiers are all combinations of
         Person x [Person->Sources, None]"""
-        for person in Person.objects.all():
-            references = Reference.objects.filter(object_id=person.pk)
-            for source in [*references, None]:
+        for person in iterate_persons(persons, relations=True):
+            for source in [*get_references(person), None]:
                 print(
                     f"Building StatementIndex for [Person:{person.pk}, Source:{source}]"
                 )
@@ -520,11 +866,18 @@ class StatementIndex(PySolaar):
 
         item["name"] = None
         item["statementType"] = {"uri": None, "label": None}
-        item["memberOf"] = {"uri": None, "label": None}
-        item["places"] = {"uris": None, "label": None}
+        # (id_s: the id of the institution or place, which URI params are
+        # resolved to, see uris.py)
+        item["memberOf"] = {"uri": None, "label": None, "id_s": None}
+        item["places"] = {"uris": None, "label": None, "id_s": None}
         item["relatesToPersons"] = PersonIndex.items([])
         item["role"] = {"uri": None, "label": None}
-        item["date"] = {"sortdate_dt": None, "label": None}
+        item["date"] = {
+            "sortdate_dt": None,
+            "start_dt": None,
+            "end_dt": None,
+            "label": None,
+        }
         item["P"] = PersonIndex.items([instance])
         item["F"] = FactoidIndex.items([(instance, source)])
         item["S"] = SourceIndex.items([(instance, source)])
@@ -534,248 +887,353 @@ class StatementIndex(PySolaar):
 
         instance, _source = identifier
 
-        r_list = []
-
-        # Get relation types for a person, exclude PersonPerson as more complex (tackle below)
-        relation_types = ContentType.objects.filter(
-            app_label="apis_relations", model__icontains="person"
-        ).exclude(model="PersonPerson")
+        # What to extract is worked out once per build; from here on, this is just
+        # pulling data out of the rows
+        plan = get_statement_extraction_plan()
 
         if _source:
-            # If we have a source ID provided, look up that up in references
-            references = Reference.objects.filter(bibs_url=_source)
-
-        # Go through each relation type ('PersonInstitute', 'PersonPlace', 'PersonEvent'...)
-        # and get the specific relations of each type for the person instance
-        for relation_type in relation_types:
-
-            # If we provide a source to limit by, add that as a filter
-            if _source:
-                relation_queryset = relation_type.model_class().objects.filter(
-                    related_person=instance,
-                    pk__in=list(references.values_list("object_id", flat=True)),
-                )
-            # Otherwise get them all...
-            else:
-                relation_queryset = relation_type.model_class().objects.filter(
-                    related_person=instance
-                )
-
-            for relation in relation_queryset:
-
-                relation_type_name = relation_type.model_class().__name__
-                item = self._build_document_template(
-                    f"{instance.pk}_{relation_type_name}_{relation.pk}",
-                    instance,
-                    _source,
-                )
+            # If we have a source provided, look up the objects and attributes
+            # from it, as fetched with the references of the chunk of persons
+            if not hasattr(_source, "source_object_ids"):
+                prefetch_source_objects([_source])
+            source_object_ids = _source.source_object_ids
+            source_attributes = _source.source_attributes
+
+        # The relations of the person, of each type ('PersonInstitution',
+        # 'PersonPlace', 'PersonEvent'...), are fetched with its chunk of persons
+        # by iterate_persons; a person built on its own fetches its own
+        if getattr(instance, "statement_relations", None) is None:
+            prefetch_statement_relations([instance])
+        statement_relations = instance.statement_relations
+
+        for relation_type_name, A_or_B, relation, revisions in statement_relations:
+            # (PersonPerson relations are done below)
+            if relation_type_name == "PersonPerson":
+                continue
+
+            # If we provide a source to limit by, skip relations not from it
+            if _source and relation.pk not in source_object_ids:
+                continue
+
+            item = self._build_document_template(
+                f"{instance.pk}_{relation_type_name}_{relation.pk}",
+                instance,
+                _source,
+            )
 
-                item["statementType"][
-                    "uri"
-                ] = ""  # f"APIS_VOCAB/{relation.related_type_id}"  # TODO: proper vocab!
+            item["statementType"][
+                "uri"
+            ] = ""  # f"APIS_VOCAB/{relation.related_type_id}"  # TODO: proper vocab!
 
-                item["statementType"][
-                    "label"
-                ] = f"relatedTo{relation_type_name.replace('Person', '')}"
+            item["statementType"][
+                "label"
+            ] = f"relatedTo{relation_type_name.replace('Person', '')}"
 
-                item["role"]["label"] = (
-                    getattr(relation.relation_type, "reverse_name", None)
-                    or relation.relation_type.name
-                )
-                item["date"]["sortdate_dt"] = (
-                    relation.start_date
-                    or relation.end_date
-                    or item["date"]["sortdate_dt"]
-                )
+            item["role"]["label"] = (
+                getattr(relation.relation_type, "reverse_name", None)
+                or relation.relation_type.name
+            )
+            item["date"]["sortdate_dt"] = (
+                relation.start_date
+                or relation.end_date
+                or item["date"]["sortdate_dt"]
+            )
+            set_date_range(item, relation.start_date, relation.end_date)
 
-                item["date"]["label"] = (
-                    f"{relation.start_date}-{relation.end_date}"
-                    if relation.start_date and relation.end_date
-                    else str(relation.start_date)
-                )
+            item["date"]["label"] = (
+                f"{relation.start_date}-{relation.end_date}"
+                if relation.start_date and relation.end_date
+                else str(relation.start_date)
+            )
 
-                if relation_type_name == "PersonInstitution":
-                    item["memberOf"]["uri"] = [
-                        str(url) for url in relation.related_institution.uri_set.all()
-                    ] + [relation.related_institution.get_absolute_url()]
-                    item["memberOf"]["label"] = relation.related_institution.name
+            if relation_type_name == "PersonInstitution":
+                item["memberOf"]["uri"] = [
+                    str(url) for url in relation.related_institution.uri_set.all()
+                ] + [relation.related_institution.get_absolute_url()]
+                item["memberOf"]["label"] = relation.related_institution.name
+                item["memberOf"]["id_s"] = str(relation.related_institution.pk)
 
-                if relation_type_name == "PersonPlace":
-                    item["places"]["uris"] = [
-                        str(url) for url in relation.related_place.uri_set.all()
-                    ] + [relation.related_place.get_absolute_url()]
-                    item["places"]["label"] = relation.related_place.name
+            if relation_type_name == "PersonPlace":
+                item["places"]["uris"] = [
+                    str(url) for url in relation.related_place.uri_set.all()
+                ] + [relation.related_place.get_absolute_url()]
+                item["places"]["label"] = relation.related_place.name
+                item["places"]["id_s"] = str(relation.related_place.pk)
 
-                item["statementText"] = str(relation)
+            item["statementText"] = str(relation)
 
-                ver = Version.objects.get_for_object(relation).order_by(
-                    "revision__date_created"
-                )
-                if ver:
-                    item["createdBy"] = str(ver.first().revision.user)
-                    item["createdWhen"] = ver.first().revision.date_created
-                    item["modifiedBy"] = str(ver.last().revision.user)
-                    item["modifiedWhen"] = ver.last().revision.date_created
+            set_revision_fields(item, revisions)
 
-                yield StatementIndex.Document(**item)
+            yield StatementIndex.Document(**flatten_dict_fields(item))
 
         # Here we do same as above, for PersonPerson relations.
         # But obviously more complex as persons can be A or B in a relation
+        for relation_type_name, A_or_B, relation, revisions in statement_relations:
+            if relation_type_name != "PersonPerson":
+                continue
+
+            item = self._build_document_template(
+                f"{instance.pk}__PersonPerson_{relation.relation_type.pk}__{relation.pk}",
+                instance,
+                _source,
+            )
 
-        # Build specific relation sets, and assign whether instance is A or B in relation
-        for A_or_B, relation_set in [
-            *[
-                ("A", rel)
-                for rel in [
-                    relation_type_set.personperson_set.filter(
-                        related_personA=instance
-                    ).all()
-                    for relation_type_set in instance.personB_relationtype_set.all()
-                ]
-            ],
-            *[
-                ("B", rel)
-                for rel in [
-                    relation_type_set.personperson_set.filter(
-                        related_personB=instance
-                    ).all()
-                    for relation_type_set in instance.personA_relationtype_set.all()
-                ]
-            ],
-        ]:
-
-            # Iterate all the relations in each set
-            for relation in relation_set:
+            # Unpack related person, depending on role A or B
+            item["relatesToPersons"] = (
+                PersonIndex.items(relation.related_personB)
+                if A_or_B == "A"
+                else PersonIndex.items(relation.related_personA)
+            )
 
-                item = self._build_document_template(
-                    f"{instance.pk}__PersonPerson_{relation.relation_type.pk}__{relation.pk}",
-                    instance,
-                    _source,
-                )
+            item["statementType"][
+                "uri"
+            ] = ""  # f"APIS_VOCAB/{relation.vocab_name_id}"  # TODO: proper vocab!
 
-                # Unpack related person, depending on role A or B
-                item["relatesToPersons"] = (
-                    PersonIndex.items(relation.related_personB)
-                    if A_or_B == "A"
-                    else PersonIndex.items(relation.related_personA)
-                )
+            item["statementType"]["label"] = "RelatedToPerson"
+
+            item["role"]["label"] = (
+                relation.relation_type.name
+                if A_or_B == "A"
+                else relation.relation_type.name_reverse
+            )
+            item["date"]["sortdate_dt"] = (
+                relation.start_date
+                or relation.end_date
+                or item["date"]["sortdate_dt"]
+            )
+            set_date_range(item, relation.start_date, relation.end_date)
+            item["date"]["label"] = (
+                f"{relation.start_date}-{relation.end_date}"
+                if relation.start_date and relation.end_date
+                else relation.start_date_written
+                if relation.start_date_written
+                else str(relation.start_date)
+            )
 
-                item["statementType"][
-                    "uri"
-                ] = ""  # f"APIS_VOCAB/{relation.vocab_name_id}"  # TODO: proper vocab!
+            item["statement-text"] = str(relation)
 
-                item["statementType"]["label"] = "RelatedToPerson"
+            set_revision_fields(item, revisions)
 
-                item["role"]["label"] = (
-                    relation.relation_type.name
-                    if A_or_B == "A"
-                    else relation.relation_type.name_reverse
-                )
+            yield StatementIndex.Document(**flatten_dict_fields(item))
+
+        # Attribute fields of the person itself:
+        # - name -- apis_metainfo.TempEntityClass.name
+        # - date-of-birth -- apis_metainfo.TempEntityClass.start_date
+        # - date-of-death -- apis_metainfo.TempEntityClass.end_date
+        # - first-name -- apis_entities.Person.first_name
+        # - gender -- apis_entities.Person.gender
+        for f, role in plan.attribute_fields:
+
+            item = self._build_document_template(
+                f"{instance.pk}_attrb_{f.name}", instance, _source
+            )
+
+            if role == "hasName":
+                item["statementType"]["uri"] = ""
+                item["statementType"]["label"] = "hasName"
+                item["role"]["label"] = f"has {f.name.replace('_', ' ')}"
+                item["name"] = f.value_to_string(instance)
+
+            if role == "gender":
+                item["statementType"]["uri"] = "statement_type_uri"
+                item["statementType"]["label"] = f.value_to_string(instance)
+                item["role"]["label"] = "gender"
+                item["statementText"] = f"has gender {f.value_to_string(instance)}"
+
+            if role in {"birth", "death"}:
+                item["statementType"]["uri"] = "statement_type_uri"
+                item["role"]["label"] = role
                 item["date"]["sortdate_dt"] = (
-                    relation.start_date
-                    or relation.end_date
-                    or item["date"]["sortdate_dt"]
-                )
-                item["date"]["label"] = (
-                    f"{relation.start_date}-{relation.end_date}"
-                    if relation.start_date and relation.end_date
-                    else relation.start_date_written
-                    if relation.start_date_written
-                    else str(relation.start_date)
+                    f.value_from_object(instance) or item["date"]["sortdate_dt"]
                 )
+                set_date_range(item, item["date"]["sortdate_dt"], None)
 
-                item["statement-text"] = str(relation)
+            yield StatementIndex.Document(**flatten_dict_fields(item))
 
-                ver = Version.objects.get_for_object(relation).order_by(
-                    "revision__date_created"
-                )
-                item["createdBy"] = str(ver.first().revision.user)
-                item["createdWhen"] = ver.first().revision.date_created
-                item["modifiedBy"] = str(ver.last().revision.user)
-                item["modifiedWhen"] = ver.last().revision.date_created
-
-                yield StatementIndex.Document(**item)
-
-        # Iterate over _meta.fields and then get the value
-        # calling .value_to_string on object for each _meta.field
-        for f in instance._meta.fields:
-            """
-            From this loop it seems we take:
-            - name -- apis_metainfo.TempEntityClass.name
-            - date-of-birth -- apis_metainfo.TempEntityClass.start_date
-            - date-of-death -- apis_metainfo.TempEntityClass.end_date
-            - first-name -- apis_entities.Person.first_name
-            - gender -- apis_entities.Person.gender
-
-            """
-            field_name = re.search(r"([A-Za-z]+)\'>", str(f.__class__)).group(1)
-            if field_name in [
-                "CharField",
-                "DateField",
-                "DateTimeField",
-                "IntegerField",
-                "FloatField",
-                "ForeignKey",
-            ] and f.name.lower() not in {"source", "status"}:
+        # Iterate vocabulary many-to-many fields
+        for field_name in plan.vocabulary_fields:
 
+            # If we limit by source, skip the field
+            if _source and field_name not in source_attributes:
+                continue
+
+            # Meta fields have more than one value (potentially), so iterate...
+            for field in getattr(instance, field_name).all():
                 item = self._build_document_template(
-                    f"{instance.pk}_attrb_{f.name}", instance, _source
+                    f"{instance.pk}_m2m_{field_name}_{field.pk}", instance, _source,
                 )
+                item["statementType"] = {"uri": "", "label": field.name}
 
-                if f.name in {"name", "first_name"}:
-                    item["statementType"]["uri"] = ""
-                    item["statementType"]["label"] = "hasName"
-                    item["role"]["label"] = f"has {f.name.replace('_', ' ')}"
-                    item["name"] = f.value_to_string(instance)
-
-                if f.name == "gender":
-                    item["statementType"]["uri"] = "statement_type_uri"
-                    item["statementType"]["label"] = f.value_to_string(instance)
-                    item["role"]["label"] = "gender"
-                    item["statementText"] = f"has gender {f.value_to_string(instance)}"
-
-                if f.name == "start_date":
-                    item["statementType"]["uri"] = "statement_type_uri"
-                    item["role"]["label"] = "birth"
-                    item["date"]["sortdate_dt"] = (
-                        f.value_from_object(instance) or item["date"]["sortdate_dt"]
-                    )
+                item["role"] = {"uri": "NONE", "label": field_name}
 
-                if f.name == "end_date":
-                    item["statementType"]["uri"] = "statement_type_uri"
-                    item["role"]["label"] = "death"
-                    item["date"]["sortdate_dt"] = (
-                        f.value_from_object(instance) or item["date"]["sortdate_dt"]
-                    )
+                yield StatementIndex.Document(**flatten_dict_fields(item))
 
-                if item["role"]["label"]:
-                    yield StatementIndex.Document(**item)
-
-        # Iterate many to many-to-many fields
-        for field_set in instance._meta.many_to_many:
-            if str(field_set.related_model.__module__).endswith(
-                "apis_vocabularies.models"
-            ) and not field_set.name.endswith("set"):
-
-                # If we limit by source, skip the field
-                if _source:
-                    if field_set.name not in list(
-                        references.values_list("attribute", flat=True)
-                    ):
-                        continue
-
-                # Meta fields have more than one value (potentially), so iterate...
-                for field in getattr(instance, field_set.name).all():
-                    item = self._build_document_template(
-                        f"{instance.pk}_m2m_{field_set.name}_{field.pk}",
-                        instance,
-                        _source,
-                    )
-                    item["statementType"] = {"uri": "", "label": field.name}
 
-                    item["role"] = {"uri": "NONE", "label": field_set.name}
+def suggest_terms(label):
+    """The lowercased label, and each of its tails starting at a word,
+    so that a prefix matches the start of any word of the label
+    (e.g. "mozart, wolfgang (12)", "wolfgang (12)" and "12)")"""
+    label = label.casefold()
+    return [label[match.start() :] for match in re.finditer(r"\w+", label)]
+
+
+# Kinds of entities (besides persons) related to persons, with the relation
+# model and field relating them: (kind, relation model name, related field)
+RELATED_ENTITY_KINDS = (
+    ("place", "personplace", "related_place"),
+    ("memberOf", "personinstitution", "related_institution"),
+)
+
 
-                    yield StatementIndex.Document(**item)
+def prefetch_related_entities(persons):
+    """Sets each person's related_entities to a dict of the entities (e.g. places)
+    related to it, by kind (see RELATED_ENTITY_KINDS), with their uri_set
+    prefetched, fetching those of all of persons at once (a query or two per
+    kind)"""
+    person_entities = {
+        person.pk: {kind: {} for kind, _, _ in RELATED_ENTITY_KINDS}
+        for person in persons
+    }
+    for kind, relation_model_name, related_field in RELATED_ENTITY_KINDS:
+        relation_model = ContentType.objects.get_by_natural_key(
+            "apis_relations", relation_model_name
+        ).model_class()
+        for relation in (
+            relation_model.objects.filter(related_person__in=list(person_entities))
+            .select_related(related_field)
+            .prefetch_related(f"{related_field}__uri_set")
+            .order_by(f"{related_field}_id")
+        ):
+            entity = getattr(relation, related_field)
+            person_entities[relation.related_person_id][kind][entity.pk] = entity
+    for person in persons:
+        person.related_entities = {
+            kind: list(entities.values())
+            for kind, entities in person_entities[person.pk].items()
+        }
+
+
+def get_related_entities(person, kind):
+    """Entities of the given kind (e.g. places) related to person, as fetched
+    with its chunk of persons by iterate_persons (a person built on its own
+    fetches its own)"""
+    if getattr(person, "related_entities", None) is None:
+        prefetch_related_entities([person])
+    return person.related_entities[kind]
+
+
+class SuggestIndex(PySolaar):
+    """Labels of persons, sources, places and institutions (memberOf), for the
+    suggest endpoint, which matches their words by prefix (see suggest.py)"""
 
-        # yield from (StatementIndex.Document(**item) for item in r_list)
+    class Meta:
+        store_document_fields = DocumentFields(
+            ref=True, label=True, kind=True, suggest_ss=True
+        )
+        return_document_fields = DocumentFields(
+            ref=TransformKey("@id") & SingleValue,
+            label=SingleValue,
+            kind=TransformKey("type") & SingleValue,
+        )
+
+    def build_document_set(self, persons=None):
+        for chunk in iterate_person_chunks(persons, related_entities=True):
+            # Places and institutions are related to many persons, so only
+            # build their documents once per chunk (a document built again for
+            # a later chunk replaces the earlier one, having the same id)
+            seen = set()
+            for person in chunk:
+                print(f"Building SuggestIndex for [Person:{person.pk}]")
+                for doc in self.build_document(person):
+                    if doc.id not in seen:
+                        seen.add(doc.id)
+                        yield doc
+
+    def build_document(self, person):
+        """Suggestions for person, its sources, and the places and
+        institutions related to it"""
+        label = f"{person.name}, {person.first_name} ({person.pk})"
+        yield self._suggestion(f"person_{person.pk}", str(person.pk), label, "person")
+
+        for source in [*get_references(person), None]:
+            identity = source_identity(person, source)
+            yield self._suggestion(
+                f"source_{identity['id']}", identity["id"], identity["label"], "source"
+            )
+
+        for kind, _, _ in RELATED_ENTITY_KINDS:
+            for entity in get_related_entities(person, kind):
+                # (The same uri as the statement filters match, see StatementIndex)
+                uris = [str(url) for url in entity.uri_set.all()]
+                yield self._suggestion(
+                    f"{kind}_{entity.pk}",
+                    uris[0] if uris else entity.get_absolute_url(),
+                    entity.name,
+                    kind,
+                )
+
+    def _suggestion(id_string, ref, label, kind):
+        return SuggestIndex.Document(
+            id=id_string,
+            ref=ref,
+            label=label,
+            kind=kind,
+            suggest_ss=suggest_terms(label),
+        )
+
+
+class UriIndex(PySolaar):
+    """URIs of persons, places and institutions (memberOf), each with the kind
+    and id of the entity it identifies, so that URI params can be resolved to
+    ids before filtering (see uris.py)"""
+
+    class Meta:
+        store_document_fields = DocumentFields(uri_s=True, kind=True, ref=True)
+        return_document_fields = DocumentFields(kind=SingleValue, ref=SingleValue)
+
+    def build_document_set(self, persons=None):
+        for chunk in iterate_person_chunks(persons, related_entities=True):
+            # Places and institutions are related to many persons, so only
+            # build their documents once per chunk (a document built again for
+            # a later chunk replaces the earlier one, having the same id)
+            seen = set()
+            for person in chunk:
+                print(f"Building UriIndex for [Person:{person.pk}]")
+                for doc in self.build_document(person):
+                    if doc.id not in seen:
+                        seen.add(doc.id)
+                        yield doc
+
+    def build_document(self, person):
+        """URIs of person, and of the places and institutions related to it:
+        the same uris as the person and statement filters match"""
+        yield from self._uri_documents(
+            "person", person.pk, [str(x.uri) for x in person.uri_set.all()]
+        )
+        for kind, _, _ in RELATED_ENTITY_KINDS:
+            for entity in get_related_entities(person, kind):
+                uris = [str(url) for url in entity.uri_set.all()]
+                yield from self._uri_documents(
+                    kind, entity.pk, [*uris, entity.get_absolute_url()]
+                )
+
+    def _uri_documents(kind, pk, uris):
+        for n, uri in enumerate(uris):
+            yield UriIndex.Document(
+                id=f"{kind}_{pk}_{n}", uri_s=uri, kind=kind, ref=str(pk)
+            )
+
+
+# In the same order as PySolaar.update would build them (i.e. declaration order)
+INDEX_CLASSES = (
+    FactoidIndex,
+    PersonIndex,
+    SourceIndex,
+    StatementIndex,
+    SuggestIndex,
+    UriIndex,
+)
 
+# Give each index a client of its own (see build_solr_client), for its core
+for index_class in INDEX_CLASSES:
+    index_class.QuerySet._solr = lazy_solr_client(index_class.__name__)
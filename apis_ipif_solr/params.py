@@ -0,0 +1,19 @@
+"""Errors in IPIF request params.
+
+Params that can't be parsed (or ask for too much) raise InvalidParam, which
+the views return as a 400 with its message. Any other exception, e.g. from a
+malformed Solr response, is left to be a server error, rather than being
+reported to the client as a mistake of theirs."""
+
+
+class InvalidParam(Exception):
+    pass
+
+
+def int_param(params, key, default):
+    """The value of an integer param (default if it is not given)"""
+    value = params.get(key, default)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise InvalidParam(f"{key} should be a whole number, not {value!r}")
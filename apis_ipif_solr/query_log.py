@@ -0,0 +1,324 @@
+"""Slow-query log and per-fingerprint query stats for the IPIF views.
+
+Each request is fingerprinted by its view, the names (not values) of its
+params, its combineStatementFilters mode and the child joins (filters on child
+documents) of its Solr queries, so that requests which cost Solr the same
+work are counted together. Only the IPIF params are named (any others count
+as one "other"), so that clients can't make up fingerprints without bound. Requests taking longer than SLOW_QUERY_MS are
+logged (to the "apis_ipif_solr.slow_queries" logger) with their Solr queries.
+
+Stats are kept per process over the last QUERY_STATS_WINDOW seconds, and
+copied to Django's cache every QUERY_STATS_FLUSH seconds, from where
+`runscript ipif_query_stats` reads and sums those of all processes (so this
+needs a cache shared between processes, e.g. Redis or memcached).
+
+The most frequent GET requests (with their param values) are counted likewise,
+for `runscript warmup_ipif` to replay after a build or restart."""
+
+from collections import Counter
+from contextlib import contextmanager
+import contextvars
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+SLOW_QUERY_MS = settings.APIS_IPIF_CONFIG.get("SLOW_QUERY_MS", 1000)
+QUERY_STATS_WINDOW = settings.APIS_IPIF_CONFIG.get("QUERY_STATS_WINDOW", 3600)
+QUERY_STATS_FLUSH = settings.APIS_IPIF_CONFIG.get("QUERY_STATS_FLUSH", 10)
+STATS_BUCKET_SECONDS = 60
+# Distinct requests counted per bucket (once full, only those already seen
+# in the bucket are counted, which still catches the most frequent ones)
+MAX_COUNTED_REQUESTS = 1000
+# Fingerprints counted per bucket (once full, requests with other fingerprints
+# are counted under OTHER)
+MAX_FINGERPRINTS = 1000
+# Sent with the requests replayed by warmup_ipif, which aren't counted
+WARMUP_HEADER = "X-IPIF-Warmup"
+
+STATS_CACHE_KEY = "apis_ipif_solr:query_stats"
+STATS_PROCESSES_CACHE_KEY = "apis_ipif_solr:query_stats:processes"
+
+# The params read by the IPIF views (see api_views, facets and suggest)
+IPIF_PARAMS = {
+    "size",
+    "page",
+    "sortBy",
+    "format",
+    "p",
+    "factoidId",
+    "f",
+    "statementId",
+    "st",
+    "sourceId",
+    "s",
+    "personId",
+    "relatesToPersonsDepth",
+    "combineStatementFilters",
+    "statementType",
+    "statementText",
+    "relatesToPersons",
+    "memberOf",
+    "role",
+    "name",
+    "from",
+    "to",
+    "place",
+    "dateGap",
+    "q",
+    "type",
+}
+COMBINE_STATEMENT_FILTERS = {"and", "or", "independent"}
+OTHER = "other"
+
+# Child filters are {!parent ...}(... +pysolaar_type_nested:*<field> ...) queries
+CHILD_JOIN_REGEX = re.compile(r"\+pysolaar_type_nested:\*(\w+)")
+
+logger = logging.getLogger("apis_ipif_solr.slow_queries")
+
+
+class RequestRecord:
+    """The Solr queries made while handling a request"""
+
+    def __init__(self):
+        self.solr_queries = []
+        self.qtime_ms = 0
+        # (The queries of a batch request are made from several threads)
+        self.lock = threading.Lock()
+
+
+current_request = contextvars.ContextVar("ipif_request_record", default=None)
+# Every Solr query made in the context, however many requests it spans
+# (see record_solr_queries)
+recorded_queries = contextvars.ContextVar("ipif_recorded_queries", default=None)
+
+
+def note_solr_query(params, decoded):
+    """Called by the Solr clients for each query, to add it to the
+    record of the current request (if it is being tracked)"""
+    fq = params.get("fq", [])
+    query = {"q": params.get("q"), "fq": [fq] if isinstance(fq, str) else list(fq)}
+    queries = recorded_queries.get()
+    if queries is not None:
+        queries.append(query)
+    record = current_request.get()
+    if record is None:
+        return
+    with record.lock:
+        record.solr_queries.append(query)
+        record.qtime_ms += decoded.get("responseHeader", {}).get("QTime", 0)
+
+
+@contextmanager
+def record_solr_queries():
+    """Collects the Solr queries made in the block (e.g. by the requests
+    checked against performance budgets, see budgets.py) in a list"""
+    queries = []
+    token = recorded_queries.set(queries)
+    try:
+        yield queries
+    finally:
+        recorded_queries.reset(token)
+
+
+def fingerprint(endpoint, params, solr_queries):
+    """e.g. PersonsListView?combineStatementFilters=and&from&role&size joins=ST"""
+    names = [name for name in sorted(params) if name in IPIF_PARAMS]
+    if "combineStatementFilters" in params:
+        mode = params["combineStatementFilters"]
+        names[names.index("combineStatementFilters")] += "=" + (
+            mode if mode in COMBINE_STATEMENT_FILTERS else OTHER
+        )
+    if len(names) < len(params):
+        names.append(OTHER)
+    # (Taking the most of each join in any one query, as the same query may be
+    # sent more than once, e.g. to count and then fetch the results)
+    joins = Counter()
+    for query in solr_queries:
+        joins |= Counter(
+            join for fq in query["fq"] for join in CHILD_JOIN_REGEX.findall(fq)
+        )
+    fingerprint = f"{endpoint}?{'&'.join(names)}"
+    if joins:
+        fingerprint += " joins=" + ",".join(
+            join if count == 1 else f"{join}x{count}"
+            for join, count in sorted(joins.items())
+        )
+    return fingerprint
+
+
+def request_key(request):
+    """The path and sorted params of a GET request (leaving out empty params
+    and format), under which it is counted; None for requests not to replay"""
+    if (
+        request.method != "GET"
+        or "/export" in request.path_info
+        or WARMUP_HEADER in request.headers
+    ):
+        return None
+    params = sorted(
+        (name, value)
+        for name, values in request.GET.lists()
+        for value in values
+        if value and name != "format"
+    )
+    return f"{request.path_info}?{urlencode(params)}" if params else request.path_info
+
+
+class QueryStats:
+    """Count, total time, Solr QTime and max time of requests per fingerprint,
+    over the last window seconds (in buckets of STATS_BUCKET_SECONDS)"""
+
+    def __init__(self, window):
+        self.window = window
+        self.buckets = {}
+        self.request_buckets = {}
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def record(self, fingerprint, total_ms, qtime_ms):
+        bucket_key = int(time.time() // STATS_BUCKET_SECONDS)
+        with self.lock:
+            bucket = self.buckets.setdefault(bucket_key, {})
+            if fingerprint not in bucket and len(bucket) >= MAX_FINGERPRINTS:
+                fingerprint = OTHER
+            count, total, qtime, max_ms = bucket.get(fingerprint, (0, 0, 0, 0))
+            bucket[fingerprint] = (
+                count + 1,
+                total + total_ms,
+                qtime + qtime_ms,
+                max(max_ms, total_ms),
+            )
+            oldest = bucket_key - self.window // STATS_BUCKET_SECONDS
+            for key in [key for key in self.buckets if key < oldest]:
+                del self.buckets[key]
+
+    def record_request(self, key):
+        bucket_key = int(time.time() // STATS_BUCKET_SECONDS)
+        with self.lock:
+            bucket = self.request_buckets.setdefault(bucket_key, Counter())
+            if key in bucket or len(bucket) < MAX_COUNTED_REQUESTS:
+                bucket[key] += 1
+            oldest = bucket_key - self.window // STATS_BUCKET_SECONDS
+            for old_key in [k for k in self.request_buckets if k < oldest]:
+                del self.request_buckets[old_key]
+
+    def snapshot(self):
+        with self.lock:
+            buckets = list(self.buckets.values())
+        return merge_stats(buckets)
+
+    def request_snapshot(self):
+        with self.lock:
+            buckets = list(self.request_buckets.values())
+        return sum(buckets, Counter())
+
+    def due_for_flush(self):
+        """Whether QUERY_STATS_FLUSH seconds have passed since the last flush
+        (if so, the stats count as flushed from now on)"""
+        with self.lock:
+            if time.monotonic() - self.flushed_at < QUERY_STATS_FLUSH:
+                return False
+            self.flushed_at = time.monotonic()
+            return True
+
+    def cached_snapshots(self, process_key):
+        return {
+            process_key: self.snapshot(),
+            f"{process_key}:requests": self.request_snapshot(),
+        }
+
+    def flush_if_due(self):
+        """Copies the stats of this process to the cache every QUERY_STATS_FLUSH
+        seconds (also re-registering the process, should that have been lost,
+        and dropping processes whose stats have expired, e.g. workers since
+        restarted, so that the set of processes doesn't grow with every restart)"""
+        if not self.due_for_flush():
+            return
+        process_key = f"{STATS_CACHE_KEY}:{socket.gethostname()}:{os.getpid()}"
+        cache.set_many(self.cached_snapshots(process_key), QUERY_STATS_WINDOW)
+        processes = cache.get(STATS_PROCESSES_CACHE_KEY, set())
+        live_processes = set(cache.get_many(processes)) | {process_key}
+        if live_processes != processes:
+            cache.set(STATS_PROCESSES_CACHE_KEY, live_processes, None)
+
+    async def aflush_if_due(self):
+        """Async version of flush_if_due, for the async views (whose event
+        loop the cache's sync methods would block)"""
+        if not self.due_for_flush():
+            return
+        process_key = f"{STATS_CACHE_KEY}:{socket.gethostname()}:{os.getpid()}"
+        await cache.aset_many(self.cached_snapshots(process_key), QUERY_STATS_WINDOW)
+        processes = await cache.aget(STATS_PROCESSES_CACHE_KEY, set())
+        live_processes = set(await cache.aget_many(processes)) | {process_key}
+        if live_processes != processes:
+            await cache.aset(STATS_PROCESSES_CACHE_KEY, live_processes, None)
+
+
+def merge_stats(snapshots):
+    """Sums snapshots of {fingerprint: [count, total_ms, qtime_ms, max_ms]}"""
+    merged = {}
+    for snapshot in snapshots:
+        for fingerprint, (count, total, qtime, max_ms) in snapshot.items():
+            merged_count, merged_total, merged_qtime, merged_max = merged.get(
+                fingerprint, (0, 0, 0, 0)
+            )
+            merged[fingerprint] = (
+                merged_count + count,
+                merged_total + total,
+                merged_qtime + qtime,
+                max(merged_max, max_ms),
+            )
+    return merged
+
+
+def cached_stats():
+    """Stats of all processes that have flushed them to the cache"""
+    processes = cache.get(STATS_PROCESSES_CACHE_KEY, set())
+    return merge_stats(cache.get_many(processes).values())
+
+
+def cached_top_requests(top):
+    """The top most frequent requests of all processes, by request_key"""
+    processes = cache.get(STATS_PROCESSES_CACHE_KEY, set())
+    counted = cache.get_many([f"{process}:requests" for process in processes])
+    return [key for key, _ in sum(counted.values(), Counter()).most_common(top)]
+
+
+stats = QueryStats(QUERY_STATS_WINDOW)
+
+
+@contextmanager
+def track_request(endpoint, params, key=None, flush=True):
+    """Records the time and Solr queries of the request handled in the block
+    (and counts it by its request_key, if given). The async views pass
+    flush=False, and flush the stats themselves with aflush_if_due."""
+    record = RequestRecord()
+    token = current_request.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        total_ms = (time.perf_counter() - start) * 1000
+        current_request.reset(token)
+        request_fingerprint = fingerprint(endpoint, params, record.solr_queries)
+        stats.record(request_fingerprint, total_ms, record.qtime_ms)
+        if key is not None:
+            stats.record_request(key)
+        if SLOW_QUERY_MS is not None and total_ms > SLOW_QUERY_MS:
+            logger.warning(
+                "Slow IPIF request (%.0f ms, Solr QTime %d ms): %s %s",
+                total_ms,
+                record.qtime_ms,
+                request_fingerprint,
+                json.dumps(record.solr_queries),
+            )
+        if flush:
+            stats.flush_if_due()
@@ -0,0 +1,67 @@
+"""Compact records of the documents a build holds in memory before pushing them.
+
+PySolaar's doc_to_solr turns each document into a dict (with a dict for each
+child document) keyed by encoded field names built afresh for every document,
+e.g. "PersonIndex______ST______statementType__label", so a chunk of
+MAX_CHUNK_SIZE documents with their children costs far more than its data.
+The build instead keeps each prepared document as a SolrRecord: its field
+names as an interned tuple, shared by every document of the build with the
+same fields; its values as a tuple; and its children as records, shared (not copied) when a
+child is also pushed on its own. Records are only turned back into Solr JSON
+when their chunk is pushed, one document at a time."""
+
+from collections import namedtuple
+import sys
+
+SolrRecord = namedtuple("SolrRecord", ["fields", "values", "children"])
+
+# Values of these fields are the same few strings in every document
+INTERNED_VALUE_FIELDS = {"pysolaar_type", "pysolaar_type_nested"}
+
+
+def _shared_fields(fields, field_tuples):
+    fields = tuple(sys.intern(field) for field in fields)
+    return field_tuples.setdefault(fields, fields)
+
+
+def compact(solr_document, field_tuples):
+    """A SolrRecord of a document prepared for Solr (by doc_to_solr), leaving out
+    null values, which Solr ignores. Its field names are shared through
+    field_tuples, a dict kept for one build (so that the tuples of every
+    shape of document built don't outlive it)"""
+    fields = []
+    values = []
+    children = ()
+    for field, value in solr_document.items():
+        if field == "_doc":
+            value = value if isinstance(value, list) else [value]
+            children = tuple(compact(child, field_tuples) for child in value)
+            continue
+        if value is None:
+            continue
+        if isinstance(value, list):
+            value = tuple(value)
+        elif field in INTERNED_VALUE_FIELDS:
+            value = sys.intern(value)
+        fields.append(field)
+        values.append(value)
+    return SolrRecord(_shared_fields(fields, field_tuples), tuple(values), children)
+
+
+def to_solr(record, top_level=True):
+    """The Solr document of a record. Top-level documents leave out empty
+    strings, as pysolr's add would (child documents are sent as they are)"""
+    doc = {
+        field: value
+        for field, value in zip(record.fields, record.values)
+        if not (top_level and value == "")
+    }
+    if record.children:
+        doc["_doc"] = [to_solr(child, top_level=False) for child in record.children]
+    return doc
+
+
+def records_to_json(records, encoder):
+    """The JSON array of records (for Solr's JSON update handler), building the
+    dict of only one document at a time"""
+    return "[" + ",".join(encoder.encode(to_solr(record)) for record in records) + "]"
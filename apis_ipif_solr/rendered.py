@@ -0,0 +1,112 @@
+"""Pre-rendered documents (enabled with APIS_IPIF_CONFIG["RENDERED_DOCUMENTS"]).
+
+The build stores the IPIF JSON of each document, as the views would return it,
+in a stored-only field. The views then fetch only that field, and splice the
+JSON into the response as is, without running PySolaar's return transforms
+(or fetching child documents) or serializing the documents again."""
+
+import datetime
+import json
+
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from apis_ipif_solr.solr_client import (
+    get_session,
+    is_partial,
+    search_params,
+    select,
+    time_allowed_params,
+)
+
+RENDERED_DOCUMENTS = settings.APIS_IPIF_CONFIG.get("RENDERED_DOCUMENTS", False)
+RENDERED_FIELD = "rendered_ipif"
+
+
+def dumps(data):
+    # (As DRF's JSONRenderer does by default)
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":"))
+
+
+def solr_value(value):
+    if isinstance(value, datetime.date):  # (Including datetimes)
+        return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return value
+
+
+def as_returned_by_solr(solr_document):
+    """A document prepared for Solr, as Solr would return it: multivalued
+    fields (which is what schemaless Solr makes them) and dates as strings"""
+    returned = {}
+    for key, value in solr_document.items():
+        if key == "_doc":
+            children = value if isinstance(value, list) else [value]
+            returned[key] = [as_returned_by_solr(child) for child in children]
+            continue
+        values = value if isinstance(value, (list, tuple)) else [value]
+        values = [solr_value(v) for v in values if v is not None]
+        if key == "id":
+            returned[key] = values[0]
+        elif values:
+            returned[key] = values
+    return returned
+
+
+def render_document(index_class, solr_document):
+    """The IPIF JSON of a document, as returned by the views of index_class"""
+    results = index_class.Results(
+        {"response": {"numFound": 1, "docs": [as_returned_by_solr(solr_document)]}}
+    )
+    return dumps(next(iter(results)))
+
+
+def add_rendered_field(solr_url):
+    """Adds RENDERED_FIELD to the schema if it isn't there: stored, but neither
+    indexed nor with docValues (which would limit it to 32kB)"""
+    session = get_session()
+    solr_url = solr_url.rstrip("/")
+    if session.get(f"{solr_url}/schema/fields/{RENDERED_FIELD}").status_code == 200:
+        return
+    response = session.post(
+        f"{solr_url}/schema",
+        json={
+            "add-field": {
+                "name": RENDERED_FIELD,
+                "type": "string",
+                "indexed": False,
+                "stored": True,
+                "docValues": False,
+                "multiValued": False,
+            }
+        },
+    )
+    response.raise_for_status()
+
+
+def rendered_params(queryset, rows=100000, start=0):
+    """Solr params for a queryset, fetching only the rendered documents"""
+    return {
+        **search_params(queryset, rows=rows, start=start),
+        **time_allowed_params(),
+        "fl": RENDERED_FIELD,
+    }
+
+
+def unpack_rendered(decoded):
+    """The rendered documents, total hits and whether the results are partial"""
+    return (
+        [doc[RENDERED_FIELD] for doc in decoded["response"]["docs"]],
+        decoded["response"]["numFound"],
+        is_partial(decoded),
+    )
+
+
+def fetch_rendered(queryset, **kwargs):
+    return unpack_rendered(select(queryset, rendered_params(queryset, **kwargs)))
+
+
+def splice(data, key, rendered):
+    """JSON bytes of data (a dict), with the rendered documents under key"""
+    head = dumps(data)[:-1]
+    separator = "," if data else ""
+    return f'{head}{separator}"{key}":[{",".join(rendered)}]}}'.encode()
@@ -0,0 +1,151 @@
+from pysolaar.document import ChildDocument
+from pysolaar.utils.meta_utils import JsonToDict
+
+from apis_ipif_solr.indexes import INDEX_CLASSES
+
+# Statement fields filtered on by the statement params
+# (see api_views.build_statement_filter_q_list)
+STATEMENT_FILTER_FIELDS = {
+    "statementType",
+    "statementText",
+    "relatesToPersons",
+    "memberOf",
+    "role",
+    "name",
+    "date",
+    "places",
+}
+
+# Fields (as dotted paths into child documents) that the views in api_views
+# filter on. Keep this in step with the filters there!
+SEARCHED_DOCUMENT_FIELDS = {
+    "FactoidIndex": {
+        "createdBy",
+        "modifiedBy",
+        *(f"Statements.{field}" for field in STATEMENT_FILTER_FIELDS),
+        "Statements.id",
+        "Statements.createdBy",
+        "Statements.modifiedBy",
+        "S.id",
+        "S.label",
+        "S.uris",
+        "S.createdBy",
+        "S.modifiedBy",
+        "Person.id",
+        "Person.label",
+        "Person.uris",
+        "Person.createdBy",
+        "Person.modifiedBy",
+    },
+    "PersonIndex": {
+        "id",
+        "label",
+        "createdBy",
+        "modifiedBy",
+        "uris",
+        "relatedPersons_ss",
+        *(f"ST.{field}" for field in STATEMENT_FILTER_FIELDS),
+        "ST.id",
+        "ST.createdBy",
+        "ST.modifiedBy",
+        "F.id",
+        "F.createdBy",
+        "F.modifiedBy",
+        "S.id",
+        "S.label",
+        "S.uris",
+        "S.createdBy",
+        "S.modifiedBy",
+    },
+    "SourceIndex": {
+        "id",
+        "label",
+        "uris",
+        "createdBy",
+        "modifiedBy",
+        *(f"ST.{field}" for field in STATEMENT_FILTER_FIELDS),
+        "P.id",
+        "P.label",
+        "P.uris",
+        "P.createdBy",
+        "P.modifiedBy",
+        "Factoids.id",
+        "Factoids.createdBy",
+        "Factoids.modifiedBy",
+    },
+    "StatementIndex": {
+        "id",
+        *STATEMENT_FILTER_FIELDS,
+        "S.id",
+        "S.label",
+        "S.uris",
+        "S.createdBy",
+        "S.modifiedBy",
+        "P.id",
+        "P.label",
+        "P.uris",
+        "P.createdBy",
+        "P.modifiedBy",
+        "F.id",
+        "F.createdBy",
+        "F.modifiedBy",
+    },
+    # (See suggest.suggest_params)
+    "SuggestIndex": {"suggest_ss", "kind"},
+    # (See uris.resolve_uri)
+    "UriIndex": {"uri_s"},
+}
+
+def _field_paths(fields, prefix=""):
+    """Flattens (store or return) document fields into a set of dotted paths,
+    descending into child documents and JsonToDict transforms. Flattened dict
+    fields (e.g. statementType__label) become dotted paths too."""
+    paths = set()
+    for key, value in fields.items():
+        if not value:
+            continue
+        path = f"{prefix}{key.replace('__', '.')}"
+        if isinstance(value, ChildDocument):
+            paths |= _field_paths(value, prefix=f"{path}.") or {path}
+        elif isinstance(value, JsonToDict) and value.transforms:
+            paths |= _field_paths(value.transforms, prefix=f"{path}.")
+        else:
+            paths.add(path)
+    return paths
+
+
+def _overlaps(path, paths):
+    """A path is covered by another if they are equal, or if one is
+    a parent of the other (e.g. date and date.sortdate_dt)"""
+    return any(
+        path == p or path.startswith(f"{p}.") or p.startswith(f"{path}.") for p in paths
+    )
+
+
+def audit_schema():
+    """Reports, for each index, which fields are stored, searched and returned;
+    and which stored fields are used for neither (and which searched fields
+    are not stored, so will never match)"""
+    report = {}
+    for index_class in INDEX_CLASSES:
+        name = index_class.__name__
+        stored = _field_paths(index_class.Meta.store_document_fields)
+        searched = SEARCHED_DOCUMENT_FIELDS[name]
+        returned = _field_paths(index_class.Meta.return_document_fields)
+        report[name] = {
+            "stored": stored,
+            "searched": searched,
+            "returned": returned,
+            "stored_but_unused": {
+                path
+                for path in stored
+                if path.split(".")[-1] != "id"  # ids are always stored anyway
+                and not _overlaps(path, searched | returned)
+            },
+            "searched_but_not_stored": {
+                path
+                for path in searched
+                if path != "id" and not _overlaps(path, stored)
+            },
+        }
+    return report
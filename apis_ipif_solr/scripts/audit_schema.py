@@ -0,0 +1,20 @@
+from apis_ipif_solr.schema import audit_schema
+
+
+def print_report(report):
+    for index_name, fields in report.items():
+        print("--------------------------")
+        print(index_name)
+        print("--------------------------")
+        for key in ("stored", "searched", "returned"):
+            print(f"{key} ({len(fields[key])}):")
+            print("   ", ", ".join(sorted(fields[key])))
+        print("stored, but neither searched nor returned:")
+        print("   ", ", ".join(sorted(fields["stored_but_unused"])) or "-")
+        print("searched, but not stored (these filters can never match):")
+        print("   ", ", ".join(sorted(fields["searched_but_not_stored"])) or "-")
+
+
+def run(*args):
+    """Reports stored vs. searched vs. returned fields for each index"""
+    print_report(audit_schema())
@@ -0,0 +1,280 @@
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+import pysolr
+from pysolaar import PySolaar
+from rest_framework.test import APIRequestFactory
+
+from apis_ipif_solr.api_views import (
+    FactoidsListView,
+    PersonsListView,
+    SourcesListView,
+    StatementsListView,
+)
+from apis_ipif_solr.build import INDEX_CLASSES, build_indexes, select_persons
+from apis_ipif_solr.solr_client import (
+    build_solr_client,
+    core_urls,
+    get_backend,
+    index_url,
+)
+
+LIST_VIEWS = {
+    "persons": PersonsListView,
+    "factoids": FactoidsListView,
+    "statements": StatementsListView,
+    "sources": SourcesListView,
+}
+
+# (endpoint, params) of the requests to time; override with requests=<file.json>
+BENCHMARK_REQUESTS = [
+    ("persons", {}),
+    ("persons", {"statementType": "hasName"}),
+    ("persons", {"role": "birth", "from": "1800", "to": "1900"}),
+    (
+        "persons",
+        {
+            "role": "birth",
+            "from": "1800",
+            "to": "1900",
+            "combineStatementFilters": "and",
+        },
+    ),
+    ("factoids", {}),
+    ("factoids", {"statementType": "hasName"}),
+    ("statements", {}),
+    ("statements", {"role": "birth", "from": "1800", "to": "1900"}),
+    ("sources", {}),
+]
+
+
+# Run in a fresh interpreter, to time what a worker or management command pays
+# at startup (Django setup, and loading the URLconf, e.g. for system checks)
+# and on the first IPIF request (importing the views, indexes, PySolaar...)
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+import apis_ipif_solr.urls
+urls = time.perf_counter()
+import apis_ipif_solr.api_views
+views = time.perf_counter()
+print(json.dumps({
+    "django_setup_ms": (setup - start) * 1000,
+    "urls_import_ms": (urls - setup) * 1000,
+    "views_import_ms": (views - urls) * 1000,
+}))
+"""
+
+
+def measure_startup(repeat):
+    """Median startup timings over repeat fresh interpreters"""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT],
+            capture_output=True,
+            text=True,
+            check=True,
+            env=os.environ,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def measure_index_size():
+    """Index size as reported by Solr's core admin STATUS, summed over the
+    cores of the indexes (or, with the sqlite backend, by the SQLite database)"""
+    if get_backend() == "sqlite":
+        return PySolaar._solr.index_size()
+    size = {"numDocs": 0, "maxDoc": 0, "sizeInBytes": 0}
+    for url in core_urls(INDEX_CLASSES):
+        base_url, _, core = url.rstrip("/").rpartition("/")
+        status = json.loads(
+            pysolr.SolrCoreAdmin(f"{base_url}/admin/cores").status(core)
+        )
+        index = status["status"][core]["index"]
+        for key in size:
+            size[key] += index[key]
+    return size
+
+
+def measure_requests(benchmark_requests, repeat):
+    """Times each request through the view (including rendering the response),
+    and the CPU time it takes in this process (i.e. not counting Solr)"""
+    factory = APIRequestFactory()
+    results = {}
+    for endpoint, params in benchmark_requests:
+        view = LIST_VIEWS[endpoint].as_view()
+        timings = []
+        cpu_timings = []
+        for _ in range(repeat):
+            request = factory.get(f"/ipif/{endpoint}/", params)
+            start = time.perf_counter()
+            cpu_start = time.process_time()
+            response = view(request)
+            if hasattr(response, "render"):  # (Pre-rendered responses are not)
+                response.render()
+            cpu_timings.append((time.process_time() - cpu_start) * 1000)
+            timings.append((time.perf_counter() - start) * 1000)
+        results[f"{endpoint}/?{urlencode(params)}"] = {
+            "median_ms": statistics.median(timings),
+            "min_ms": min(timings),
+            "max_ms": max(timings),
+            "median_cpu_ms": statistics.median(cpu_timings),
+        }
+    return results
+
+
+def use_backend(backend):
+    """Points PySolaar and the indexes at new clients of backend"""
+    settings.APIS_IPIF_CONFIG["BACKEND"] = backend
+    PySolaar.configure_pysolr(pysolr_object=build_solr_client(index_url()))
+    for index_name, index_class in INDEX_CLASSES.items():
+        index_class.QuerySet._solr = build_solr_client(index_url(index_name))
+
+
+def compare_backends(backends, sizes, benchmark_requests, repeat):
+    """Build time, index size and request latency of each backend, with the
+    indexes rebuilt from the first size persons for each of sizes"""
+    person_ids = list(select_persons().values_list("pk", flat=True)[: max(sizes)])
+    results = {}
+    for backend in backends:
+        use_backend(backend)
+        for size in sizes:
+            for index_class in INDEX_CLASSES.values():
+                index_class.QuerySet._solr.delete(q="*:*")
+            start = time.perf_counter()
+            # (The build's progress isn't part of the report)
+            with contextlib.redirect_stdout(io.StringIO()):
+                build_indexes(persons=select_persons(ids=person_ids[:size]))
+            results.setdefault(backend, {})[size] = {
+                "build_seconds": time.perf_counter() - start,
+                "index": measure_index_size(),
+                "requests": measure_requests(benchmark_requests, repeat),
+            }
+    return results
+
+
+def print_backend_comparison(results):
+    backends = list(results)
+    print("--------------------------")
+    print(f"Median ms by backend ({', '.join(backends)})")
+    print("--------------------------")
+    first = results[backends[0]]
+    for size in first:
+        print(f"{size} persons:")
+        print(
+            "    build: "
+            + " / ".join(f"{results[b][size]['build_seconds']:.1f} s" for b in backends)
+        )
+        for request in first[size]["requests"]:
+            print(
+                f"    {request}: "
+                + " / ".join(
+                    f"{results[b][size]['requests'][request]['median_ms']:.1f}"
+                    for b in backends
+                )
+            )
+
+
+def print_comparison(before, after):
+    print("--------------------------")
+    print("Comparison (before -> after)")
+    print("--------------------------")
+    print(f"backend: {before.get('backend', 'solr')} -> {after['backend']}")
+    for key in ("numDocs", "maxDoc", "sizeInBytes"):
+        print(f"{key}: {before['index'][key]} -> {after['index'][key]}")
+    for key, timing in after.get("startup", {}).items():
+        if key in before.get("startup", {}):
+            print(f"{key}: {before['startup'][key]:.1f} ms -> {timing:.1f} ms")
+    for request, timings in after["requests"].items():
+        if request in before["requests"]:
+            print(
+                f"{request}: {before['requests'][request]['median_ms']:.1f} ms"
+                f" -> {timings['median_ms']:.1f} ms"
+            )
+            if "median_cpu_ms" in before["requests"][request]:
+                print(
+                    f"    CPU: {before['requests'][request]['median_cpu_ms']:.1f} ms"
+                    f" -> {timings['median_cpu_ms']:.1f} ms"
+                )
+
+
+def run(*args):
+    """Measures index size, IPIF request latency and startup time.
+
+    Script args (all optional, as key=value):
+
+        repeat=10               number of times to run each request
+        startup_repeat=5        number of fresh interpreters to time startup in
+        requests=requests.json  list of [endpoint, params] pairs to time
+        out=report.json         save the report
+        compare=report.json     compare with a previously saved report
+        backends=sqlite,solr    compare backends instead (see below)
+        sizes=100,1000,10000    numbers of persons to compare backends with
+        rebuild=yes             confirms that backends may delete the indexes
+
+    e.g. to compare index layouts, build the index, run with out=before.json,
+    rebuild with the other layout and run with compare=before.json (likewise
+    for RENDERED_DOCUMENTS, comparing CPU per page).
+
+    With backends, each backend's indexes are rebuilt from the first persons,
+    for each of sizes, and timed. This deletes what the indexes hold (hence
+    rebuild=yes), so point URL, CORES and SQLITE_PATH at scratch indexes.
+    """
+    options = dict(arg.partition("=")[::2] for arg in args)
+
+    benchmark_requests = BENCHMARK_REQUESTS
+    if "requests" in options:
+        with open(options["requests"]) as f:
+            benchmark_requests = [tuple(r) for r in json.load(f)]
+
+    if "backends" in options:
+        if options.get("rebuild") != "yes":
+            print("backends deletes and rebuilds the indexes; pass rebuild=yes")
+            sys.exit(1)
+        results = compare_backends(
+            options["backends"].split(","),
+            [int(size) for size in options.get("sizes", "100,1000,10000").split(",")],
+            benchmark_requests,
+            int(options.get("repeat", 10)),
+        )
+        report = {"backends": results}
+        print(json.dumps(report, indent=2))
+        if "out" in options:
+            with open(options["out"], "w") as f:
+                json.dump(report, f, indent=2)
+        print_backend_comparison(results)
+        return
+
+    report = {
+        "backend": get_backend(),
+        "rendered_documents": settings.APIS_IPIF_CONFIG.get(
+            "RENDERED_DOCUMENTS", False
+        ),
+        "startup": measure_startup(int(options.get("startup_repeat", 5))),
+        "index": measure_index_size(),
+        "requests": measure_requests(
+            benchmark_requests, int(options.get("repeat", 10))
+        ),
+    }
+    print(json.dumps(report, indent=2))
+
+    if "out" in options:
+        with open(options["out"], "w") as f:
+            json.dump(report, f, indent=2)
+
+    if "compare" in options:
+        with open(options["compare"]) as f:
+            print_comparison(json.load(f), report)
@@ -1,15 +1,91 @@
+import sys
+
 from django.conf import settings
 
 
-from apis_ipif_solr.indexes import PySolaar
+from apis_ipif_solr.build import INDEX_CLASSES, build_indexes, select_persons
+from apis_ipif_solr.chunking import MAX_CHUNK_BYTES
+from apis_ipif_solr.solr_client import index_url
+
+SCRIPT_ARGS_HELP = """
+Script args (all optional, as key=value):
+
+    indexes=StatementIndex,PersonIndex   only build these index classes
+    from=100                             only persons with pk >= 100
+    to=200                               only persons with pk <= 200
+    ids=person_ids.txt                   only persons whose pk is listed in file (one per line)
+    shard=0/4                            only persons with pk % 4 == 0
+    trace_memory=yes                     report the peak memory of each chunk (slower)
+
+e.g. python manage.py runscript build_indexes --script-args indexes=StatementIndex shard=0/4
+"""
+
 
+def parse_script_args(args):
+    options = {}
+    for arg in args:
+        key, sep, value = arg.partition("=")
+        if not sep or not value:
+            raise ValueError(f"Script args should be key=value, not '{arg}'")
+        options[key] = value
+
+    build_options = {}
+    if "indexes" in options:
+        index_names = options.pop("indexes").split(",")
+        unknown = [name for name in index_names if name not in INDEX_CLASSES]
+        if unknown:
+            raise ValueError(
+                f"Unknown index classes {unknown}; choose from {list(INDEX_CLASSES)}"
+            )
+        build_options["index_classes"] = [INDEX_CLASSES[name] for name in index_names]
+    if "from" in options:
+        build_options["pk_from"] = int(options.pop("from"))
+    if "to" in options:
+        build_options["pk_to"] = int(options.pop("to"))
+    if "ids" in options:
+        with open(options.pop("ids")) as f:
+            build_options["ids"] = [int(line) for line in f if line.strip()]
+    if "shard" in options:
+        shard_index, _, shard_count = options.pop("shard").partition("/")
+        shard_index, shard_count = int(shard_index), int(shard_count)
+        if not 0 <= shard_index < shard_count:
+            raise ValueError("shard should be given as index/count, with index < count")
+        build_options["shard"] = (shard_index, shard_count)
+    if "trace_memory" in options:
+        trace_memory = options.pop("trace_memory")
+        build_options["trace_memory"] = trace_memory in {"yes", "true", "1"}
+    if options:
+        raise ValueError(f"Unknown script args {list(options)}")
+    return build_options
+
+
+def run(*args):
+    try:
+        build_options = parse_script_args(args)
+    except ValueError as e:
+        print(e)
+        print(SCRIPT_ARGS_HELP)
+        # (Non-zero, so that a scheduled or sharded build with a typo fails)
+        sys.exit(1)
+
+    index_classes = build_options.pop("index_classes", None)
+    person_selection = {
+        k: build_options[k]
+        for k in ("pk_from", "pk_to", "ids", "shard")
+        if k in build_options
+    }
 
-def run():
     print("--------------------------")
     chunk_size = settings.APIS_IPIF_CONFIG.get("MAX_CHUNK_SIZE", 5000)
     print("Building indexes on server:")
-    print(settings.APIS_IPIF_CONFIG.get("URL"))
-    print("with max chunk size:", chunk_size)
+    for index_class in index_classes or INDEX_CLASSES.values():
+        print(f"{index_class.__name__}: {index_url(index_class.__name__)}")
+    print("with max chunk size:", chunk_size, "documents,", MAX_CHUNK_BYTES, "bytes")
+    print("person selection:", person_selection or "all persons")
     print("--------------------------")
-    PySolaar.update(max_chunk_size=chunk_size)
-
+    build_indexes(
+        index_classes=index_classes,
+        persons=select_persons(**person_selection) if person_selection else None,
+        max_chunk_size=chunk_size,
+        trace_memory=build_options.get("trace_memory", False),
+    )
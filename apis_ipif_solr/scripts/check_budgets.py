@@ -0,0 +1,95 @@
+import json
+import sys
+
+from apis_core.apis_entities.models import Person
+from apis_ipif_solr.budgets import (
+    BUILD_QUERY_BUDGETS,
+    SOLR_REQUESTS_BUDGET,
+    budget_report,
+    check_build_budgets,
+    check_solr_budgets,
+    measure_build_queries,
+    measure_solr_requests,
+)
+from apis_ipif_solr.build import select_persons
+from apis_ipif_solr.indexes import PERSON_CHUNK_SIZE
+
+SCRIPT_ARGS_HELP = """
+Script args (all optional, as key=value):
+
+    persons=50              number of persons (the first, by pk) to build documents for,
+                            in chunks of PERSON_CHUNK_SIZE
+    prefix=/ipif/           path the IPIF URLs are included under
+    budgets=budgets.json    take the budgets from a report saved by an earlier check
+    save=budgets.json       save the report, to check later runs against
+    skip=build              skip the build (or views) checks
+
+e.g. python manage.py runscript check_budgets --script-args budgets=budgets.json
+"""
+
+
+def run(*args):
+    """Checks the performance budgets (see budgets.py) against the database
+    and index, exiting with status 1 if any is exceeded"""
+    options = {}
+    for arg in args:
+        key, sep, value = arg.partition("=")
+        if not sep or key not in {"persons", "prefix", "budgets", "save", "skip"}:
+            print(f"Unknown script arg '{arg}'")
+            print(SCRIPT_ARGS_HELP)
+            sys.exit(1)
+        options[key] = value
+
+    baseline = None
+    if "budgets" in options:
+        with open(options["budgets"]) as f:
+            baseline = json.load(f)
+
+    breaches = []
+    build_queries = {}
+    solr_requests = {}
+    person_count = 0
+
+    if options.get("skip") != "build":
+        person_ids = list(
+            Person.objects.order_by("pk").values_list("pk", flat=True)[
+                : int(options.get("persons", 50))
+            ]
+        )
+        person_count = len(person_ids)
+        print("--------------------------")
+        print(
+            f"Database queries building documents for {person_count} persons"
+            f" (per chunk of up to {PERSON_CHUNK_SIZE})"
+        )
+        print("--------------------------")
+        if person_count:
+            build_queries = measure_build_queries(select_persons(ids=person_ids))
+            breaches += check_build_budgets(
+                build_queries, BUILD_QUERY_BUDGETS, baseline
+            )
+
+    if options.get("skip") != "views":
+        print("--------------------------")
+        print(f"Solr requests per IPIF request (budget: {SOLR_REQUESTS_BUDGET})")
+        print("--------------------------")
+        solr_requests = measure_solr_requests(options.get("prefix", "/ipif/"))
+        breaches += check_solr_budgets(solr_requests)
+
+    if "save" in options:
+        with open(options["save"], "w") as f:
+            json.dump(
+                budget_report(build_queries, solr_requests),
+                f,
+                indent=2,
+            )
+
+    if breaches:
+        print("--------------------------")
+        print(f"{len(breaches)} budgets exceeded")
+        print("--------------------------")
+        for breach in breaches:
+            print(breach)
+            print()
+        sys.exit(1)
+    print("All budgets met")
@@ -0,0 +1,44 @@
+from apis_ipif_solr.query_log import QUERY_STATS_WINDOW, cached_stats
+
+
+def run(*args):
+    """Prints the request fingerprints that took the most time in total
+    over the last QUERY_STATS_WINDOW seconds, across all processes.
+
+    Script args (all optional, as key=value):
+
+        top=20          number of fingerprints to show
+        sort=total      sort by total, mean, qtime (total Solr QTime) or count
+    """
+    options = dict(arg.partition("=")[::2] for arg in args)
+    top = int(options.get("top", 20))
+    sort_keys = {
+        "total": lambda row: row[2],
+        "mean": lambda row: row[2] / row[1],
+        "qtime": lambda row: row[3],
+        "count": lambda row: row[1],
+    }
+    sort = options.get("sort", "total")
+    if sort not in sort_keys:
+        print(f"sort should be one of {list(sort_keys)}")
+        return
+
+    rows = [(fingerprint, *values) for fingerprint, values in cached_stats().items()]
+    rows.sort(key=sort_keys[sort], reverse=True)
+
+    print("--------------------------")
+    print(f"IPIF requests over the last {QUERY_STATS_WINDOW} seconds, by {sort}")
+    print("--------------------------")
+    if not rows:
+        print("No stats (yet): they are copied to the cache by each process")
+        print("every QUERY_STATS_FLUSH seconds, which needs a shared cache")
+        return
+    print(
+        f"{'count':>8} {'total ms':>12} {'mean ms':>9}"
+        f" {'QTime ms':>12} {'max ms':>9}  fingerprint"
+    )
+    for fingerprint, count, total, qtime, max_ms in rows[:top]:
+        print(
+            f"{count:>8} {total:>12.0f} {total / count:>9.1f}"
+            f" {qtime:>12.0f} {max_ms:>9.0f}  {fingerprint}"
+        )
@@ -0,0 +1,49 @@
+import json
+
+from apis_ipif_solr.warmup import (
+    WARMUP_CONCURRENCY,
+    WARMUP_TOP,
+    warm_up,
+    warmup_requests,
+)
+
+
+def run(*args):
+    """Replays the most frequent IPIF requests (recorded by the query stats)
+    and APIS_IPIF_CONFIG["WARMUP_REQUESTS"], to warm Solr's caches after a
+    build, Solr restart or deploy.
+
+    Script args (all optional, as key=value):
+
+        top=100                 number of recorded requests to replay
+        requests=requests.json  replay this list of request paths instead
+                                (e.g. ["/ipif/persons/?role=birth"])
+        concurrency=4           max number of requests replayed at once
+        base_url=https://...    send the requests to this server over HTTP,
+                                rather than to the views in this process
+        save=requests.json      save the list of requests (e.g. to replay it
+                                on another instance) instead of replaying it
+    """
+    options = dict(arg.partition("=")[::2] for arg in args)
+
+    if "requests" in options:
+        with open(options["requests"]) as f:
+            request_paths = json.load(f)
+    else:
+        request_paths = warmup_requests(int(options.get("top", WARMUP_TOP)))
+
+    if "save" in options:
+        with open(options["save"], "w") as f:
+            json.dump(request_paths, f, indent=2)
+        print(f"Saved {len(request_paths)} requests to {options['save']}")
+        return
+
+    if not request_paths:
+        print("No requests to replay: none have been recorded in the cache")
+        print('(yet), and APIS_IPIF_CONFIG["WARMUP_REQUESTS"] is not set')
+        return
+    warm_up(
+        request_paths,
+        concurrency=int(options.get("concurrency", WARMUP_CONCURRENCY)),
+        base_url=options.get("base_url"),
+    )
@@ -0,0 +1,73 @@
+"""Building the indexes from one snapshot of a (replica) database.
+
+A full build runs for hours; reading from the primary database, it competes
+with editors, and it reads data from different moments, so a relation edited
+mid-build can show up in StatementIndex but not in the PersonIndex documents
+built before. build_indexes instead runs its reads inside build_snapshot:
+one REPEATABLE READ (read only) transaction on APIS_IPIF_CONFIG["BUILD_DATABASE"]
+(e.g. a read replica), so the whole build sees the database as it was when
+the build started. Each shard of a sharded build has a snapshot of its own.
+
+As the build reads through the models' default managers, the reads are sent
+to the build database by BuildDatabaseRouter, which needs adding to
+DATABASE_ROUTERS (only needed if BUILD_DATABASE is not the default database):
+
+    DATABASE_ROUTERS = ["apis_ipif_solr.snapshot.BuildDatabaseRouter"]
+"""
+
+from contextlib import contextmanager
+import contextvars
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+
+BUILD_DATABASE = settings.APIS_IPIF_CONFIG.get("BUILD_DATABASE", DEFAULT_DB_ALIAS)
+
+# The database alias reads are sent to, while a build runs in this context
+build_database = contextvars.ContextVar("ipif_build_database", default=None)
+
+
+class BuildDatabaseRouter:
+    """Sends reads to the build database while a build is running
+    (leaving them to the other routers, or the default database, otherwise)"""
+
+    def db_for_read(self, model, **hints):
+        return build_database.get()
+
+
+def begin_repeatable_read(alias):
+    """Makes the transaction just begun on alias a read-only REPEATABLE READ
+    one, so that all its reads see the same snapshot"""
+    connection = connections[alias]
+    if connection.vendor == "postgresql":
+        # (Must be the first statement of the transaction; the snapshot is
+        # taken by the first query after it)
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+    elif connection.vendor == "mysql":
+        # (Applies to the transaction started by the next statement, which
+        # START TRANSACTION is, taking the snapshot straight away)
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+    # (SQLite transactions already read from one snapshot)
+
+
+@contextmanager
+def build_snapshot(alias=BUILD_DATABASE):
+    """Runs the reads of the block on alias, in one snapshot"""
+    if alias != DEFAULT_DB_ALIAS and not any(
+        isinstance(r, BuildDatabaseRouter) for r in router.routers
+    ):
+        raise ImproperlyConfigured(
+            f"Building from the {alias!r} database needs"
+            " apis_ipif_solr.snapshot.BuildDatabaseRouter in DATABASE_ROUTERS"
+        )
+    token = build_database.set(alias)
+    try:
+        with transaction.atomic(using=alias):
+            begin_repeatable_read(alias)
+            yield
+    finally:
+        build_database.reset(token)
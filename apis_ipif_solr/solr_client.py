@@ -0,0 +1,335 @@
+import asyncio
+from functools import lru_cache
+import threading
+import time
+from urllib.parse import urlparse
+import weakref
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+import pysolr
+import requests
+from requests.adapters import HTTPAdapter
+from django.utils.functional import SimpleLazyObject
+from urllib3.util.retry import Retry
+
+from apis_ipif_solr.query_log import note_solr_query
+from apis_ipif_solr.records import records_to_json
+
+# Defaults for APIS_IPIF_CONFIG["CONNECTION"]
+DEFAULT_CONNECTION_CONFIG = {
+    "POOL_SIZE": 10,  # Keep-alive connections kept open to Solr
+    "ASYNC_POOL_SIZE": 100,  # ... and by each event loop, for the async views
+    "QUERY_TIMEOUT": (3.05, 10),  # (connect, read) timeouts in seconds for queries
+    "UPDATE_TIMEOUT": (3.05, 300),  # ... and for pushing documents
+    "RETRIES": 3,  # Retries (with backoff) for failed queries and pushes
+    "RETRY_BACKOFF": 0.5,  # Backoff factor in seconds: waits 0.5, 1, 2... seconds
+    "CIRCUIT_BREAKER_FAILURES": 5,  # Consecutive failures that open the breaker
+    "CIRCUIT_BREAKER_RESET": 30,  # Seconds before letting a request through again
+}
+
+
+class SolrUnavailable(pysolr.SolrError):
+    """Raised without contacting Solr while the circuit breaker is open"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Solr is unavailable; retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops requests to Solr for reset_timeout seconds once max_failures
+    consecutive requests have failed, so that a slow or down Solr doesn't
+    tie up every worker. After reset_timeout, one request is let through:
+    if it succeeds, the breaker closes again."""
+
+    def __init__(self, max_failures, reset_timeout):
+        self.max_failures = max_failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def before_request(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.reset_timeout:
+                raise SolrUnavailable(int(self.reset_timeout - elapsed) + 1)
+            # Half-open: let this request through, but keep everything else
+            # out until we know whether it succeeded
+            self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                self.opened_at = time.monotonic()
+
+
+class SolrSession(requests.Session):
+    """Keep-alive session used by all Solr clients, which applies
+    query or update timeouts depending on the request path (overriding
+    pysolr's single timeout), and passes requests through the circuit breaker"""
+
+    def __init__(self, query_timeout, update_timeout, breaker):
+        super().__init__()
+        self.query_timeout = query_timeout
+        self.update_timeout = update_timeout
+        self.breaker = breaker
+
+    def request(self, method, url, *args, **kwargs):
+        self.breaker.before_request()
+        is_update = urlparse(url).path.rstrip("/").endswith("/update")
+        kwargs["timeout"] = self.update_timeout if is_update else self.query_timeout
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.exceptions.RequestException:
+            self.breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+
+def get_connection_config():
+    return {
+        **DEFAULT_CONNECTION_CONFIG,
+        **settings.APIS_IPIF_CONFIG.get("CONNECTION", {}),
+    }
+
+
+@lru_cache(maxsize=None)
+def get_circuit_breaker():
+    config = get_connection_config()
+    return CircuitBreaker(
+        config["CIRCUIT_BREAKER_FAILURES"], config["CIRCUIT_BREAKER_RESET"]
+    )
+
+
+@lru_cache(maxsize=None)
+def get_session():
+    """The session (i.e. connection pool) shared by all Solr clients"""
+    config = get_connection_config()
+    session = SolrSession(
+        query_timeout=tuple(config["QUERY_TIMEOUT"]),
+        update_timeout=tuple(config["UPDATE_TIMEOUT"]),
+        breaker=get_circuit_breaker(),
+    )
+    # Queries are idempotent, and so are pushes of documents (which replace
+    # documents with the same id), so both GET and POST can be retried
+    retry = Retry(
+        total=config["RETRIES"],
+        backoff_factor=config["RETRY_BACKOFF"],
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "POST"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=config["POOL_SIZE"],
+        pool_maxsize=config["POOL_SIZE"],
+        max_retries=retry,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def time_allowed_params():
+    """Solr stops searching after QUERY_TIME_ALLOWED ms, returning what it has
+    found so far (flagged as partialResults) rather than tying up the core"""
+    time_allowed = settings.APIS_IPIF_CONFIG.get("QUERY_TIME_ALLOWED", 5000)
+    return {"timeAllowed": time_allowed} if time_allowed else {}
+
+
+def is_partial(decoded):
+    return bool(decoded.get("responseHeader", {}).get("partialResults", False))
+
+
+class IPIFSolr(pysolr.Solr):
+    def search(self, q, search_handler=None, **kwargs):
+        """Searches with timeAllowed, noting on the results whether they are partial.
+
+        (pysolr's search also passes a cursor callback to the results class
+        for cursorMark queries, which PySolaar's results classes can't take;
+        for cursors, see export.py)"""
+        params = {"q": q, **time_allowed_params(), **kwargs}
+        decoded = self.decoder.decode(self._select(params, handler=search_handler))
+        note_solr_query(params, decoded)
+        results = self.results_cls(decoded)
+        results.partial_results = is_partial(decoded)
+        return results
+
+    def add_records(self, records, commit=None):
+        """Adds documents kept as SolrRecords (see records.py), as pysolr's add
+        does dicts, but only building the dict of one document at a time"""
+        message = records_to_json(records, self.encoder).encode("utf-8")
+        return self._update(message, solrapi="JSON", commit=commit)
+
+
+def get_backend():
+    backend = settings.APIS_IPIF_CONFIG.get("BACKEND", "solr")
+    if backend not in {"solr", "sqlite"}:
+        raise ImproperlyConfigured(f"Unknown IPIF backend {backend!r}")
+    return backend
+
+
+def build_solr_client(url):
+    """A pysolr client using the shared session (or, with the sqlite backend,
+    a client storing documents in APIS_IPIF_CONFIG["SQLITE_PATH"]).
+
+    Each PySolaar index gets a client of its own: PySolaar sets the results
+    class on the client before each query, so sharing one client between
+    indexes is not thread-safe."""
+    if get_backend() == "sqlite":
+        # (Imported here, as sqlite_backend imports this module)
+        from apis_ipif_solr.sqlite_backend import SQLiteSolr
+
+        return SQLiteSolr(settings.APIS_IPIF_CONFIG.get("SQLITE_PATH", "ipif.sqlite3"))
+    return IPIFSolr(url, always_commit=True, session=get_session())
+
+
+def index_url(index_name=None):
+    """The URL of the Solr core (or collection) of an index class: its own,
+    if set in APIS_IPIF_CONFIG["CORES"], or else the shared URL"""
+    cores = settings.APIS_IPIF_CONFIG.get("CORES", {})
+    return cores.get(index_name) or settings.APIS_IPIF_CONFIG.get("URL")
+
+
+def core_urls(index_names):
+    """The distinct core URLs of index classes (by name), in order"""
+    return list(dict.fromkeys(index_url(name) for name in index_names))
+
+
+def lazy_solr_client(index_name=None):
+    """A client that is only built (with the URL of the index's core from
+    settings) when first used, rather than when the indexes are imported"""
+    return SimpleLazyObject(lambda: build_solr_client(index_url(index_name)))
+
+
+def search_params(queryset, rows=100000, start=0):
+    """The Solr params PySolaar would send for a queryset (mirroring
+    PySolaarQuerySetBase._get_results), so that it can be run by another client.
+    Pagination set on the queryset takes precedence over rows and start."""
+    params = {
+        "q": queryset._prepare_qs(),
+        "fq": queryset._child_qs_to_fqs(),
+        "fl": ",".join(
+            ["id", "pysolaar_type"]
+            + queryset.default_return_fields
+            + ["_doc", "pysolaar_type_nested", "[child limit=1000000]"]
+        ),
+        "rows": queryset.kwargs.get("rows", rows),
+        "start": queryset.kwargs.get("start", start),
+    }
+    if queryset.kwargs.get("sort"):
+        params["sort"] = queryset.kwargs["sort"]
+    return params
+
+
+def as_queryset(queryset):
+    """Index classes (e.g. PersonIndex, when no filters are applied)
+    stand in for querysets in the views; returns an actual queryset"""
+    if isinstance(queryset, type):
+        return queryset.QuerySet()
+    return queryset
+
+
+def select(queryset, params):
+    """Sends params straight to the select handler of the queryset's Solr client
+    (bypassing the results classes), returning the decoded response"""
+    solr = as_queryset(queryset)._solr
+    decoded = solr.decoder.decode(solr._select(params))
+    note_solr_query(params, decoded)
+    return decoded
+
+
+def load_results(queryset, decoded):
+    """Wraps a decoded Solr response in the queryset's PySolaar results class"""
+    results = queryset._results_class(decoded)
+    results.partial_results = is_partial(decoded)
+    return results
+
+
+class AsyncSolrClient:
+    """Runs PySolaar querysets with httpx instead of pysolr, so that the async
+    views don't hold a thread while waiting on Solr. Uses the same timeouts,
+    retries (of failed connections) and circuit breaker as the sync clients."""
+
+    def __init__(self, url):
+        try:
+            import httpx  # (Imported here, as only the async views need it)
+        except ImportError:
+            raise ImproperlyConfigured("The async IPIF views require httpx")
+        self.http_error = httpx.HTTPError
+        config = get_connection_config()
+        connect_timeout, read_timeout = config["QUERY_TIMEOUT"]
+        self.url = url.rstrip("/")
+        self.breaker = get_circuit_breaker()
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=httpx.AsyncHTTPTransport(
+                retries=config["RETRIES"],
+                limits=httpx.Limits(
+                    max_connections=config["ASYNC_POOL_SIZE"],
+                    max_keepalive_connections=config["ASYNC_POOL_SIZE"],
+                ),
+            ),
+        )
+
+    async def select(self, params):
+        """Sends params to Solr's select handler, returning the decoded response"""
+        self.breaker.before_request()
+        # (POSTed, as the queries with child filters can be long)
+        try:
+            response = await self.client.post(
+                f"{self.url}/select", data={**params, "wt": "json"}
+            )
+        except self.http_error as e:
+            self.breaker.record_failure()
+            raise pysolr.SolrError(f"Failed to connect to Solr at {self.url}: {e}")
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if response.status_code != 200:
+            raise pysolr.SolrError(
+                f"Solr responded with HTTP {response.status_code}: {response.text}"
+            )
+        decoded = response.json()
+        note_solr_query(params, decoded)
+        return decoded
+
+    async def search(self, queryset, **kwargs):
+        queryset = as_queryset(queryset)
+        decoded = await self.select(
+            {**search_params(queryset, **kwargs), **time_allowed_params()}
+        )
+        return load_results(queryset, decoded)
+
+
+# httpx clients can't be shared between event loops, so keep one per loop
+# (and per core URL)
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client(queryset):
+    """The async client for the core of the index of queryset (or index class)"""
+    url = index_url(as_queryset(queryset).pysolaar_type)
+    loop_clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    if url not in loop_clients:
+        if get_backend() == "sqlite":
+            from apis_ipif_solr.sqlite_backend import AsyncSQLiteClient
+
+            loop_clients[url] = AsyncSQLiteClient(build_solr_client(url))
+        else:
+            loop_clients[url] = AsyncSolrClient(url)
+    return loop_clients[url]
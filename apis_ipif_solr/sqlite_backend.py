@@ -0,0 +1,487 @@
+"""SQLite backend for the IPIF indexes (APIS_IPIF_CONFIG["BACKEND"] = "sqlite"),
+for small instances (of a few hundred persons: filtered lists slow down with
+the number of persons, see benchmark_ipif's backends mode) and CI, where
+there is no Solr server to run.
+
+SQLiteSolr stands in for the pysolr client of each index: it stores the
+documents PySolaar prepares for Solr (with their child documents) in a SQLite
+database, and answers the queries that PySolaar and the views send to Solr's
+select handler with responses in Solr's JSON format, so nothing above the
+client changes. Text fields are searched with FTS5; id, string and date fields
+with an index of their values; and filters on child documents are joins
+on the child rows.
+
+Only the query syntax the views generate is understood: field:value terms,
+ranges, AND/OR, negation (- or !) and brackets, PySolaar's child filters, the
+prefix query parser and nested terms queries (_query_:"{!terms f=id}...").
+Graph queries (relatesToPersonsDepth) and facets need Solr: they raise a
+SolrError, which the views return as a 503."""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+import pysolr
+
+from apis_ipif_solr.query_log import note_solr_query
+from apis_ipif_solr.records import to_solr
+from apis_ipif_solr.rendered import RENDERED_FIELD, as_returned_by_solr
+from apis_ipif_solr.solr_client import AsyncSolrClient, IPIFSolr
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    nested_type TEXT,  -- pysolaar_type_nested, of child documents
+    parent INTEGER,  -- rowid of the parent, of child documents
+    root INTEGER,  -- rowid of the top-level document of the block
+    body TEXT  -- top-level documents (with children) as Solr returns them
+);
+CREATE INDEX IF NOT EXISTS docs_id ON docs (id, parent);
+CREATE INDEX IF NOT EXISTS docs_parent ON docs (parent);
+CREATE INDEX IF NOT EXISTS docs_root ON docs (root);
+CREATE TABLE IF NOT EXISTS doc_values (doc INTEGER NOT NULL, field TEXT, value);
+CREATE INDEX IF NOT EXISTS doc_values_field ON doc_values (field, value, doc);
+CREATE INDEX IF NOT EXISTS doc_values_doc ON doc_values (doc);
+CREATE TABLE IF NOT EXISTS text_values (
+    rowid INTEGER PRIMARY KEY, doc INTEGER NOT NULL, field TEXT, value TEXT
+);
+CREATE INDEX IF NOT EXISTS text_values_doc ON text_values (doc);
+CREATE VIRTUAL TABLE IF NOT EXISTS doc_text USING fts5 (
+    value,
+    content="text_values",
+    content_rowid="rowid",
+    tokenize="unicode61 remove_diacritics 0"
+);
+"""
+
+# Fields matched exactly (as string, date etc. fields in Solr's schemaless
+# config: ids, PySolaar's types and *_s, *_ss, *_dt... fields); other string
+# fields are text fields, searched by their words
+EXACT_FIELDS = {"id", "pysolaar_type", "pysolaar_type_nested"}
+EXACT_FIELD_SUFFIX_REGEX = re.compile(r"_(s|ss|dt|dts|i|is|l|ls|b|bs|f|fs|d|ds)$")
+
+TERM_REGEX = re.compile(
+    r"""(?P<field>(?:[^\s:()\\]|\\.)+):
+    (?P<value>"(?:[^"\\]|\\.)*"|[\[{][^\]}]*[\]}]|(?:[^\s()\\]|\\.)+)""",
+    re.X,
+)
+RANGE_REGEX = re.compile(r"^([\[{])\s*(\S+)\s+TO\s+(\S+)\s*([\]}])$")
+# (As generated by PySolaarQuerySetBase._child_qs_to_fqs)
+CHILD_FILTER_REGEX = re.compile(
+    r'^\{!parent which="\*:\* -_nest_path_:\* \+pysolaar_type:(\w+)"\}'
+    r"\(\+_nest_path_:\\/_doc \+pysolaar_type_nested:\*(\w+)"
+    r" \+pysolaar_type_nested:(\w+)\* \+\((.*)\)\)$",
+    re.S,
+)
+PREFIX_QUERY_REGEX = re.compile(r"^\{!prefix f=(\S+?)(?: v=\$(\w+))?\}(.*)$", re.S)
+# (As nested in a query by graph.person_ids_q)
+TERMS_QUERY_REGEX = re.compile(r"^\{!terms f=(\S+?)\}(.*)$", re.S)
+
+
+def is_exact_field(field):
+    return field in EXACT_FIELDS or bool(EXACT_FIELD_SUFFIX_REGEX.search(field))
+
+
+def unescape(value):
+    return re.sub(r"\\(.)", r"\1", value)
+
+
+def unquote(value):
+    if value.startswith('"') and value.endswith('"'):
+        return unescape(value[1:-1])
+    return unescape(value)
+
+
+def glob_escape(value):
+    return re.sub(r"([\[\]*?])", r"[\1]", value)
+
+
+def as_list(value):
+    return value if isinstance(value, (list, tuple)) else [value]
+
+
+class QueryCompiler:
+    """Compiles a Solr (standard parser) query, as compiled by solrq, into an
+    SQL condition on column (the rowid of the document being matched)"""
+
+    def __init__(self, query, column):
+        self.column = column
+        self.tokens = []
+        self.args = []
+        position = 0
+        query = query.strip()
+        while position < len(query):
+            if query[position].isspace():
+                position += 1
+            elif query[position] in "()":
+                self.tokens.append(query[position])
+                position += 1
+            elif query[position] in "-!":  # (Negates the term or brackets after it)
+                self.tokens.append("NOT")
+                position += 1
+            elif re.match(r"(AND|OR)(?=[\s()])", query[position:]):
+                operator = re.match(r"AND|OR", query[position:]).group()
+                self.tokens.append(operator)
+                position += len(operator)
+            else:
+                match = TERM_REGEX.match(query, position)
+                if not match:
+                    raise pysolr.SolrError(
+                        f"The SQLite backend can't parse the query {query!r}"
+                    )
+                self.tokens.append((match.group("field"), match.group("value")))
+                position = match.end()
+
+    def compile(self):
+        sql = self.expression()
+        if self.tokens:
+            raise pysolr.SolrError(f"Unexpected {self.tokens[0]!r} in query")
+        return sql, self.args
+
+    def expression(self):
+        parts = [self.conjunction()]
+        # (Terms without an operator between them are ORed, as by Solr)
+        while self.tokens and self.tokens[0] != ")":
+            if self.tokens[0] == "OR":
+                self.tokens.pop(0)
+            parts.append(self.conjunction())
+        return parts[0] if len(parts) == 1 else f"({' OR '.join(parts)})"
+
+    def conjunction(self):
+        parts = [self.operand()]
+        while self.tokens and self.tokens[0] == "AND":
+            self.tokens.pop(0)
+            parts.append(self.operand())
+        return parts[0] if len(parts) == 1 else f"({' AND '.join(parts)})"
+
+    def operand(self):
+        if not self.tokens:
+            raise pysolr.SolrError("Unexpected end of query")
+        token = self.tokens.pop(0)
+        if token == "NOT":
+            return f"(NOT {self.operand()})"
+        if token == "(":
+            sql = self.expression()
+            if not self.tokens or self.tokens.pop(0) != ")":
+                raise pysolr.SolrError("Unbalanced brackets in query")
+            return sql
+        if isinstance(token, tuple):
+            return self.term(unescape(token[0]), token[1])
+        raise pysolr.SolrError(f"Unexpected {token!r} in query")
+
+    def term(self, field, value):
+        if field == "*" and value == "*":
+            return "1"
+        if field == "_query_":
+            return self.nested_query(unquote(value))
+        exact = is_exact_field(field)
+        values_table = "doc_values" if exact else "text_values"
+        if value == "*":
+            self.args.append(field)
+            return f"{self.column} IN (SELECT doc FROM {values_table} WHERE field = ?)"
+
+        range_match = RANGE_REGEX.match(value)
+        if range_match:
+            opening, lower, upper, closing = range_match.groups()
+            conditions = ["field = ?"]
+            self.args.append(field)
+            if lower != "*":
+                conditions.append("value >= ?" if opening == "[" else "value > ?")
+                self.args.append(unquote(lower))
+            if upper != "*":
+                conditions.append("value <= ?" if closing == "]" else "value < ?")
+                self.args.append(unquote(upper))
+            return (
+                f"{self.column} IN (SELECT doc FROM doc_values"
+                f" WHERE {' AND '.join(conditions)})"
+            )
+
+        value = unquote(value)
+        if exact:
+            self.args += [field, value]
+            return (
+                f"{self.column} IN"
+                " (SELECT doc FROM doc_values WHERE field = ? AND value = ?)"
+            )
+        if not re.search(r"\w", value):  # (No words to match)
+            return "0"
+        # Text fields match the words of value as a phrase
+        self.args += ['"' + value.replace('"', '""') + '"', field]
+        return (
+            f"{self.column} IN (SELECT text_values.doc FROM doc_text"
+            " JOIN text_values ON text_values.rowid = doc_text.rowid"
+            " WHERE doc_text MATCH ? AND text_values.field = ?)"
+        )
+
+    def nested_query(self, query):
+        terms_query = TERMS_QUERY_REGEX.match(query)
+        if not terms_query:
+            raise pysolr.SolrError(
+                f"The SQLite backend doesn't support the query {query!r}; this needs Solr"
+            )
+        field, terms = terms_query.groups()
+        terms = terms.split(",")
+        self.args += [field, *terms]
+        return (
+            f"{self.column} IN (SELECT doc FROM doc_values WHERE field = ?"
+            f" AND value IN ({', '.join('?' * len(terms))}))"
+        )
+
+
+def compile_query(query, params, column="docs.rowid"):
+    """An SQL condition (and its args) on top-level documents for a q or fq"""
+    query = query.strip()
+    child_filter = CHILD_FILTER_REGEX.match(query)
+    if child_filter:
+        parent_type, child_field, child_parent_type, child_query = child_filter.groups()
+        child_sql, args = QueryCompiler(child_query, "children.rowid").compile()
+        return (
+            f"{column} IN (SELECT doc FROM doc_values"
+            " WHERE field = 'pysolaar_type' AND value = ?)"
+            f" AND {column} IN (SELECT children.parent FROM docs AS children"
+            " WHERE children.parent = children.root"
+            " AND children.nested_type GLOB ? AND children.nested_type GLOB ?"
+            f" AND {child_sql})",
+            [
+                parent_type,
+                f"*{glob_escape(child_field)}",
+                f"{glob_escape(child_parent_type)}*",
+                *args,
+            ],
+        )
+    prefix_query = PREFIX_QUERY_REGEX.match(query)
+    if prefix_query:
+        field, param, value = prefix_query.groups()
+        prefix = params.get(param, "") if param else value
+        return (
+            f"{column} IN (SELECT doc FROM doc_values"
+            " WHERE field = ? AND value GLOB ?)",
+            [field, f"{glob_escape(prefix)}*"],
+        )
+    if query.startswith("{!"):
+        raise pysolr.SolrError(
+            f"The SQLite backend doesn't support the query {query!r}; this needs Solr"
+        )
+    return QueryCompiler(query, column).compile()
+
+
+def filter_fields(doc, fields, children):
+    """The fields of doc in fl (and its children, if [child] was in fl)"""
+    filtered = {
+        key: value
+        for key, value in doc.items()
+        if key in fields or key in {"id", "pysolaar_type_nested"}
+    }
+    if children and "_doc" in doc:
+        filtered["_doc"] = [
+            filter_fields(child, fields, children) for child in doc["_doc"]
+        ]
+    return filtered
+
+
+class SQLiteSolr(IPIFSolr):
+    """Stands in for pysolr.Solr, storing and querying documents in SQLite"""
+
+    def __init__(self, path):
+        super().__init__(f"sqlite:///{path}")
+        self.path = path
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        # (One connection per thread, as sqlite3 connections can't be shared)
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.execute("PRAGMA journal_mode = WAL")
+            try:
+                connection.executescript(SCHEMA)
+            except sqlite3.OperationalError as e:
+                raise ImproperlyConfigured(
+                    f"The SQLite backend needs SQLite with FTS5: {e}"
+                )
+            self.local.connection = connection
+        return connection
+
+    def add(self, docs, **kwargs):
+        with self.connection as connection:
+            for doc in docs:
+                # Child documents pre-pushed by the build (so that schemaless
+                # Solr creates their fields) are stored with their parents
+                if "pysolaar_type" not in doc:
+                    continue
+                self._delete_blocks(connection, [doc["id"]])
+                self._insert(connection, doc)
+
+    def add_records(self, records, **kwargs):
+        self.add(to_solr(record) for record in records)
+
+    def _insert(self, connection, doc, parent=None, root=None):
+        body = None
+        if parent is None:
+            body = as_returned_by_solr(doc)
+            if RENDERED_FIELD in doc:  # (A single-valued field)
+                body[RENDERED_FIELD] = doc[RENDERED_FIELD]
+            body = json.dumps(body)
+        rowid = connection.execute(
+            "INSERT INTO docs (id, nested_type, parent, root, body)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (doc["id"], doc.get("pysolaar_type_nested"), parent, root, body),
+        ).lastrowid
+        if root is None:
+            root = rowid
+            connection.execute(
+                "UPDATE docs SET root = ? WHERE rowid = ?", (root, rowid)
+            )
+
+        for field, value in doc.items():
+            if field == "_doc":
+                for child in as_list(value):
+                    self._insert(connection, child, parent=rowid, root=root)
+                continue
+            if field == RENDERED_FIELD:
+                continue
+            for value in as_list(value):
+                if value is None:
+                    continue
+                if is_exact_field(field) or not isinstance(value, str):
+                    connection.execute(
+                        "INSERT INTO doc_values (doc, field, value) VALUES (?, ?, ?)",
+                        (rowid, field, value),
+                    )
+                if not is_exact_field(field):
+                    text_rowid = connection.execute(
+                        "INSERT INTO text_values (doc, field, value) VALUES (?, ?, ?)",
+                        (rowid, field, str(value)),
+                    ).lastrowid
+                    connection.execute(
+                        "INSERT INTO doc_text (rowid, value) VALUES (?, ?)",
+                        (text_rowid, str(value)),
+                    )
+
+    def _delete_blocks(self, connection, ids=None):
+        """Deletes the top-level documents with these ids (or all documents,
+        if ids is None), with their children"""
+        if ids is None:
+            for table in ("docs", "doc_values", "text_values"):
+                connection.execute(f"DELETE FROM {table}")
+            connection.execute("INSERT INTO doc_text (doc_text) VALUES ('delete-all')")
+            return
+        placeholders = ",".join("?" * len(ids))
+        rows = (
+            "SELECT rowid FROM docs WHERE root IN (SELECT rowid FROM docs"
+            f" WHERE id IN ({placeholders}) AND parent IS NULL)"
+        )
+        # (FTS5 external content tables need deleted rows to be given back)
+        connection.execute(
+            "INSERT INTO doc_text (doc_text, rowid, value)"
+            " SELECT 'delete', rowid, value FROM text_values"
+            f" WHERE doc IN ({rows})",
+            ids,
+        )
+        for table in ("text_values", "doc_values"):
+            connection.execute(f"DELETE FROM {table} WHERE doc IN ({rows})", ids)
+        connection.execute(f"DELETE FROM docs WHERE rowid IN ({rows})", ids)
+
+    def delete(self, id=None, q=None, **kwargs):
+        with self.connection as connection:
+            if q == "*:*":
+                self._delete_blocks(connection)
+            elif id is not None:
+                self._delete_blocks(connection, as_list(id))
+            else:
+                raise pysolr.SolrError("The SQLite backend can only delete by id")
+
+    def commit(self, **kwargs):
+        pass  # (Documents are committed as they are added)
+
+    def optimize(self, **kwargs):
+        self.connection.execute("INSERT INTO doc_text (doc_text) VALUES ('optimize')")
+
+    def _select(self, params, handler=None):
+        started = time.perf_counter()
+        if any(key.startswith(("facet", "json.facet", "stats")) for key in params):
+            raise pysolr.SolrError("Facets need Solr; the SQLite backend can't do them")
+
+        conditions = ["docs.parent IS NULL"]
+        args = []
+        for query in [params.get("q", "*:*"), *as_list(params.get("fq", []))]:
+            sql, query_args = compile_query(query, params)
+            conditions.append(sql)
+            args += query_args
+        where = " AND ".join(conditions)
+        num_found = self.connection.execute(
+            f"SELECT COUNT(*) FROM docs WHERE {where}", args
+        ).fetchone()[0]
+
+        order = "docs.rowid"
+        sort = params.get("sort", "")
+        if sort:
+            if sort not in {"id asc", "id desc"}:
+                raise pysolr.SolrError(f"The SQLite backend can't sort by {sort!r}")
+            order = f"docs.id {sort.split()[1].upper()}"
+        cursor_mark = params.get("cursorMark")
+        start = int(params.get("start", 0))
+        if cursor_mark is not None:
+            start = 0
+            if cursor_mark != "*":
+                where += " AND docs.id > ?" if "asc" in sort else " AND docs.id < ?"
+                args.append(cursor_mark)
+        rows = int(params.get("rows", 10))
+        docs = [
+            json.loads(body)
+            for (body,) in self.connection.execute(
+                f"SELECT body FROM docs WHERE {where} ORDER BY {order}"
+                " LIMIT ? OFFSET ?",
+                [*args, rows, start],
+            )
+        ]
+
+        fl = [field.strip() for field in params.get("fl", "*").split(",")]
+        if "*" not in fl:
+            children = any(field.startswith("[child") for field in fl)
+            docs = [filter_fields(doc, set(fl), children) for doc in docs]
+
+        response = {
+            "responseHeader": {
+                "status": 0,
+                "QTime": int((time.perf_counter() - started) * 1000),
+            },
+            "response": {"numFound": num_found, "start": start, "docs": docs},
+        }
+        if cursor_mark is not None:
+            response["nextCursorMark"] = docs[-1]["id"] if docs else cursor_mark
+        return json.dumps(response)
+
+    def index_size(self):
+        """As measure_index_size reports it for Solr"""
+        num_docs, max_doc = self.connection.execute(
+            "SELECT COUNT(*) FILTER (WHERE parent IS NULL), COUNT(*) FROM docs"
+        ).fetchone()
+        files = [self.path, f"{self.path}-wal"]
+        return {
+            "numDocs": num_docs,
+            "maxDoc": max_doc,
+            "sizeInBytes": sum(os.path.getsize(f) for f in files if os.path.exists(f)),
+        }
+
+
+class AsyncSQLiteClient(AsyncSolrClient):
+    """Runs queries on the SQLite backend in a thread, for the async views"""
+
+    def __init__(self, solr):
+        self.solr = solr
+
+    def select_sync(self, params):
+        return self.solr.decoder.decode(self.solr._select(params))
+
+    async def select(self, params):
+        decoded = await sync_to_async(self.select_sync, thread_sensitive=False)(params)
+        note_solr_query(params, decoded)
+        return decoded
@@ -0,0 +1,64 @@
+from django.conf import settings
+from pysolaar.utils.encoders_and_decoders import encode_field_name
+from rest_framework.response import Response
+
+from apis_ipif_solr.api_views import MAX_PAGE_SIZE, IPIFView
+from apis_ipif_solr.indexes import SuggestIndex
+from apis_ipif_solr.params import InvalidParam, int_param
+from apis_ipif_solr.solr_client import load_results, search_params, select
+
+SUGGEST_SIZE = settings.APIS_IPIF_CONFIG.get("SUGGEST_SIZE", 10)
+SUGGEST_TYPES = {"person", "source", "place", "memberOf"}
+SUGGEST_FIELD = encode_field_name(SuggestIndex.QuerySet.pysolaar_type, "suggest_ss")
+
+
+def suggest_params(params):
+    """The queryset and Solr params for labels with a word starting with
+    the q param, optionally of one type (person, source, place or memberOf)"""
+    prefix = params.get("q", "").strip().casefold()
+    if not prefix:
+        raise InvalidParam("q (the start of a label) is required")
+    size = min(int_param(params, "size", SUGGEST_SIZE), MAX_PAGE_SIZE)
+    if size < 1:
+        raise InvalidParam("size must be at least 1")
+
+    suggest_type = params.get("type")
+    if suggest_type and suggest_type not in SUGGEST_TYPES:
+        raise InvalidParam(f"type should be one of {sorted(SUGGEST_TYPES)}")
+    queryset = (
+        SuggestIndex.filter(kind=suggest_type)
+        if suggest_type
+        else SuggestIndex.QuerySet()
+    )
+
+    solr_params = search_params(queryset, rows=size)
+    # The prefix query parser takes the prefix as is (a prefix of the
+    # lowercased terms, see indexes.suggest_terms), so it needs no escaping;
+    # the type filter goes in fq, where Solr caches it between keystrokes
+    solr_params["fq"] = [*solr_params["fq"], solr_params["q"]]
+    solr_params["q"] = f"{{!prefix f={SUGGEST_FIELD} v=$prefix}}"
+    solr_params["prefix"] = prefix
+    return queryset, solr_params
+
+
+def unpack_suggestions(queryset, decoded):
+    return {"suggestions": list(load_results(queryset, decoded))}
+
+
+class SuggestView(IPIFView):
+    def get(self, request, format=None):
+        """
+        Get labels of persons, sources, places and institutions (memberOf)
+        with a word starting with q, for type-ahead.
+
+        Params:
+
+            q       start of a word of the label (case insensitive)
+            type    only labels of person, source, place or memberOf
+            size    number of suggestions (default 10)
+
+        Returns {"suggestions": [{"@id": ..., "label": ..., "type": ...}]}:
+        the @id can be used with the person/source/place/memberOf params.
+        """
+        queryset, solr_params = suggest_params(request.query_params)
+        return Response(unpack_suggestions(queryset, select(queryset, solr_params)))
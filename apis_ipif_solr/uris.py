@@ -0,0 +1,95 @@
+from functools import lru_cache, reduce
+from operator import or_
+import re
+
+from django.conf import settings
+from pysolaar import Q
+from solrq import Value
+
+from apis_ipif_solr.indexes import UriIndex
+from apis_ipif_solr.solr_client import as_queryset, load_results, search_params, select
+
+URI_CACHE_SIZE = settings.APIS_IPIF_CONFIG.get("URI_CACHE_SIZE", 10000)
+# (A URI is shared by few entities; this is just a bound)
+URI_MAX_MATCHES = 100
+
+# Absolute URIs (e.g. GND, GeoNames, Wikidata) and APIS paths (get_absolute_url)
+URI_REGEX = re.compile(r"^([a-z][a-z0-9+.-]*://|/)", re.I)
+
+# Statement params whose values may be URIs, resolved to ids before filtering
+# (relatesToPersons is resolved by the graph query, see graph.py)
+URI_PARAMS = ("place", "memberOf")
+
+
+def looks_like_uri(value):
+    return bool(value) and bool(URI_REGEX.match(value))
+
+
+def needs_uri_lookup(params, id=None):
+    """Whether filtering by params (or looking up id) will resolve a URI"""
+    return looks_like_uri(id) or any(
+        looks_like_uri(params.get(key)) for key in URI_PARAMS
+    )
+
+
+class UnresolvedUri(Exception):
+    pass
+
+
+@lru_cache(maxsize=URI_CACHE_SIZE)
+def _resolve_known_uri(uri):
+    queryset = as_queryset(UriIndex.filter(uri_s=uri))
+    decoded = select(queryset, search_params(queryset, rows=URI_MAX_MATCHES))
+    refs = tuple((doc["kind"], doc["ref"]) for doc in load_results(queryset, decoded))
+    if not refs:
+        # (Raised, so that lru_cache doesn't keep it: the URI may be added by
+        # the next rebuild, and then should not go on matching nothing)
+        raise UnresolvedUri(uri)
+    return refs
+
+
+def resolve_uri(uri):
+    """The (kind, id) of each entity with the uri, from UriIndex.
+
+    Cached in the process, as the same few URIs (of popular places, say)
+    are looked up again and again; a rebuild only adds or removes URIs,
+    which the cache picks up as entries are evicted or the process restarts.
+    URIs no entity has are looked up again each time."""
+    try:
+        return _resolve_known_uri(uri)
+    except UnresolvedUri:
+        return ()
+
+
+def resolved_ids(value, kind):
+    """Ids of the entities of kind (person, place or memberOf) with the URI
+    value; None if value is not a URI, or no such entity has it (in which
+    case filters fall back to matching the value against uris and labels)"""
+    if not looks_like_uri(value):
+        return None
+    return [ref for ref_kind, ref in resolve_uri(value) if ref_kind == kind] or None
+
+
+def ids_q(field, ids):
+    """Matches any of ids in the (exact) field"""
+    return reduce(or_, [Q(**{field: id}) for id in ids])
+
+
+def without_field_q(q, field):
+    """Matches q in documents lacking field, e.g. statements indexed before
+    field was added to StatementIndex.
+
+    (Written as "q AND -field:*", as a bracketed negation on its own, which
+    solrq makes of ~Q, matches nothing in Solr)"""
+    return Q(
+        children=[q, Q(**{field: Value("*", safe=True)})],
+        op=lambda compiled: f"{compiled[0]} AND -{compiled[1]}",
+    )
+
+
+def person_q(value):
+    """Matches the person with the id or uri value"""
+    person_ids = resolved_ids(value, "person")
+    if person_ids:
+        return ids_q("id", person_ids)
+    return Q(id=value) | Q(uris=value)
@@ -1,25 +1,86 @@
-from django.urls import path, re_path
+from functools import lru_cache
 
-from .api_views import (
-    FactoidsListView,
-    FactoidsView,
-    PersonsListView,
-    PersonsView,
-    SourcesView,
-    SourcesListView,
-    StatementsListView,
-    StatementsView,
-)
+from django.conf import settings
+from django.urls import path, re_path
+from django.utils.module_loading import import_string
 
 app_name = "apis_ipif_solr"
 
-urlpatterns = [
-    path("persons/", PersonsListView.as_view()),
-    re_path(r"persons/(?P<id>(https?://)?.*)$", PersonsView.as_view()),
-    path("factoids/", FactoidsListView.as_view()),
-    re_path(r"factoids/(?P<id>(https?://)?.*)$", FactoidsView.as_view()),
-    path("statements/", StatementsListView.as_view()),
-    re_path(r"statements/(?P<id>(https?://)?.*)$", StatementsView.as_view()),
-    path("sources/", SourcesListView.as_view()),
-    re_path(r"sources/(?P<id>(https?://)?.*)$", SourcesView.as_view()),
-]
+
+@lru_cache(maxsize=None)
+def load_view(view_path):
+    view = import_string(f"apis_ipif_solr.{view_path}")
+    return view.as_view() if isinstance(view, type) else view
+
+
+def lazy_view(view_path):
+    """Stands in for a view, importing it (and with it the indexes, PySolaar
+    and pysolr) on the first request, rather than when the URLconf is loaded
+    (e.g. by the system checks of every management command)"""
+
+    def view(request, *args, **kwargs):
+        return load_view(view_path)(request, *args, **kwargs)
+
+    view.csrf_exempt = True  # (As DRF views are; DRF does its own CSRF checks)
+    return view
+
+
+def lazy_async_view(view_path):
+    async def view(request, *args, **kwargs):
+        return await load_view(view_path)(request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    return view
+
+
+# (Before the detail paths, which would otherwise match "export" etc. as an id)
+EXPORT_PATH = r"^(?P<ipif_type>persons|factoids|statements|sources)/export/?$"
+FACETS_PATH = r"^(?P<ipif_type>persons|statements)/facets/?$"
+
+if settings.APIS_IPIF_CONFIG.get("ASYNC_VIEWS", False):
+    urlpatterns = [
+        re_path(EXPORT_PATH, lazy_async_view("async_views.export")),
+        re_path(FACETS_PATH, lazy_async_view("async_views.facets")),
+        path("persons/", lazy_async_view("async_views.persons_list")),
+        re_path(
+            r"persons/(?P<id>(https?://)?.*)$",
+            lazy_async_view("async_views.person_detail"),
+        ),
+        path("factoids/", lazy_async_view("async_views.factoids_list")),
+        re_path(
+            r"factoids/(?P<id>(https?://)?.*)$",
+            lazy_async_view("async_views.factoid_detail"),
+        ),
+        path("statements/", lazy_async_view("async_views.statements_list")),
+        re_path(
+            r"statements/(?P<id>(https?://)?.*)$",
+            lazy_async_view("async_views.statement_detail"),
+        ),
+        path("sources/", lazy_async_view("async_views.sources_list")),
+        re_path(
+            r"sources/(?P<id>(https?://)?.*)$",
+            lazy_async_view("async_views.source_detail"),
+        ),
+        path("batch/", lazy_async_view("async_views.batch")),
+        path("suggest/", lazy_async_view("async_views.suggest")),
+    ]
+else:
+    urlpatterns = [
+        re_path(EXPORT_PATH, lazy_view("export.ExportView")),
+        re_path(FACETS_PATH, lazy_view("facets.FacetsView")),
+        path("persons/", lazy_view("api_views.PersonsListView")),
+        re_path(r"persons/(?P<id>(https?://)?.*)$", lazy_view("api_views.PersonsView")),
+        path("factoids/", lazy_view("api_views.FactoidsListView")),
+        re_path(
+            r"factoids/(?P<id>(https?://)?.*)$", lazy_view("api_views.FactoidsView")
+        ),
+        path("statements/", lazy_view("api_views.StatementsListView")),
+        re_path(
+            r"statements/(?P<id>(https?://)?.*)$",
+            lazy_view("api_views.StatementsView"),
+        ),
+        path("sources/", lazy_view("api_views.SourcesListView")),
+        re_path(r"sources/(?P<id>(https?://)?.*)$", lazy_view("api_views.SourcesView")),
+        path("batch/", lazy_view("batch.BatchView")),
+        path("suggest/", lazy_view("suggest.SuggestView")),
+    ]
@@ -0,0 +1,85 @@
+"""Warming Solr's caches (filterCache, queryResultCache) and the count cache
+after a build, Solr restart or deploy, by replaying frequent IPIF requests.
+
+The requests replayed are the most frequent ones recorded by query_log (the
+WARMUP_TOP most frequent, over the last QUERY_STATS_WINDOW seconds), followed
+by those in APIS_IPIF_CONFIG["WARMUP_REQUESTS"], e.g. ["/ipif/persons/?role=birth"].
+They are sent to the views in this process, or, given a base_url, over HTTP
+(e.g. to the new instance before traffic is switched over to it)."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.urls import resolve
+import requests
+from rest_framework.test import APIRequestFactory
+
+from apis_ipif_solr.query_log import WARMUP_HEADER, cached_top_requests
+
+WARMUP_TOP = settings.APIS_IPIF_CONFIG.get("WARMUP_TOP", 100)
+WARMUP_CONCURRENCY = settings.APIS_IPIF_CONFIG.get("WARMUP_CONCURRENCY", 4)
+
+
+def warmup_requests(top=WARMUP_TOP):
+    """The recorded top requests and the configured seed requests, without
+    duplicates (as path?query strings)"""
+    seed = settings.APIS_IPIF_CONFIG.get("WARMUP_REQUESTS", [])
+    return list(dict.fromkeys([*cached_top_requests(top), *seed]))
+
+
+def request_in_process(request_path):
+    """Sends a (GET) request straight to its view, returning the rendered
+    response. (Sent as a warmup request, so that it is not counted.)"""
+    path = request_path.partition("?")[0]
+    match = resolve(path)
+    request = APIRequestFactory().get(request_path, HTTP_X_IPIF_WARMUP="1")
+    view = match.func
+    if asyncio.iscoroutinefunction(view):
+        view = async_to_sync(view)
+    response = view(request, *match.args, **match.kwargs)
+    if hasattr(response, "render"):
+        response.render()
+    return response
+
+
+def replay_in_process(request_path):
+    """Sends a request straight to its view, returning the status code"""
+    return request_in_process(request_path).status_code
+
+
+def warm_up(request_paths, concurrency=WARMUP_CONCURRENCY, base_url=None):
+    """Replays request_paths, at most concurrency at a time, printing how
+    long each took; returns the number of requests that failed"""
+    if base_url:
+        session = requests.Session()
+
+        def replay(request_path):
+            response = session.get(
+                f"{base_url.rstrip('/')}{request_path}",
+                headers={WARMUP_HEADER: "1"},
+                timeout=60,
+            )
+            return response.status_code
+
+    else:
+        replay = replay_in_process
+
+    def timed_replay(request_path):
+        start = time.perf_counter()
+        try:
+            status = replay(request_path)
+        except Exception as e:
+            status = f"failed ({e})"
+        return request_path, status, (time.perf_counter() - start) * 1000
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for request_path, status, ms in executor.map(timed_replay, request_paths):
+            print(f"{status} {ms:>8.0f} ms  {request_path}")
+            if status != 200:
+                failed += 1
+    print(f"Warmed up with {len(request_paths)} requests ({failed} failed)")
+    return failed
@@ -0,0 +1,167 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+import pytest
+import reversion
+
+from apis_core.apis_entities.models import Institution, Person, Place
+from apis_core.apis_metainfo.models import Source, Uri
+from apis_core.apis_relations.models import PersonInstitution, PersonPerson, PersonPlace
+from apis_core.apis_vocabularies.models import (
+    PersonInstitutionRelation,
+    PersonPersonRelation,
+    PersonPlaceRelation,
+)
+from apis_ipif_solr.build import INDEX_CLASSES, build_indexes, select_persons
+from apis_ipif_solr.uris import _resolve_known_uri
+
+WIEN_URI = "https://www.geonames.org/2761369"
+SALZBURG_URI = "https://www.geonames.org/2766824"
+UNIVERSITY_URI = "https://d-nb.info/gnd/2024353-2"
+
+# (key, name, first name, gender, born, died, GND id)
+# fmt: off
+PERSONS = [
+    ("mozart", "Mozart", "Wolfgang Amadeus", "male", "27.01.1756", "05.12.1791", "118584596"),
+    ("haydn", "Haydn", "Joseph", "male", "31.03.1732", "31.05.1809", "118547356"),
+    ("beethoven", "Beethoven", "Ludwig van", "male", "17.12.1770", "26.03.1827", "118508288"),
+    ("paradis", "Paradis", "Maria Theresia", "female", "15.05.1759", "01.02.1824", "118739344"),
+]
+# fmt: on
+
+
+def create(model, **fields):
+    """Creates an instance of model, saved in a revision by the editor"""
+    with reversion.create_revision():
+        reversion.set_user(User.objects.get_or_create(username="editor")[0])
+        return model.objects.create(**fields)
+
+
+@pytest.fixture
+def persons(db):
+    """A few persons, with places, an institution and persons they are related
+    to, each saved in a revision"""
+    source = Source.objects.create(orig_filename="oebl.xml")
+
+    wien = create(Place, name="Wien")
+    salzburg = create(Place, name="Salzburg")
+    university = create(Institution, name="Universität Wien")
+    for entity, uri in [
+        (wien, WIEN_URI),
+        (salzburg, SALZBURG_URI),
+        (university, UNIVERSITY_URI),
+    ]:
+        Uri.objects.create(uri=uri, entity=entity)
+
+    born_in = PersonPlaceRelation.objects.create(
+        name="born in", name_reverse="place of birth of"
+    )
+    died_in = PersonPlaceRelation.objects.create(
+        name="died in", name_reverse="place of death of"
+    )
+    member_of = PersonInstitutionRelation.objects.create(
+        name="member of", name_reverse="has member"
+    )
+    teacher_of = PersonPersonRelation.objects.create(
+        name="teacher of", name_reverse="student of"
+    )
+
+    people = {}
+    for key, name, first_name, gender, born, died, gnd in PERSONS:
+        person = create(
+            Person,
+            name=name,
+            first_name=first_name,
+            gender=gender,
+            start_date_written=born,
+            end_date_written=died,
+            source=source,
+        )
+        Uri.objects.create(uri=f"https://d-nb.info/gnd/{gnd}", entity=person)
+        people[key] = person
+
+    for key, place, relation_type, date in [
+        ("mozart", salzburg, born_in, "27.01.1756"),
+        ("mozart", wien, died_in, "05.12.1791"),
+        ("haydn", wien, died_in, "31.05.1809"),
+        ("beethoven", wien, died_in, "26.03.1827"),
+        ("paradis", wien, born_in, "15.05.1759"),
+    ]:
+        create(
+            PersonPlace,
+            related_person=people[key],
+            related_place=place,
+            relation_type=relation_type,
+            start_date_written=date,
+        )
+    create(
+        PersonInstitution,
+        related_person=people["haydn"],
+        related_institution=university,
+        relation_type=member_of,
+        start_date_written="1790",
+        end_date_written="1795",
+    )
+    create(
+        PersonPerson,
+        related_personA=people["haydn"],
+        related_personB=people["beethoven"],
+        relation_type=teacher_of,
+        start_date_written="1792",
+    )
+    return people
+
+
+@pytest.fixture
+def pupils(persons):
+    """persons, and a dozen more, each born in Wien, a member of the university
+    and a student of Haydn: the same kinds of relations as persons have"""
+    wien = Place.objects.get(name="Wien")
+    university = Institution.objects.get(name="Universität Wien")
+    pupils = dict(persons)
+    for n in range(12):
+        pupil = create(
+            Person,
+            name=f"Pupil{n}",
+            first_name="Anonymous",
+            gender="male",
+            start_date_written=f"01.01.{1770 + n}",
+            source=persons["haydn"].source,
+        )
+        Uri.objects.create(uri=f"https://example.org/pupil/{n}", entity=pupil)
+        create(
+            PersonPlace,
+            related_person=pupil,
+            related_place=wien,
+            relation_type=PersonPlaceRelation.objects.get(name="born in"),
+        )
+        create(
+            PersonInstitution,
+            related_person=pupil,
+            related_institution=university,
+            relation_type=PersonInstitutionRelation.objects.get(),
+        )
+        create(
+            PersonPerson,
+            related_personA=persons["haydn"],
+            related_personB=pupil,
+            relation_type=PersonPersonRelation.objects.get(),
+        )
+        pupils[f"pupil{n}"] = pupil
+    return pupils
+
+
+@pytest.fixture
+def empty_index():
+    """The (sqlite backend) indexes emptied, and what was cached from them
+    cleared"""
+    for index_class in INDEX_CLASSES.values():
+        index_class.QuerySet._solr.delete(q="*:*")
+    cache.clear()
+    _resolve_known_uri.cache_clear()
+
+
+@pytest.fixture
+def ipif_index(persons, empty_index):
+    """The indexes built from persons"""
+    build_indexes(persons=select_persons())
+    return persons
@@ -0,0 +1,33 @@
+"""Django settings for the tests: an APIS database in memory, and the IPIF
+indexes in a SQLite file (the sqlite backend), so no Solr server is needed"""
+
+import os
+import tempfile
+
+SECRET_KEY = "apis-ipif-solr-tests"
+USE_TZ = False
+
+INSTALLED_APPS = [
+    "django.contrib.contenttypes",
+    "django.contrib.auth",
+    "reversion",
+    "rest_framework",
+    "apis_core.apis_labels",
+    "apis_core.apis_metainfo",
+    "apis_core.apis_vocabularies",
+    "apis_core.apis_entities",
+    "apis_core.apis_relations",
+    "apis_bibsonomy",
+    "apis_ipif_solr",
+]
+
+DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}}
+
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+ROOT_URLCONF = "tests.urls"
+
+APIS_IPIF_CONFIG = {
+    "BACKEND": "sqlite",
+    "SQLITE_PATH": os.path.join(tempfile.mkdtemp(), "ipif.sqlite3"),
+}
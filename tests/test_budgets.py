@@ -0,0 +1,65 @@
+import pytest
+
+from apis_ipif_solr.budgets import (
+    budget_requests,
+    check_build_budgets,
+    check_solr_budgets,
+    measure_build_queries,
+    measure_solr_requests,
+)
+from apis_ipif_solr.build import INDEX_CLASSES, select_persons
+
+# Database queries per chunk of persons building each index (at most: with
+# persons related to those of the chunk outside it, see pupils), which don't
+# grow with the number of persons in the chunk
+BUILD_QUERY_BUDGETS = {
+    "FactoidIndex": 27,
+    "PersonIndex": 27,
+    "SourceIndex": 27,
+    "StatementIndex": 27,
+    "SuggestIndex": 10,
+    "UriIndex": 10,
+}
+SOLR_REQUESTS_BUDGET = 2
+
+
+def test_every_index_has_a_budget():
+    assert set(BUILD_QUERY_BUDGETS) == set(INDEX_CLASSES)
+
+
+@pytest.mark.parametrize("index_name", sorted(BUILD_QUERY_BUDGETS))
+def test_build_query_budget(pupils, index_name):
+    queries = {
+        chunk_size: measure_build_queries(
+            select_persons(), [INDEX_CLASSES[index_name]], chunk_size
+        )[index_name]
+        for chunk_size in (2, 4, len(pupils))
+    }
+    assert all(
+        len(chunk_queries) <= BUILD_QUERY_BUDGETS[index_name]
+        for chunk_queries in queries.values()
+    )
+    # (A chunk of all the persons takes no more queries than a chunk of a few)
+    assert len(queries[len(pupils)]) <= len(queries[2])
+    build_queries = {index_name: queries[len(pupils)]}
+    assert check_build_budgets(build_queries, BUILD_QUERY_BUDGETS) == []
+
+
+def test_build_query_budget_breaches(persons):
+    build_queries = measure_build_queries(select_persons(), [INDEX_CLASSES["UriIndex"]])
+    (breach,) = check_build_budgets(build_queries, {"UriIndex": 1})
+    assert breach.startswith("UriIndex made")
+    (breach,) = check_build_budgets(build_queries, {})
+    assert breach.startswith("UriIndex has no build query budget")
+
+
+def test_solr_requests_budget(ipif_index):
+    solr_requests = measure_solr_requests("/ipif/")
+    # (All list requests but relatesToPersonsDepth, which needs Solr's graph
+    # query parser, are answered)
+    for _, request_path in budget_requests("/ipif/"):
+        if "relatesToPersonsDepth" not in request_path:
+            assert solr_requests[request_path]["status"] == 200
+    assert check_solr_budgets(solr_requests, SOLR_REQUESTS_BUDGET) == []
+    (request_path, measured), *_ = solr_requests.items()
+    assert check_solr_budgets({request_path: measured}, 0) != []
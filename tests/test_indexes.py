@@ -0,0 +1,41 @@
+from collections import Counter
+
+from apis_ipif_solr.build import select_persons
+from apis_ipif_solr.indexes import (
+    FILTERED_STATEMENT_FIELDS,
+    INDEX_CLASSES,
+    PersonIndex,
+    SuggestIndex,
+    UriIndex,
+    iterate_person_chunks,
+)
+
+
+def test_document_caches_are_emptied_after_each_chunk(persons):
+    chunks = iterate_person_chunks(select_persons(), chunk_size=2)
+    next(chunks)
+    for index_class in INDEX_CLASSES:
+        index_class._DOCUMENT_CACHE = {"built": "for the first chunk"}
+    next(chunks)
+    assert all(index_class._DOCUMENT_CACHE == {} for index_class in INDEX_CLASSES)
+
+
+def test_related_entities_are_built_once_per_chunk(persons):
+    # (Wien is related to all four persons, which make one chunk)
+    for index_class in (SuggestIndex, UriIndex):
+        ids = Counter(doc.id for doc in index_class.build_document_set())
+        assert set(ids.values()) == {1}
+
+
+def test_nested_statements_store_only_filtered_fields(persons):
+    stored = {"id", "createdBy", "modifiedBy", "relatesToPersons"}
+    stored |= {"pysolaar_type_nested", *FILTERED_STATEMENT_FIELDS}
+    for document in PersonIndex.build_document_set(select_persons()):
+        statements = [
+            child
+            for child in document.doc_to_solr()["_doc"]
+            if child["pysolaar_type_nested"].endswith("ST")
+        ]
+        assert statements
+        for statement in statements:
+            assert {field.rpartition("______")[2] for field in statement} <= stored
@@ -0,0 +1,42 @@
+import asyncio
+
+from apis_ipif_solr import query_log
+from apis_ipif_solr.query_log import (
+    MAX_FINGERPRINTS,
+    QueryStats,
+    cached_stats,
+    fingerprint,
+)
+
+
+def test_fingerprints_name_only_ipif_params():
+    params = {"role": "birth", "size": "10", "combineStatementFilters": "and"}
+    assert (
+        fingerprint("PersonsListView", params, [])
+        == "PersonsListView?combineStatementFilters=and&role&size"
+    )
+    params = {"role": "birth", "utm_source": "x", "_": "1700000000"}
+    assert fingerprint("PersonsListView", params, []) == "PersonsListView?role&other"
+    params = {"combineStatementFilters": "x" * 100}
+    assert (
+        fingerprint("PersonsListView", params, [])
+        == "PersonsListView?combineStatementFilters=other"
+    )
+
+
+def test_fingerprints_per_bucket_are_capped():
+    stats = QueryStats(3600)
+    for n in range(MAX_FINGERPRINTS + 10):
+        stats.record(f"PersonsListView {n}", 10, 1)
+    # (With OTHER, once full)
+    assert all(len(bucket) <= MAX_FINGERPRINTS + 1 for bucket in stats.buckets.values())
+    counts = [count for count, *_ in stats.snapshot().values()]
+    assert sum(counts) == MAX_FINGERPRINTS + 10
+
+
+def test_stats_are_flushed_to_the_cache_by_async_views(monkeypatch):
+    monkeypatch.setattr(query_log, "QUERY_STATS_FLUSH", 0)
+    stats = QueryStats(3600)
+    stats.record("PersonsListView?role", 10, 1)
+    asyncio.run(stats.aflush_if_due())
+    assert cached_stats()["PersonsListView?role"] == (1, 10, 1, 10)
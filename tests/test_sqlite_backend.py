@@ -0,0 +1,241 @@
+import pysolr
+import pytest
+
+from apis_ipif_solr.sqlite_backend import SQLiteSolr
+
+# (Child filters as PySolaar generates them, for filter_by_distinct_child)
+CHILD_FILTER = (
+    '{!parent which="*:* -_nest_path_:* +pysolaar_type:PersonIndex"}'
+    "(+_nest_path_:\\/_doc +pysolaar_type_nested:*ST"
+    " +pysolaar_type_nested:PersonIndex* +(%s))"
+)
+
+
+def person(pk, label, born, suggest, statements):
+    return {
+        "id": pk,
+        "pysolaar_type": "PersonIndex",
+        "PersonIndex______label": label,
+        "PersonIndex______born_dt": born,
+        "PersonIndex______suggest_ss": suggest,
+        "_doc": [
+            {
+                "id": f"{pk}_{n}",
+                "pysolaar_type_nested": "PersonIndex##########StatementIndex##########ST",
+                "PersonIndex______ST______places__label": place,
+                "PersonIndex______ST______role__label": role,
+            }
+            for n, (place, role) in enumerate(statements)
+        ],
+    }
+
+
+@pytest.fixture
+def solr(tmp_path):
+    solr = SQLiteSolr(str(tmp_path / "ipif.sqlite3"))
+    solr.add(
+        [
+            person(
+                "1",
+                "Mozart, Wolfgang Amadeus",
+                "1756-01-27T00:00:00Z",
+                ["mozart", "wolfgang amadeus"],
+                [("Salzburg", "birth"), ("Wien", "death")],
+            ),
+            person(
+                "2",
+                "Haydn, Joseph",
+                "1732-03-31T00:00:00Z",
+                ["haydn", "joseph"],
+                [("Rohrau", "birth"), ("Wien", "death")],
+            ),
+            person(
+                "3",
+                "Beethoven, Ludwig van",
+                "1770-12-17T00:00:00Z",
+                ["beethoven", "ludwig van"],
+                [("Bonn", "birth"), ("Wien", "death")],
+            ),
+            person(
+                "4",
+                "Paradis, Maria Theresia",
+                "1759-05-15T00:00:00Z",
+                ["paradis", "maria theresia"],
+                [("Wien", "birth"), ("Wien", "death")],
+            ),
+        ]
+    )
+    return solr
+
+
+def ids(solr, q, **params):
+    return sorted(doc["id"] for doc in solr.search(q, **params).docs)
+
+
+def check_full_text_index(solr):
+    """Raises if the FTS5 index is out of step with the text_values rows it
+    indexes (as when rows are deleted without being given back to it)"""
+    solr.connection.execute(
+        "INSERT INTO doc_text (doc_text, rank) VALUES ('integrity-check', 1)"
+    )
+
+
+def test_and_or_and_brackets(solr):
+    assert ids(solr, "pysolaar_type:PersonIndex AND PersonIndex______label:Mozart") == [
+        "1"
+    ]
+    assert ids(
+        solr, "PersonIndex______label:Mozart OR PersonIndex______label:Haydn"
+    ) == ["1", "2"]
+    assert ids(
+        solr,
+        "(PersonIndex______label:Mozart OR PersonIndex______label:Haydn)"
+        " AND PersonIndex______suggest_ss:joseph",
+    ) == ["2"]
+    assert ids(
+        solr,
+        "PersonIndex______label:Mozart"
+        " OR (PersonIndex______label:Haydn AND PersonIndex______suggest_ss:mozart)",
+    ) == ["1"]
+
+
+def test_terms_without_operator_are_ored(solr):
+    assert ids(solr, "PersonIndex______label:Mozart PersonIndex______label:Haydn") == [
+        "1",
+        "2",
+    ]
+
+
+def test_negation(solr):
+    assert ids(
+        solr, "pysolaar_type:PersonIndex AND -PersonIndex______label:Mozart"
+    ) == ["2", "3", "4"]
+    assert ids(
+        solr,
+        "pysolaar_type:PersonIndex"
+        " AND !(PersonIndex______label:Mozart OR PersonIndex______label:Haydn)",
+    ) == ["3", "4"]
+    assert ids(solr, "pysolaar_type:PersonIndex AND -PersonIndex______born_dt:*") == []
+
+
+def test_inclusive_and_exclusive_ranges(solr):
+    born = "PersonIndex______born_dt"
+    assert ids(solr, f'{born}:["1756-01-27T00:00:00Z" TO "1770-12-17T00:00:00Z"]') == [
+        "1",
+        "3",
+        "4",
+    ]
+    assert ids(
+        solr, f'{born}:{{"1756-01-27T00:00:00Z" TO "1770-12-17T00:00:00Z"}}'
+    ) == ["4"]
+    assert ids(solr, f'{born}:[* TO "1756-01-27T00:00:00Z"}}') == ["2"]
+    assert ids(solr, f'{born}:["1760-01-01T00:00:00Z" TO *]') == ["3"]
+
+
+def test_text_fields_match_phrases(solr):
+    assert ids(solr, 'PersonIndex______label:"Wolfgang Amadeus"') == ["1"]
+    assert ids(solr, 'PersonIndex______label:"Amadeus Wolfgang"') == []
+    assert ids(solr, "PersonIndex______label:mozart") == ["1"]
+    # (Exact fields match the whole value)
+    assert ids(solr, "PersonIndex______suggest_ss:wolfgang") == []
+
+
+def test_child_filters(solr):
+    place = "PersonIndex______ST______places__label"
+    role = "PersonIndex______ST______role__label"
+    assert ids(solr, "*:*", fq=CHILD_FILTER % f"{place}:Wien") == ["1", "2", "3", "4"]
+    assert ids(solr, "*:*", fq=CHILD_FILTER % f"{place}:Wien AND {role}:birth") == ["4"]
+    # (Both terms must match the same child)
+    assert (
+        ids(solr, "*:*", fq=CHILD_FILTER % f"{place}:Salzburg AND {role}:death") == []
+    )
+    assert ids(
+        solr,
+        "*:*",
+        fq=[CHILD_FILTER % f"{place}:Salzburg", CHILD_FILTER % f"{role}:death"],
+    ) == ["1"]
+
+
+def test_prefix_queries(solr):
+    assert ids(
+        solr, "{!prefix f=PersonIndex______suggest_ss v=$prefix}", prefix="wolf"
+    ) == ["1"]
+    assert ids(solr, "{!prefix f=PersonIndex______suggest_ss}ma") == ["4"]
+    assert ids(solr, "{!prefix f=PersonIndex______suggest_ss}[") == []
+
+
+def test_nested_terms_queries(solr):
+    assert ids(solr, '_query_:"{!terms f=id}1,4,5"') == ["1", "4"]
+    assert ids(
+        solr, 'PersonIndex______label:Mozart AND _query_:"{!terms f=id}1,2"'
+    ) == ["1"]
+    with pytest.raises(pysolr.SolrError):
+        solr.search('_query_:"{!graph from=id to=related_ss}id:1"')
+
+
+def test_paging(solr):
+    results = solr.search("*:*", sort="id asc", start=1, rows=2)
+    assert results.hits == 4
+    assert [doc["id"] for doc in results.docs] == ["2", "3"]
+
+
+def test_cursor_mark_paging(solr):
+    pages = []
+    cursor_mark = "*"
+    while True:
+        results = solr.search("*:*", sort="id asc", rows=3, cursorMark=cursor_mark)
+        if results.nextCursorMark == cursor_mark:
+            break
+        pages.append([doc["id"] for doc in results.docs])
+        cursor_mark = results.nextCursorMark
+    assert pages == [["1", "2", "3"], ["4"]]
+
+
+def test_documents_are_returned_with_children(solr):
+    (doc,) = solr.search("PersonIndex______label:Haydn").docs
+    # (Multivalued, as schemaless Solr makes text fields)
+    assert doc["PersonIndex______label"] == ["Haydn, Joseph"]
+    assert [
+        child["PersonIndex______ST______places__label"] for child in doc["_doc"]
+    ] == [
+        ["Rohrau"],
+        ["Wien"],
+    ]
+
+
+def test_readding_a_block_replaces_it(solr):
+    solr.add(
+        [
+            person(
+                "1",
+                "Salieri, Antonio",
+                "1750-08-18T00:00:00Z",
+                ["salieri", "antonio"],
+                [("Legnago", "birth")],
+            )
+        ]
+    )
+    assert ids(solr, "PersonIndex______label:Mozart") == []
+    assert ids(solr, "PersonIndex______label:Salieri") == ["1"]
+    place = "PersonIndex______ST______places__label"
+    assert ids(solr, "*:*", fq=CHILD_FILTER % f"{place}:Salzburg") == []
+    assert ids(solr, "*:*", fq=CHILD_FILTER % f"{place}:Legnago") == ["1"]
+    assert solr.search("*:*").hits == 4
+    check_full_text_index(solr)
+
+
+def test_delete(solr):
+    solr.delete(id="2")
+    assert ids(solr, "*:*") == ["1", "3", "4"]
+    solr.delete(q="*:*")
+    assert ids(solr, "*:*") == []
+    check_full_text_index(solr)
+
+
+def test_queries_that_need_solr_are_refused(solr):
+    with pytest.raises(pysolr.SolrError):
+        solr.search("{!graph from=id to=related_ss}id:1")
+    with pytest.raises(pysolr.SolrError):
+        solr.search("*:*", **{"facet": "true", "facet.field": "pysolaar_type"})
+    with pytest.raises(pysolr.SolrError):
+        solr.search("*:*", sort="PersonIndex______born_dt asc")
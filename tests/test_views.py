@@ -0,0 +1,189 @@
+import json
+
+import pytest
+
+from tests.conftest import SALZBURG_URI, UNIVERSITY_URI
+
+
+def get(client, path, **params):
+    response = client.get(f"/ipif/{path}", params)
+    return response.status_code, json.loads(response.content)
+
+
+def ids(results):
+    return sorted(result["@id"] for result in results)
+
+
+def person_ids(persons, *keys):
+    return sorted(str(persons[key].pk) for key in keys)
+
+
+@pytest.mark.parametrize(
+    "ipif_type, total",
+    [("persons", 4), ("factoids", 4), ("statements", 28), ("sources", 1)],
+)
+def test_list_views(client, ipif_index, ipif_type, total):
+    status, result = get(client, f"{ipif_type}/")
+    assert status == 200
+    assert result["protocol"]["totalHits"] == total
+    assert len(result[ipif_type]) == min(total, 30)
+
+
+def test_persons_list(client, ipif_index):
+    status, result = get(client, "persons/")
+    persons = {person["@id"]: person for person in result["persons"]}
+    mozart = persons[str(ipif_index["mozart"].pk)]
+    assert mozart["label"].startswith("Mozart, Wolfgang Amadeus")
+    assert mozart["uris"] == ["https://d-nb.info/gnd/118584596"]
+    assert mozart["createdBy"] == "editor"
+    (factoid,) = mozart["factoid-refs"]
+    assert f"{ipif_index['mozart'].pk}_attrb_name" in ids(factoid["statement-refs"])
+
+
+def test_pages(client, ipif_index):
+    status, first = get(client, "persons/", size=3)
+    status, second = get(client, "persons/", size=3, page=2)
+    assert status == 200
+    assert second["protocol"]["page"] == 2
+    assert len(first["persons"]) == 3
+    assert ids(first["persons"] + second["persons"]) == person_ids(
+        ipif_index, "mozart", "haydn", "beethoven", "paradis"
+    )
+
+
+@pytest.mark.parametrize(
+    "params, keys",
+    [
+        ({"place": "Salzburg"}, ["mozart"]),
+        ({"place": SALZBURG_URI}, ["mozart"]),
+        ({"memberOf": "Universität Wien"}, ["haydn"]),
+        ({"memberOf": UNIVERSITY_URI}, ["haydn"]),
+        ({"role": "born in"}, ["mozart", "paradis"]),
+        ({"from": "1800", "to": "1810"}, ["haydn"]),
+        ({"relatesToPersons": "https://d-nb.info/gnd/118508288"}, ["haydn"]),
+        (
+            {"place": "Wien", "role": "born in", "combineStatementFilters": "and"},
+            ["paradis"],
+        ),
+        ({"place": "Salzburg", "role": "died in"}, ["mozart"]),
+        (
+            {"place": "Salzburg", "role": "died in", "combineStatementFilters": "and"},
+            [],
+        ),
+    ],
+)
+def test_persons_filtered_by_statements(client, ipif_index, params, keys):
+    status, result = get(client, "persons/", **params)
+    assert status == 200
+    assert ids(result["persons"]) == person_ids(ipif_index, *keys)
+
+
+def test_persons_related_at_depth(client, ipif_index, monkeypatch):
+    # (The graph query needs Solr, so its result is stood in for)
+    related = person_ids(ipif_index, "haydn", "beethoven")
+    monkeypatch.setattr(
+        "apis_ipif_solr.api_views.related_person_ids", lambda person, depth: related
+    )
+    pk = ipif_index["mozart"].pk
+    status, result = get(
+        client, "persons/", relatesToPersons=pk, relatesToPersonsDepth="2"
+    )
+    assert status == 200
+    assert ids(result["persons"]) == related
+    monkeypatch.setattr(
+        "apis_ipif_solr.api_views.related_person_ids", lambda person, depth: []
+    )
+    status, result = get(
+        client, "persons/", relatesToPersons=pk, relatesToPersonsDepth="2"
+    )
+    assert result["persons"] == []
+
+
+def test_statements_filtered_by_place(client, ipif_index):
+    status, result = get(client, "statements/", place=SALZBURG_URI)
+    (statement,) = result["statements"]
+    assert statement["role"] == {"label": "born in"}
+    assert statement["places"][0]["label"] == "Salzburg"
+    assert statement["statementText"] == "Mozart born in Salzburg"
+
+
+def test_person_detail(client, ipif_index):
+    pk = ipif_index["mozart"].pk
+    status, person = get(client, f"persons/{pk}")
+    assert status == 200
+    assert person["@id"] == str(pk)
+    status, person = get(client, "persons/https://d-nb.info/gnd/118584596")
+    assert status == 200
+    assert person["@id"] == str(pk)
+
+
+def test_statement_detail(client, ipif_index):
+    status, statement = get(client, f"statements/{ipif_index['haydn'].pk}_attrb_name")
+    assert status == 200
+    assert statement["name"] == ["Haydn"]
+    assert statement["statementType"] == {"label": "hasName"}
+
+
+def test_factoid_and_source_detail(client, ipif_index):
+    status, result = get(client, "factoids/", size=1)
+    (factoid,) = result["factoids"]
+    status, detail = get(client, f"factoids/{factoid['@id']}")
+    assert status == 200
+    assert detail["@id"] == factoid["@id"]
+    source_id = factoid["source-ref"][0]["@id"]
+    status, source = get(client, f"sources/{source_id}")
+    assert status == 200
+    assert source["@id"] == source_id
+
+
+@pytest.mark.parametrize(
+    "path, description",
+    [
+        ("persons/0", "the person does not exist"),
+        ("statements/0_attrb_name", "the statement does not exist"),
+        ("factoids/factoid__0__none", "the factoid does not exist"),
+        ("sources/original_source_0", "the source does not exist"),
+    ],
+)
+def test_missing_documents(client, ipif_index, path, description):
+    status, result = get(client, path)
+    assert status == 404
+    assert result == {"description": description}
+
+
+def test_invalid_params(client, ipif_index):
+    status, result = get(client, "persons/", page="two")
+    assert status == 400
+    status, result = get(client, "statements/", **{"from": "not a date"})
+    assert status == 400
+    status, result = get(client, "persons/facets", dateGap="ten years")
+    assert status == 400
+    assert result["description"].startswith("dateGap should be")
+    status, result = get(client, "persons/", relatesToPersonsDepth="2")
+    assert status == 400
+    assert result["description"] == "relatesToPersonsDepth needs relatesToPersons"
+
+
+def test_batch(client, ipif_index):
+    pk = ipif_index["mozart"].pk
+    queries = [
+        {"endpoint": "persons/", "params": {"place": "Salzburg"}},
+        {"endpoint": f"/ipif/persons/{pk}"},
+        {"endpoint": "persons/0"},
+    ]
+    response = client.post("/ipif/batch/", queries, content_type="application/json")
+    listed, detail, missing = json.loads(response.content)["results"]
+    assert ids(listed["result"]["persons"]) == [str(pk)]
+    assert detail["result"]["@id"] == str(pk)
+    assert missing["status"] == 404
+
+
+@pytest.mark.parametrize(
+    "endpoint", ["persons/export", "persons/facets/", "suggest/", "places/"]
+)
+def test_batch_refuses_other_endpoints(client, ipif_index, endpoint):
+    response = client.post(
+        "/ipif/batch/", [{"endpoint": endpoint}], content_type="application/json"
+    )
+    assert response.status_code == 400
+    assert endpoint in json.loads(response.content)["description"]
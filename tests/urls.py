@@ -0,0 +1,18 @@
+from django.http import HttpResponse
+from django.urls import include, path
+
+
+def source_detail(request, pk):
+    return HttpResponse()
+
+
+# (Source documents link to APIS's own API, which is all the IPIF needs of it)
+apis_api_urls = (
+    [path("source/<int:pk>/", source_detail, name="source-detail")],
+    "apis_api",
+)
+
+urlpatterns = [
+    path("apis/", include(([path("api/", include(apis_api_urls))], "apis"))),
+    path("ipif/", include("apis_ipif_solr.urls")),
+]